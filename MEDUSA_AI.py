@@ -1,22 +1,22 @@
 import streamlit as st
 from streamlit_option_menu import option_menu
-import google.generativeai as genai
-from PIL import Image as PILImage
-import io
 import os
+import uuid
 from dotenv import load_dotenv
-import requests
-from bs4 import BeautifulSoup
-import feedparser
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-from reportlab.lib.pagesizes import letter
-from reportlab.lib import colors
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Image, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfbase import pdfmetrics
+from medusa.analysis import find_near_duplicate, merge_page_analyses, run_analysis, run_document_analysis, stream_analysis
+from medusa.backends import BackendConfigError, create_backend
+from medusa.cache import cache_from_env
+from medusa.dicom import WINDOW_PRESETS, DicomImage
+from medusa.documents import DOCUMENT_TYPES, Document
+from medusa.gateway import gateway_from_env
+from medusa.hedging import hedging_from_env
+from medusa.jobs import DONE, FAILED, JobQueueFull, job_queue_from_env
+from medusa.large_image import MAX_ROI_DIMENSION, LargeImage, outline_region, region_box
+from medusa.metrics import current_session, metrics, set_session, start_metrics_server
+from medusa.prompts import COMBINED_TASKS, DEFAULT_PROMPTS, build_combined_prompt
+from medusa.sections import SectionParser, parse_sections, risk_percentage, watch_sections
+from medusa.session import SessionJobs, SessionResults, upload_id
+from medusa.similar import NEAR_DUPLICATE_MODES
 
 # Load environment variables
 load_dotenv()
@@ -99,8 +99,8 @@ st.sidebar.markdown(
 # Navigation menu
 selected = option_menu(
     menu_title="Medical Diagnostic Unified System Assistant", 
-    options=["Medical Imaging Diagnostics", "Medical Transcription", "Medical Pathology Diagnostics", "Medical Coding", "Insurance Risk Analysis", "Treatment and Diet Plan Generator"],
-    icons=["activity", "file-text", "file-medical", "file-code", "shield", "stethoscope"], 
+    options=["Medical Imaging Diagnostics", "Medical Transcription", "Medical Pathology Diagnostics", "Medical Coding", "Insurance Risk Analysis", "Treatment and Diet Plan Generator", "Analyze Everything"],
+    icons=["activity", "file-text", "file-medical", "file-code", "shield", "stethoscope", "grid"], 
     orientation="horizontal",
     styles={
         "container": {"padding": "0!important", "background-color": "#d8c3a5"},
@@ -109,169 +109,139 @@ selected = option_menu(
         "nav-link-selected": {"background-color": "#116466"},}
 )
 
-# Function to load the Gemini Pro Vision model
+STREAM_OUTPUT = os.getenv("MEDUSA_STREAM_OUTPUT", "1") != "0"
+NEWS_FEED_URL = "https://health.economictimes.indiatimes.com/rss/topstories"
+NEWS_REFRESH_INTERVAL = float(os.getenv("MEDUSA_NEWS_REFRESH_INTERVAL", "900"))
+JOB_POLL_INTERVAL = float(os.getenv("MEDUSA_JOB_POLL_INTERVAL", "1"))
+METRICS_PORT = os.getenv("MEDUSA_METRICS_PORT")
+METRICS_HOST = os.getenv("MEDUSA_METRICS_HOST", "127.0.0.1")
+
+# Function to load the model backend (Gemini by default, or the local fake selected by MEDUSA_BACKEND)
+# behind the gateway that every session shares
 @st.cache_resource
 def load_model():
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
-        st.error("Google API Key not found in .env file.")
+    try:
+        backend = hedging_from_env(create_backend())
+        gateway = gateway_from_env(backend)
+    except BackendConfigError as e:
+        st.error(str(e))
         st.stop()
-    genai.configure(api_key=api_key)
-    return genai.GenerativeModel('gemini-1.5-flash')
+    metrics.register_gauges("gateway", gateway.stats)
+    metrics.register_gauges("hedging", backend.stats)
+    return gateway
 
-# Function to analyze image
-def analyze_image(image, prompt):
-    model = load_model()
-    response = model.generate_content([prompt, image])
-    return response.text
-
-# Function to search for research papers
-def search_research_papers(query):
-    search_url = f"https://scholar.google.com/scholar?q={query}"
-    response = requests.get(search_url)
-    soup = BeautifulSoup(response.content, 'html.parser')
-    papers = [{'title': item.select_one('.gs_rt').text, 'link': item.select_one('.gs_rt a')['href']} for item in soup.select('[data-lid]')]
-    return papers
-
-# Function to fetch and parse RSS feed
-def fetch_rss_feed(feed_url):
-    feed = feedparser.parse(feed_url)
-    if feed.bozo:
-        st.error("Failed to fetch RSS feed.")
-        return []
-    articles = [{'title': entry.title, 'link': entry.link, 'published': entry.get('published', 'No publication date')} for entry in feed.entries]
-    return articles
-
-# Function to create a pathology report with matplotlib
-def create_pathology_report(patient_info, service_info, specimens, theranostic_report):
-    fig, ax = plt.subplots(figsize=(10, 12))
-
-    # Function to add a rectangle with text inside
-    def add_textbox(ax, x, y, width, height, header, text, wrap_text=True, fontsize=9, fontweight='normal', ha='left', va='top', line_height=0.02, color='white'):
-        rect = patches.Rectangle((x, y), width, height, linewidth=1.5, edgecolor='black', facecolor=color)
-        ax.add_patch(rect)
-        plt.text(x + 0.01, y + height - 0.01, header, ha=ha, va=va, fontsize=fontsize, fontweight='bold', family='DejaVu Sans')
-        
-        if wrap_text:
-            words = text.split()
-            lines = []
-            current_line = ""
-
-            for word in words:
-                if len(current_line + word) * 0.01 > width:
-                    lines.append(current_line)
-                    current_line = word + " "
-                else:
-                    current_line += word + " "
+# Function to load the analysis result cache shared by all sessions
+@st.cache_resource
+def load_result_cache():
+    cache = cache_from_env()
+    metrics.register_gauges("cache", cache.stats)
+    return cache
 
-            if current_line:
-                lines.append(current_line)
+# Function to load the local ICD-10 index once for all sessions
+@st.cache_resource
+def load_icd10_index():
+    from medusa.icd10 import load_index
+    return load_index()
 
-            for i, line in enumerate(lines):
-                if i * line_height < height - line_height:
-                    plt.text(x + 0.01, y + height - 0.03 - i * line_height, line, ha=ha, va=va, fontsize=fontsize, fontweight=fontweight, family='DejaVu Sans', clip_on=True)
-        else:
-            plt.text(x + 0.01, y + height - 0.03, text, ha=ha, va=va, fontsize=fontsize, fontweight=fontweight, family='DejaVu Sans', clip_on=True)
-
-    # Add the main header
-    plt.text(0.5, 0.96, 'LABORATORY MEDICINE PROGRAM', ha='center', va='center', fontsize=15, family='DejaVu Sans', fontweight='bold')
-
-    # Add the subheader
-    plt.text(0.5, 0.93, 'Surgical Pathology Consultation Report', ha='center', va='center', fontsize=13, family='DejaVu Sans', fontweight='bold')
-
-    # Define the increased height for each section
-    section_height = 0.8 / 4  # Increased height
-
-    # Add Patient Information box without wrapping text
-    add_textbox(ax, 0.05, 0.88 - section_height, 0.9, section_height, 'Patient Information', patient_info, wrap_text=False, fontsize=10, line_height=0.025, color='#E6F2FF')
-
-    # Add Service Information box with wrapping text
-    add_textbox(ax, 0.05, 0.88 - 2*section_height, 0.9, section_height, 'Observation', service_info, wrap_text=True, fontsize=10, line_height=0.025, color='#F5F5F5')
-
-    # Add Specimen(s) Received box with wrapping text
-    add_textbox(ax, 0.05, 0.88 - 3*section_height, 0.9, section_height, 'Inferences', specimens, wrap_text=True, fontsize=10, line_height=0.025, color='#E6F2FF')
-
-    # Add Consolidated Theranostic Report section with wrapping text
-    add_textbox(ax, 0.05, 0.88 - 4*section_height, 0.9, section_height, 'Conclusion', theranostic_report, wrap_text=True, fontsize=10, line_height=0.025, color='#F5F5F5')
-
-    # Add footer information
-    plt.text(0.95, 0.01, 'Page 1 of 5', ha='right', va='center', fontsize=10, family='DejaVu Sans')
-
-    # Set the axis limits and hide the axes
-    ax.set_xlim(0, 1)
-    ax.set_ylim(0, 1)
-    ax.axis('off')
-
-    # Save the plot to a buffer
-    buf = io.BytesIO()
-    plt.savefig(buf, format='png')
-    buf.seek(0)
-    plt.close(fig)
-    return buf
-
-# Function to create a PDF report
-def create_pdf_report(patient_info, service_info, specimens, theranostic_report, diagnosis, detailed_diagnosis, image_buffer, report_format):
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    elements = []
-
-    # Set styles and register a custom font
-    pdfmetrics.registerFont(TTFont('Arial', 'arial.ttf'))
-    styles = getSampleStyleSheet()
-    styleN = ParagraphStyle('Normal', fontName='Arial', fontSize=10, leading=12)
-    styleH = ParagraphStyle('Heading1', fontName='Arial', fontSize=20, leading=20, alignment=1, spaceAfter=12, underline=True)
-    styleH2 = ParagraphStyle('Heading2', fontName='Arial', fontSize=14, leading=14, spaceAfter=8)
-
-    # Different report formats with different background colors
-    def add_background_and_border(canvas, doc, background_color):
-        canvas.saveState()
-        margin = 36
-        canvas.setFillColor(background_color)
-        canvas.rect(margin, margin, doc.pagesize[0] - 2 * margin, doc.pagesize[1] - 2 * margin, fill=1)
-        canvas.setStrokeColor(colors.black)
-        canvas.setLineWidth(2)
-        canvas.rect(margin, margin, doc.pagesize[0] - 2 * margin, doc.pagesize[1] - 2 * margin)
-        canvas.restoreState()
-
-    format_details = {
-        "Format 1": {"color": colors.lightblue, "header": "SWAYAM IMAGING CENTER"},
-        "Format 2": {"color": colors.lightgreen, "header": "SWAYAM IMAGING CENTER"},
-        "Format 3": {"color": colors.lightyellow, "header": "Medical Imaging Report"},
-        "Format 4": {"color": colors.lightpink, "header": "IMAGING DIAGNOSTIC CENTER"},
-        "Format 5": {"color": colors.lightgrey, "header": "RADIOLOGY REPORT"}
-    }
+# Function to load the medical news feed cache, refreshed in the background for all sessions
+@st.cache_resource
+def load_news_feed():
+    # feedparser and requests are only needed once someone opens the news feed
+    from medusa.news import FeedCache
+    return FeedCache(NEWS_FEED_URL, refresh_interval=NEWS_REFRESH_INTERVAL).start()
 
-    format_detail = format_details[report_format]
-    elements.append(Paragraph(format_detail["header"], styleH))
-    elements.append(Spacer(1, 12))
-    elements.extend([
-        Paragraph(f"Patient Information: {patient_info}", styleN),
-        Paragraph(f"Observation: {service_info}", styleN),
-        Paragraph(f"Inferences: {specimens}", styleN),
-        Spacer(1, 12),
-        Paragraph("DIAGNOSIS", styleH2),
-        Paragraph(detailed_diagnosis, styleN),
-        Spacer(1, 12),
-        Paragraph("Conclusion:", styleH2),
-        Paragraph(theranostic_report, styleN),
-        Spacer(1, 12),
-        Paragraph("X-Ray Image:", styleH2),
-        Image(image_buffer, width=5 * inch, height=3.5 * inch),
-        Spacer(1, 12),
-        Paragraph("IMPRESSION", styleH2),
-        Paragraph(diagnosis, styleN),
-        Spacer(1, 12),
-        Paragraph("ADVICE", styleH2),
-        Paragraph("Clinical correlation.", styleN),
-        Spacer(1, 12),
-        Paragraph("Radiologic Technologists: MSC, PGDM", styleN),
-        Paragraph("Dr. Payal Shah (MD, Radiologist)", styleN),
-        Paragraph("Dr. Vimal Shah (MD, Radiologist)", styleN)
-    ])
-
-    doc.build(elements, onFirstPage=lambda canvas, doc: add_background_and_border(canvas, doc, format_detail["color"]), onLaterPages=lambda canvas, doc: add_background_and_border(canvas, doc, format_detail["color"]))
-    buffer.seek(0)
-    return buffer
+# Function to load the background job queue shared by all sessions
+@st.cache_resource
+def load_job_queue():
+    queue = job_queue_from_env()
+    metrics.register_gauges("jobs", queue.stats)
+    return queue
+
+# Function to start the Prometheus metrics endpoint once per process, if MEDUSA_METRICS_PORT is set
+@st.cache_resource
+def load_metrics_server():
+    if not METRICS_PORT:
+        return None
+    return start_metrics_server(int(METRICS_PORT), METRICS_HOST)
+
+# Function to get this session's store of decoded uploads, analyses and reports
+def load_session_results():
+    return SessionResults(st.session_state)
+
+# Function to get this session's background jobs
+def load_session_jobs():
+    return SessionJobs(st.session_state, load_job_queue())
+
+# Function to analyze image
+def analyze_image(image, prompt, bypass_cache=False):
+    return run_analysis(load_model(), load_result_cache(), image, prompt, bypass_cache)
+
+# Function to analyze every page of a multi-page document with a progress bar, then render the merged output
+def render_document_analysis(document, prompt, bypass_cache=False):
+    progress = st.progress(0.0, text=f"Analyzing {document.page_count} pages...")
+
+    def on_page(done, total, analyses):
+        progress.progress(done / total, text=f"Analyzed {done} of {total} pages...")
+
+    analyses = run_document_analysis(load_model(), load_result_cache(), document, prompt, bypass_cache, on_page=on_page)
+    progress.empty()
+    analysis = merge_page_analyses(analyses)
+    st.markdown(analysis)
+    return analysis
+
+# Function to analyze image and render the output into the current container as it arrives.
+# `on_section(key, text)` is called as each section of the mode's output format is complete.
+def render_analysis(image, prompt, bypass_cache=False, on_section=None):
+    if isinstance(image, Document):
+        if image.page_count > 1:
+            analysis = render_document_analysis(image, prompt, bypass_cache)
+            report_sections(analysis, image.mode, on_section)
+            return analysis
+        image = image.page(0)
+    if not STREAM_OUTPUT:
+        analysis = analyze_image(image, prompt, bypass_cache)
+        report_sections(analysis, image.mode, on_section)
+        st.markdown(analysis)
+        return analysis
+    chunks = stream_analysis(load_model(), load_result_cache(), image, prompt, bypass_cache)
+    if on_section is not None:
+        chunks = watch_sections(chunks, image.mode, on_section)
+    return st.write_stream(chunks)
+
+# Function to pass the sections of a complete analysis to `on_section`
+def report_sections(analysis, mode, on_section):
+    if on_section is not None:
+        for key, text in parse_sections(analysis, mode).items():
+            on_section(key, text)
+
+# Function to show the risk percentage of an insurance analysis as a metric once its section is complete
+def show_risk(placeholder, key, text):
+    value = risk_percentage(text) if key == "risk_percentage" else None
+    if value is not None:
+        placeholder.metric("Insurance Risk", f"{value:g}%")
+
+# Function to offer the stored result of a closely matching image this session analyzed earlier (re-saved,
+# re-compressed or rescaled) instead of a new model call. Only offered in NEAR_DUPLICATE_MODES, never across sessions.
+def offer_near_duplicate(session, uploaded_file, mode, image, prompt, session_prompt=None):
+    if mode not in NEAR_DUPLICATE_MODES:
+        return
+    if isinstance(image, Document):
+        if image.page_count > 1:
+            return
+        image = image.page(0)
+    match = find_near_duplicate(load_result_cache(), image, prompt, load_model().name)
+    if match is None:
+        return
+    analysis, similarity = match
+    st.info(
+        f"This image closely matches one you analyzed earlier in this session with this prompt "
+        f"({similarity:.0%} of signature bits agree). Matching is visual only: check that it is the same study "
+        f"before reusing the earlier result."
+    )
+    if st.button("Use Earlier Result", key=f"reuse_{mode}_{upload_id(uploaded_file)}"):
+        metrics.add("near_duplicate_reuses", 1, mode=mode)
+        session.store_result(uploaded_file, mode, session_prompt or prompt, analysis=analysis)
+        st.rerun()
 
 # Function to display common instructions
 def display_instructions(page):
@@ -285,29 +255,34 @@ def display_instructions(page):
             5. View related research papers based on the analysis.
         """,
         "Medical Transcription": """
-            1. Upload a medical prescription image using the file uploader.
+            1. Upload a medical prescription image (or a multi-page PDF/TIFF) using the file uploader.
             2. Enter your prompt or use the default one provided.
             3. Click 'Get Transcription' to see the analysis in tabular format.
         """,
         "Medical Pathology Diagnostics": """
-            1. Upload a medical report image using the file uploader.
+            1. Upload a medical report image (or a multi-page PDF/TIFF) using the file uploader.
             2. Enter your prompt or use the default one provided.
             3. Click 'Analyze Report' to get the analysis and generate the pathology report.
         """,
         "Medical Coding": """
-            1. Upload a medical document image using the file uploader.
+            1. Upload a medical document image (or a multi-page PDF/TIFF) using the file uploader.
             2. Enter your prompt or use the default one provided.
             3. Click 'Get ICD Codes' to see the suggested ICD medical codes with descriptions.
         """,
         "Insurance Risk Analysis": """
-            1. Upload an image containing user data using the file uploader.
+            1. Upload an image containing user data (or a multi-page PDF/TIFF) using the file uploader.
             2. Enter your prompt or use the default one provided.
             3. Click 'Analyze Risk' to get the percentage risk and detailed justification.
         """,
         "Treatment and Diet Plan Generator": """
-            1. Upload an image containing patient data using the file uploader.
+            1. Upload an image containing patient data (or a multi-page PDF/TIFF) using the file uploader.
             2. Enter your prompt or use the default one provided.
             3. Click 'Generate Plan' to get the treatment and diet plans.
+        """,
+        "Analyze Everything": """
+            1. Upload a patient document image (or a multi-page PDF/TIFF) using the file uploader.
+            2. Choose which results you need.
+            3. Click 'Analyze Everything' to get the transcription, ICD codes, insurance risk and treatment plan from a single model call.
         """
     }
     st.sidebar.markdown(instructions.get(page, ""))
@@ -317,23 +292,289 @@ def display_medical_news():
     st.sidebar.header("📰 Latest Medical News")
     show_news_button = st.sidebar.button("Show Medical News")
     if show_news_button:
-        feed_url = "https://health.economictimes.indiatimes.com/rss/topstories"
-        articles = fetch_rss_feed(feed_url)
+        feed = load_news_feed()
+        articles, meta = feed.snapshot()
+        if articles is None and meta["last_error"] is None:
+            # Only the very first request after startup waits for the initial download
+            feed.wait_until_loaded(timeout=10)
+            articles, meta = feed.snapshot()
+        if articles is None and meta["last_error"]:
+            st.sidebar.error("Failed to fetch RSS feed.")
         if articles:
+            st.sidebar.caption(f"Updated {meta['age'] / 60:.0f} min ago")
             for article in articles:
                 st.sidebar.markdown(f"<div style='font-size: 0.9rem;'><b>Title:</b> <a href='{article['link']}'>{article['title']}</a><br><b>Published:</b> {article['published']}</div>", unsafe_allow_html=True)
         else:
             st.sidebar.info("No articles available at the moment.")
 
+# Function to display analysis cache statistics for operators
+def display_cache_stats():
+    with st.sidebar.expander("Analysis Cache"):
+        cache = load_result_cache()
+        stats = cache.stats()
+        st.markdown(
+            f"**Hits:** {stats['memory_hits']} memory / {stats['disk_hits']} disk  \n"
+            f"**Misses:** {stats['misses']}  \n"
+            f"**Bypasses:** {stats['bypasses']}  \n"
+            f"**Hit rate:** {stats['hit_rate']:.0%}  \n"
+            f"**Entries:** {stats['memory_entries']} memory / {stats['disk_entries']} disk"
+        )
+        if st.button("Clear Cache"):
+            cache.clear()
+            st.success("Analysis cache cleared.")
+
+# Function to display model gateway queue, retry and hedging statistics for operators
+def display_gateway_stats():
+    with st.sidebar.expander("Model Gateway"):
+        gateway = load_model()
+        stats = gateway.stats()
+        hedging = gateway.backend.stats()
+        st.markdown(
+            f"**Requests:** {stats['requests']} ({stats['coalesced']} coalesced)  \n"
+            f"**Upstream calls:** {stats['upstream_calls']} ({stats['extra_calls']} hedges, fallbacks and upgrades, {stats['retries']} retries, {stats['failures']} failed)  \n"
+            f"**In flight:** {stats['in_flight']}  \n"
+            f"**Queue depth:** {stats['queue_depth']} (max {stats['max_queue_depth']})  \n"
+            f"**Queue wait:** {stats['average_wait']:.2f}s avg / {stats['max_wait']:.2f}s max  \n"
+            f"**Hedged:** {hedging['hedges']} ({hedging['hedge_wins']} won, {hedging['hedges_denied']} over budget)  \n"
+            f"**Fallbacks:** {hedging['fallbacks']} ({hedging['deadline_exceeded']} past deadline)  \n"
+            f"**Upgrades:** {hedging['upgrades']} ({hedging['upgrades_skipped']} over budget, {hedging['upgrade_failures']} failed)"
+        )
+
+# Function to display background job statistics for operators
+def display_job_stats():
+    with st.sidebar.expander("Background Jobs"):
+        stats = load_job_queue().stats()
+        st.markdown(
+            f"**Running:** {stats['running']} of {stats['workers']} workers  \n"
+            f"**Queued:** {stats['queued']} (limit {stats['max_pending']} unfinished)  \n"
+            f"**Completed:** {stats['completed']} ({stats['failed']} failed, {stats['cancelled']} cancelled)  \n"
+            f"**Rejected:** {stats['rejected']}"
+        )
+
+# Function to display per-stage latency percentiles and per-mode model usage for operators
+def display_stage_metrics():
+    with st.sidebar.expander("Stage Latency"):
+        this_session = st.checkbox("Only this session", key="stage_metrics_session")
+        rows = metrics.summary(current_session() if this_session else None)
+        if not rows:
+            st.caption("No stages recorded yet.")
+            return
+        st.dataframe(
+            [{
+                "stage": row["stage"], "mode": row["mode"], "count": row["count"], "errors": row["errors"],
+                "p50 (s)": round(row["p50"], 3), "p95 (s)": round(row["p95"], 3), "p99 (s)": round(row["p99"], 3),
+            } for row in rows],
+            hide_index=True,
+        )
+        usage = metrics.usage(current_session() if this_session else None)
+        if usage:
+            st.caption("Model usage by mode")
+            st.dataframe(
+                [{
+                    "mode": row["mode"], "requests": row["requests"], "tokens in": row["input_tokens"],
+                    "tokens out": row["output_tokens"], "out/request": round(row["output_tokens"] / max(1, row["requests"])),
+                } for row in usage],
+                hide_index=True,
+            )
+        if METRICS_PORT:
+            st.caption(f"Prometheus metrics: http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+
+# Function to show a background job's progress; polls until the job finishes, then reruns the page to show the result
+@st.fragment(run_every=JOB_POLL_INTERVAL)
+def display_job_progress(job_id):
+    jobs = load_session_jobs()
+    job = jobs.queue.get(job_id)
+    if job is None or job.done:
+        st.rerun()
+    st.progress(job.progress, text=f"{job.message} ({job.elapsed():.0f}s)")
+    if job.sections:
+        # Completed sections are shown as report boxes, with the raw output underneath
+        for title, text in job.sections:
+            with st.container(border=True):
+                st.markdown(f"**{title}**")
+                st.text(text)
+        if job.partial:
+            with st.expander("Model Output"):
+                st.markdown(job.partial)
+    elif job.partial:
+        st.markdown(job.partial)
+    if st.button("Cancel", key=f"cancel_{job_id}"):
+        jobs.cancel(job_id)
+
+# Function to move a finished job's result into the session store; returns the job while it is still running
+def collect_job(session, jobs, mode, uploaded_file):
+    found = jobs.find(mode, uploaded_file)
+    if found is None:
+        return None
+    job_id, record, job = found
+    if not job.done:
+        return job
+    jobs.forget(job_id)
+    if job.status == DONE:
+        session.store_result(uploaded_file, mode, record["prompt"], **job.result)
+    elif job.status == FAILED:
+        st.error(f"An error occurred: {str(job.error)}")
+    else:
+        st.warning("The analysis was cancelled.")
+    return None
+
+# Function to list this session's jobs for uploads that are no longer on the page, e.g. after switching pages
+def display_other_jobs(jobs, mode, uploaded_files):
+    current = {upload_id(uploaded_file) for uploaded_file in uploaded_files if uploaded_file is not None}
+    others = [(job_id, record, job) for job_id, record, job in jobs.jobs(mode) if record["upload"] not in current]
+    if not others:
+        return
+    st.header("Background Jobs")
+    for job_id, record, job in others:
+        with st.expander(f"{record['label']} ({job.status})", expanded=not job.done):
+            if not job.done:
+                display_job_progress(job_id)
+                continue
+            if job.status == DONE:
+                st.markdown(job.result["analysis"])
+                if "png" in job.result.get("reports", {}):
+                    display_pathology_report(job.result["reports"]["png"], job.result["sections"], key=f"report_{job_id}")
+            elif job.status == FAILED:
+                st.error(f"An error occurred: {str(job.error)}")
+            if st.button("Dismiss", key=f"dismiss_{job_id}"):
+                jobs.forget(job_id)
+                st.rerun()
+
+# Function to analyze one study image in a background job; related research papers are looked up in a job of their own
+def imaging_job(job, backend, cache, image, prompt, bypass_cache=False):
+    job.update(progress=0.1, message="Analyzing the image...")
+    analysis = run_analysis(backend, cache, image, prompt, bypass_cache)
+    # A new analysis gets a new paper search
+    return {"analysis": analysis, "papers": None, "papers_error": None}
+
+# Function to look up research papers related to an analysis in a background job
+def research_job(job, analysis):
+    from medusa.research import search_research_papers
+
+    job.update(progress=0.1, message="Searching for related research papers...")
+    try:
+        return {"papers": search_research_papers(analysis.split('.')[0])}
+    except Exception as e:
+        return {"papers_error": str(e)}
+
+# Function to show the research papers for an analyzed study image, searching for them in a background job the
+# first time; the analysis and its report download are shown without waiting for the search
+def display_study_papers(session, jobs, uploaded_file, view_prompt):
+    found = jobs.find("research", uploaded_file)
+    if found is not None:
+        job_id, record, job = found
+        current = record["prompt"] == view_prompt
+        if current and not job.done:
+            display_job_progress(job_id)
+            return
+        if job.done:
+            jobs.forget(job_id)
+            if current and job.status == DONE:
+                session.store_result(uploaded_file, "imaging", view_prompt, **job.result)
+            elif current:
+                error = str(job.error) if job.status == FAILED else "The search was cancelled."
+                session.store_result(uploaded_file, "imaging", view_prompt, papers_error=error)
+    previous = session.result(uploaded_file, "imaging", view_prompt)
+    if previous.get("papers") is not None:
+        display_research_papers(previous["papers"])
+    elif previous.get("papers_error"):
+        st.warning(f"Could not load research papers: {previous['papers_error']}")
+    else:
+        try:
+            job_id = jobs.submit("research", uploaded_file, view_prompt, research_job, previous["analysis"])
+        except JobQueueFull as e:
+            st.warning(f"Could not search for research papers: {str(e)}")
+            return
+        display_job_progress(job_id)
+
+# Function to show a list of research papers
+def display_research_papers(papers):
+    if not papers:
+        st.info("No related research papers found.")
+    for paper in papers:
+        if paper['link']:
+            st.markdown(f"[{paper['title']}]({paper['link']})")
+        else:
+            st.markdown(paper['title'])
+
+# Function to show one analyzed study image; the PDF is only built if the user actually downloads it
+def display_study_analysis(index, image, analysis, report_format):
+    # The PDF engine is imported on first use to keep cold start fast
+    from medusa.pdf_report import build_imaging_report
+
+    st.markdown(analysis)
+    st.download_button(
+        label="Download Report",
+        data=lambda: build_imaging_report(image, analysis, report_format).getvalue(),
+        file_name=f"medical_report_{index + 1}.pdf", mime="application/pdf", key=f"download_report_{index}", on_click="ignore",
+    )
+    st.header("Related Research Papers")
+
+# Function to offer every analyzed image as one multi-page study report
+def display_study_report(placeholder, studies, report_format):
+    if len(studies) < 2:
+        return
+    from medusa.pdf_report import build_study_report
+
+    placeholder.download_button(
+        label="Download Study Report",
+        data=lambda: build_study_report(studies, report_format).getvalue(),
+        file_name="study_report.pdf", mime="application/pdf", key="download_study_report", on_click="ignore",
+    )
+
+# Function to show the view controls of a DICOM study, large image or multi-page TIFF and pick what is sent to the
+# model. Returns (preview to display, image to analyze, label of the chosen view or None for the default view).
+def imaging_view_controls(uploaded_file, source):
+    key = upload_id(uploaded_file)
+    if isinstance(source, Document):
+        # Each page of a multi-page scan is analyzed on its own
+        page = 0
+        if source.page_count > 1:
+            page = st.slider("Page", 1, source.page_count, 1, key=f"page_{key}") - 1
+        image = source.prepare(page)
+        return image.image, image, f"page {page + 1}" if page else None
+    if not isinstance(source, (DicomImage, LargeImage)):
+        return source.image, source, None
+    view = []
+    options = {}
+    if isinstance(source, DicomImage):
+        window = st.selectbox("Window preset", list(WINDOW_PRESETS), key=f"window_{key}")
+        frame = 0
+        if source.frame_count > 1:
+            frame = st.slider("Frame", 1, source.frame_count, 1, key=f"frame_{key}") - 1
+        options = {"window": window, "frame": frame}
+        if window != "Default":
+            view.append(f"{window} window")
+        if frame:
+            view.append(f"frame {frame + 1}")
+        preview = source.preview(window, frame)
+    else:
+        preview = source.image
+
+    roi = None
+    region_help = f"Regions up to {MAX_ROI_DIMENSION} px on their longer side are sent at full resolution; larger regions are reduced to that size."
+    if st.checkbox("Analyze a region at full detail", key=f"roi_{key}", help=region_help):
+        left, right = st.slider("Horizontal range (%)", 0, 100, (25, 75), key=f"roi_x_{key}")
+        top, bottom = st.slider("Vertical range (%)", 0, 100, (25, 75), key=f"roi_y_{key}")
+        if right > left and bottom > top:
+            roi = (left / 100, top / 100, right / 100, bottom / 100)
+            preview = outline_region(preview, roi)
+            view.append(f"region {left}-{right}% × {top}-{bottom}%")
+            box = region_box(source.size, roi)
+            if max(box[2] - box[0], box[3] - box[1]) > MAX_ROI_DIMENSION:
+                st.caption(f"This region is larger than {MAX_ROI_DIMENSION} px and is reduced to fit; select a smaller region for full detail.")
+
+    return preview, source.prepare(roi, **options), ", ".join(view) or None
+
 # Function to handle Medical Imaging Diagnostics section
 def medical_imaging_diagnostics():
     st.header("Medical Imaging Diagnostics")
 
     st.header("Upload Image")
-    uploaded_files = st.file_uploader("Choose medical images...", type=["jpg", "jpeg", "png"], accept_multiple_files=True)
+    uploaded_files = st.file_uploader("Choose medical images...", type=["jpg", "jpeg", "png", "dcm", "dicom", "tif", "tiff"], accept_multiple_files=True)
 
     st.header("Analysis Options")
-    default_prompt = "Analyze this medical image. Describe what you see, identify any abnormalities, and suggest potential diagnoses."
+    default_prompt = DEFAULT_PROMPTS["imaging"]
     prompt = st.text_area("Enter your prompt:", value=default_prompt, height=100)
 
     analyze_button = st.button("Analyze Image")
@@ -342,349 +583,494 @@ def medical_imaging_diagnostics():
     st.header("Report Format")
     report_format = st.selectbox("Choose Report Format:", ["Format 1", "Format 2", "Format 3", "Format 4", "Format 5"])
 
+    session = load_session_results()
+    session.retain("imaging", uploaded_files or [])
+    jobs = load_session_jobs()
+
     if uploaded_files:
+        # Lay out every image first so results keep upload order while they arrive
+        slots = []
         for uploaded_file in uploaded_files:
             col1, col2 = st.columns(2)
 
             with col1:
                 st.header("Uploaded Image")
-                image = PILImage.open(uploaded_file)
-                st.image(image, caption="Uploaded Medical Image", use_column_width=True)
+                source = session.image(uploaded_file, "imaging")
+                preview, image, view = imaging_view_controls(uploaded_file, source)
+                st.image(preview, caption="Uploaded Medical Image", width="stretch")
+                st.caption(source.describe())
+                if view:
+                    st.caption(f"Analyzing: {view}")
 
             with col2:
                 st.header("Image Analysis")
-                if analyze_button or regenerate_button:
-                    with st.spinner("Analyzing the image..."):
-                        try:
-                            analysis = analyze_image(image, prompt)
-                            st.markdown(analysis)
-
-                            # Extract the diagnosis from the analysis
-                            detailed_diagnosis = analysis
-                            diagnosis = analysis.split('.')[0]
-
-                            # Save the uploaded image to a buffer
-                            img_buffer = io.BytesIO()
-                            image.save(img_buffer, format='PNG')
-                            img_buffer.seek(0)
-
-                            # Generate PDF report
-                            pdf_buffer = create_pdf_report("Yashvi M. Patel", 21, "Female", diagnosis, detailed_diagnosis, "", img_buffer, report_format)
-                            st.download_button(label="Download Report", data=pdf_buffer, file_name="medical_report.pdf", mime="application/pdf")
-
-                            # Search for research papers
-                            st.header("Related Research Papers")
-                            papers = search_research_papers(diagnosis)
-                            for paper in papers:
-                                st.markdown(f"[{paper['title']}]({paper['link']})")
-
-                        except Exception as e:
-                            st.error(f"An error occurred: {str(e)}")
+                # Results are kept per view, so switching window, frame or region does not show a stale analysis
+                view_prompt = f"{prompt}\n[{view}]" if view else prompt
+                slots.append((uploaded_file, image, view_prompt, st.empty()))
+
+        study_slot = st.empty()
+        rejected = set()
+        if analyze_button or regenerate_button:
+            backend = load_model()
+            cache = load_result_cache()
+            for index, (uploaded_file, image, view_prompt, slot) in enumerate(slots):
+                # A paper search still running for the previous analysis would be shown with the new one
+                searching = jobs.find("research", uploaded_file)
+                if searching is not None:
+                    jobs.cancel(searching[0])
+                    jobs.forget(searching[0])
+                try:
+                    jobs.submit("imaging", uploaded_file, view_prompt, imaging_job, backend, cache, image, prompt, regenerate_button)
+                except JobQueueFull as e:
+                    slot.error(str(e))
+                    rejected.add(index)
+
+        # Jobs keep running across reruns and page switches; each slot shows progress until its result is in
+        studies = []
+        for index, (uploaded_file, image, view_prompt, slot) in enumerate(slots):
+            if index in rejected:
+                continue
+            with slot.container():
+                running = collect_job(session, jobs, "imaging", uploaded_file)
+                previous = session.result(uploaded_file, "imaging", view_prompt)
+                if running is not None:
+                    display_job_progress(running.id)
+                elif previous is not None:
+                    display_study_analysis(index, image, previous["analysis"], report_format)
+                    display_study_papers(session, jobs, uploaded_file, view_prompt)
+                    studies.append((image, previous["analysis"]))
                 else:
                     st.info("Click 'Analyze Image' to start the analysis.")
+                    offer_near_duplicate(session, uploaded_file, "imaging", image, prompt, view_prompt)
+        display_study_report(study_slot, studies, report_format)
+
+    display_other_jobs(jobs, "imaging", uploaded_files or [])
 
 # Function to handle Medical Transcription section
 def medical_transcription():
     st.header("Medical Transcription")
 
     st.header("Upload Prescription")
-    uploaded_file = st.file_uploader("Choose a medical prescription image...", type=["jpg", "jpeg", "png"])
+    uploaded_file = st.file_uploader("Choose a medical prescription image...", type=["jpg", "jpeg", "png"] + DOCUMENT_TYPES)
 
     st.header("Analysis Options")
-    default_prompt = "Analyze this medical prescription and transcribe it in tabular format."
+    default_prompt = DEFAULT_PROMPTS["transcription"]
     prompt = st.text_area("Enter your prompt:", value=default_prompt, height=100)
     
     analyze_button = st.button("Get Transcription")
 
+    session = load_session_results()
+    session.retain("transcription", [uploaded_file])
+
     col1, col2 = st.columns(2)
 
     with col1:
         st.header("Uploaded Prescription")
         if uploaded_file is not None:
-            image = PILImage.open(uploaded_file)
-            st.image(image, caption="Uploaded Prescription", use_column_width=True)
+            image = session.image(uploaded_file, "transcription")
+            st.image(image.image, caption="Uploaded Prescription", width="stretch")
+            st.caption(image.describe())
         else:
             st.info("Please upload an image using the uploader.")
 
     with col2:
         st.header("Transcription in Tabular Format")
+        previous = session.result(uploaded_file, "transcription", prompt)
         if uploaded_file is not None and analyze_button:
             with st.spinner("Analyzing the image..."):
                 try:
-                    image = PILImage.open(uploaded_file)
-                    analysis = analyze_image(image, prompt)
-                    st.markdown(analysis)
+                    analysis = render_analysis(image, prompt)
+                    session.store_result(uploaded_file, "transcription", prompt, analysis=analysis)
                 except Exception as e:
                     st.error(f"An error occurred: {str(e)}")
+        elif previous is not None:
+            # Keep showing the last analysis across reruns instead of asking for another click
+            st.markdown(previous["analysis"])
         elif uploaded_file is None:
             st.info("Upload an image and click 'Get Transcription' to see the results.")
         elif not analyze_button:
             st.info("Click 'Get Transcription' to start the analysis.")
+            offer_near_duplicate(session, uploaded_file, "transcription", image, prompt)
+
+# Function to analyze a pathology report and render it in a background job, publishing the output as it streams in
+def pathology_job(job, backend, cache, image, prompt):
+    # The report renderer pulls in matplotlib, so it is imported on first use
+    from medusa.pathology_report import create_pathology_report, extract_info_from_pages, pathology_boxes, pathology_texts
+
+    job.update(progress=0.1, message="Analyzing the report...")
+    if isinstance(image, Document) and image.page_count > 1:
+        # Pages are analyzed in parallel; their sections are merged into one report
+        def on_page(done, total, analyses):
+            job.update(progress=0.1 + 0.7 * done / total, message=f"Analyzed {done} of {total} pages...", partial=merge_page_analyses(analyses))
+
+        analyses = run_document_analysis(backend, cache, image, prompt, on_page=on_page)
+        report_texts = extract_info_from_pages(analyses)
+    else:
+        if isinstance(image, Document):
+            image = image.page(0)
+        if STREAM_OUTPUT:
+            # Sections are parsed as they stream in, so each report box fills as soon as its section is complete
+            parser = SectionParser("pathology")
+            analysis = ""
+            for chunk in stream_analysis(backend, cache, image, prompt):
+                analysis += chunk
+                closed = parser.feed(chunk)
+                job.update(partial=analysis, sections=pathology_boxes(parser.sections) if closed else None)
+            parser.close()
+            job.update(sections=pathology_boxes(parser.sections))
+            report_texts = pathology_texts(parser.sections)
+        else:
+            analysis = run_analysis(backend, cache, image, prompt)
+            report_texts = extract_info_from_pages([analysis])
+        analyses = [analysis]
+    analysis = merge_page_analyses(analyses)
+    job.update(progress=0.8, message="Rendering the pathology report...", partial=analysis)
+
+    # Generate pathology report
+    report_png = create_pathology_report(*report_texts).getvalue()
+    return {"analysis": analysis, "sections": report_texts, "reports": {"png": report_png}}
 
-# Function to extract patient info, service info, and specimens from the analysis
-def extract_info_from_analysis(analysis):
-    theranostic_report = """lorem ipsum
-    lorem ipsum
-    lorem ipsum"""
-    patient_info = "Patient Name:         N.A.\n" \
-                   "MRN:                          N.A.\n" \
-                   "DOB:                          N.A. (Age: N.A.)\n" \
-                   "Gender:                      N.A.\n" \
-                   "HCN:                          N.A.\n" \
-                   "Ordering MD:            N.A.\n" \
-                   "Copy To:                   N.A.\n" \
-                   "                                      N.A."
-
-    service_info = """lorem ipsum
-    lorem ipsum
-    lorem ipsum"""
-
-    specimens = """lorem ipsum
-    lorem ipsum
-    lorem ipsum"""
-
-    # Example parsing logic (this should be customized to the format of the analysis text)
-    if "Patient Name:" in analysis:
-        patient_info = analysis.split("Patient Name:")[1].split("Observation:")[0].strip()
-    if "Observation:" in analysis:
-        service_info = analysis.split("Observation:")[1].split("Inferences:")[0].strip()
-    if "Inferences:" in analysis:
-        specimens= analysis.split("Inferences:")[1].split("Conclusion:")[0].strip()    
-    if "Conclusion:" in analysis:
-        theranostic_report = analysis.split("Conclusion:")[1].strip()     
-
-    return patient_info, service_info, specimens, theranostic_report
+# Function to show a rendered pathology report; the vector versions are only rendered if requested
+def display_pathology_report(report_png, report_texts, key="pathology_report"):
+    from medusa.pathology_report import render_pathology_report
+
+    st.image(report_png, caption="Pathology Report", width="stretch")
+
+    # Save the analysis as image
+    st.download_button(label="Download Report Image", data=report_png, file_name="pathology_report.png", mime="image/png", key=f"{key}_png")
+    st.download_button(label="Download Report PDF", data=lambda: render_pathology_report(*report_texts, output_format="pdf"), file_name="pathology_report.pdf", mime="application/pdf", key=f"{key}_pdf", on_click="ignore")
+    st.download_button(label="Download Report SVG", data=lambda: render_pathology_report(*report_texts, output_format="svg"), file_name="pathology_report.svg", mime="image/svg+xml", key=f"{key}_svg", on_click="ignore")
 
 # Function to handle Medical Pathology Diagnostics section
 def medical_pathology_diagnostics():
     st.header("Medical Pathology Diagnostics")
 
     st.header("Upload Report")
-    uploaded_file = st.file_uploader("Choose a medical report image...", type=["jpg", "jpeg", "png"])
+    uploaded_file = st.file_uploader("Choose a medical report image...", type=["jpg", "jpeg", "png"] + DOCUMENT_TYPES)
     
     st.header("Analysis Options")
-    default_prompt = """You are a highly skilled medical professional specializing in pathology. Please analyze the uploaded medical pathology report and extract the following information accurately and concisely. Present the information in a structured format with clear labels:
-
-1. **Patient Information:**
-   - Patient Name
-   - Medical Record Number (MRN)
-   - Date of Birth (DOB) with Age
-   - Gender
-   - Health Card Number (HCN)
-   - Ordering Physician
-   - Copy To (if any)
-
-2. **Observation:**
-   - Summarize the key observations noted in the report in a short paragraph.
-
-3. **Inferences:**
-   - Summarize the main inferences derived from the observations in a short paragraph.
-
-4. **Conclusion:**
-   - Provide the final conclusion or diagnosis mentioned in the report in a short paragraph.
-
-**Format for Output:**
-
-- **Patient Information:**
-  - Patient Name: [Extracted Name]
-  - MRN: [Extracted MRN]
-  - DOB: [Extracted DOB] (Age: [Extracted Age])
-  - Gender: [Extracted Gender]
-  - HCN: [Extracted HCN]
-  - Ordering Physician: [Extracted Physician]
-  - Copy To: [Extracted Copy To (if any)]
-
-- **Observation:**
-  - [Summarized Observations]
-
-- **Inferences:**
-  - [Summarized Inferences]
-
-- **Conclusion:**
-  - [Final Conclusion or Diagnosis]
-
-Ensure that the extracted information is accurate and formatted correctly.
-
-
-"""
+    default_prompt = DEFAULT_PROMPTS["pathology"]
 
     prompt = st.text_area("Enter your prompt:", value=default_prompt, height=100)
     
     analyze_button = st.button("Analyze Report")
 
+    session = load_session_results()
+    session.retain("pathology", [uploaded_file])
+    jobs = load_session_jobs()
+
     col1, col2 = st.columns(2)
 
     with col1:
         st.header("Uploaded Report")
         if uploaded_file is not None:
-            image = PILImage.open(uploaded_file)
-            st.image(image, caption="Uploaded Medical Report", use_column_width=True)
+            image = session.image(uploaded_file, "pathology")
+            st.image(image.image, caption="Uploaded Medical Report", width="stretch")
+            st.caption(image.describe())
         else:
             st.info("Please upload an image using the uploader.")
 
     with col2:
         st.header("Report Analysis")
         if uploaded_file is not None and analyze_button:
-            with st.spinner("Analyzing the image..."):
-                try:
-                    image = PILImage.open(uploaded_file)
-                    analysis = analyze_image(image, prompt)
-
-                    # Extract relevant details for the report
-                    patient_info, service_info, specimens, theranostic_report = extract_info_from_analysis(analysis)
-                    
-                    # Generate pathology report
-                    report_buf = create_pathology_report(patient_info, service_info, specimens, theranostic_report)
-                    st.image(report_buf, caption="Pathology Report", use_column_width=True)
-
-                    # Save the analysis as image
-                    st.download_button(label="Download Report Image", data=report_buf, file_name="pathology_report.png", mime="image/png")
-                    
-                except Exception as e:
-                    st.error(f"An error occurred: {str(e)}")
+            try:
+                jobs.submit("pathology", uploaded_file, prompt, pathology_job, load_model(), load_result_cache(), image, prompt)
+            except JobQueueFull as e:
+                st.error(str(e))
+        running = collect_job(session, jobs, "pathology", uploaded_file) if uploaded_file is not None else None
+        previous = session.result(uploaded_file, "pathology", prompt)
+        if running is not None:
+            display_job_progress(running.id)
+        elif previous is not None and "png" in previous["reports"]:
+            with st.expander("Model Output"):
+                st.markdown(previous["analysis"])
+            display_pathology_report(previous["reports"]["png"], previous["sections"])
         elif uploaded_file is None:
             st.info("Upload an image and click 'Analyze Report' to see the results.")
         elif not analyze_button:
             st.info("Click 'Analyze Report' to start the analysis.")
 
+    display_other_jobs(jobs, "pathology", [uploaded_file])
+
+# Function to check the ICD codes in a coding analysis against the local index
+def display_code_check(analysis):
+    from medusa.icd10 import INVALID, NON_BILLABLE, NOT_INDEXED
+
+    index = load_icd10_index()
+    checked = index.check_text(analysis)
+    if not checked:
+        st.caption("No ICD-10 codes found to verify.")
+        return
+    st.subheader("Code Check")
+    if index.complete:
+        st.caption(f"Checked against {index.source} ({len(index):,} codes).")
+    else:
+        st.caption(
+            f"Checked against {index.source}, a partial index of {len(index):,} common codes. Codes missing from it may "
+            f"still be valid; set MEDUSA_ICD10_PATH to the full CMS ICD-10-CM release to verify every code."
+        )
+    st.dataframe(
+        [{
+            "Code": item["code"],
+            "Status": item["status"],
+            "Official description": item["description"] or "",
+            "Suggestions": ", ".join(f"{suggestion['code']} {suggestion['description']}" for suggestion in item["suggestions"]),
+        } for item in checked],
+        hide_index=True,
+    )
+    problems = [item["code"] for item in checked if item["status"] in (INVALID, NON_BILLABLE)]
+    if problems:
+        st.warning(f"Review before billing: {', '.join(problems)}")
+    unverified = [item["code"] for item in checked if item["status"] == NOT_INDEXED]
+    if unverified:
+        st.info(f"Not in the local index, verify manually: {', '.join(unverified)}")
+
+# Function to search ICD-10 codes by keyword or code prefix without calling the model
+def display_code_search():
+    query = st.text_input("Search ICD-10 codes", placeholder="e.g. type 2 diabetes, knee osteoarthritis, E11")
+    if not query:
+        return
+    results = load_icd10_index().search(query)
+    if not results:
+        st.info("No matching codes.")
+        return
+    st.dataframe(
+        [{"Code": entry["code"], "Description": entry["description"], "Billable": entry["billable"]} for entry in results],
+        hide_index=True,
+    )
+
 # Function to handle Medical Coding section
 def medical_coding():
     st.header("Medical Coding")
 
     st.header("Upload Medical Document")
-    uploaded_file = st.file_uploader("Choose a medical document image...", type=["jpg", "jpeg", "png"])
+    uploaded_file = st.file_uploader("Choose a medical document image...", type=["jpg", "jpeg", "png"] + DOCUMENT_TYPES)
     
     st.header("Analysis Options")
-    default_prompt = "Analyze the image and suggest the ICD medical codes with description. Make it simple and concise."
+    default_prompt = DEFAULT_PROMPTS["coding"]
     prompt = st.text_area("Enter your prompt:", value=default_prompt, height=100)
     
     analyze_button = st.button("Get ICD Codes")
 
+    session = load_session_results()
+    session.retain("coding", [uploaded_file])
+
     col1, col2 = st.columns(2)
 
     with col1:
         st.header("Uploaded Medical Document")
         if uploaded_file is not None:
-            image = PILImage.open(uploaded_file)
-            st.image(image, caption="Uploaded Medical Document", use_column_width=True)
+            image = session.image(uploaded_file, "coding")
+            st.image(image.image, caption="Uploaded Medical Document", width="stretch")
+            st.caption(image.describe())
         else:
             st.info("Please upload an image using the uploader.")
 
     with col2:
         st.header("ICD Codes and Descriptions")
+        previous = session.result(uploaded_file, "coding", prompt)
         if uploaded_file is not None and analyze_button:
             with st.spinner("Analyzing the image..."):
                 try:
-                    image = PILImage.open(uploaded_file)
-                    analysis = analyze_image(image, prompt)
-                    st.markdown(analysis)
+                    analysis = render_analysis(image, prompt)
+                    session.store_result(uploaded_file, "coding", prompt, analysis=analysis)
                 except Exception as e:
                     st.error(f"An error occurred: {str(e)}")
+                else:
+                    display_code_check(analysis)
+        elif previous is not None:
+            # Keep showing the last analysis across reruns instead of asking for another click
+            st.markdown(previous["analysis"])
+            display_code_check(previous["analysis"])
         elif uploaded_file is None:
             st.info("Upload an image and click 'Get ICD Codes' to see the results.")
         elif not analyze_button:
             st.info("Click 'Get ICD Codes' to start the analysis.")
+            offer_near_duplicate(session, uploaded_file, "coding", image, prompt)
+
+    st.header("ICD-10 Code Lookup")
+    display_code_search()
 
 # Function to handle Insurance Risk Analysis section
 def insurance_risk_analysis():
     st.header("Insurance Risk Analysis")
 
     st.header("Upload User Data Image")
-    uploaded_file = st.file_uploader("Choose an image containing user data...", type=["jpg", "jpeg", "png"])
+    uploaded_file = st.file_uploader("Choose an image containing user data...", type=["jpg", "jpeg", "png"] + DOCUMENT_TYPES)
     
     st.header("Analysis Options")
-    default_prompt = """You are a highly skilled insurance analyst. Please analyze the uploaded image containing user data and calculate the insurance risk percentage. Provide a detailed justification for the calculated risk percentage based on the data.
-
-**Format for Output:**
-
-- **Risk Percentage:** [Calculated Percentage]%
-- **Justification:** [Detailed Justification]
-
-Ensure that the calculated risk and justification are accurate and well-explained."""
+    default_prompt = DEFAULT_PROMPTS["insurance"]
 
     prompt = st.text_area("Enter your prompt:", value=default_prompt, height=100)
     
     analyze_button = st.button("Analyze Risk")
 
+    session = load_session_results()
+    session.retain("insurance", [uploaded_file])
+
     col1, col2 = st.columns(2)
 
     with col1:
         st.header("Uploaded User Data Image")
         if uploaded_file is not None:
-            image = PILImage.open(uploaded_file)
-            st.image(image, caption="Uploaded User Data Image", use_column_width=True)
+            image = session.image(uploaded_file, "insurance")
+            st.image(image.image, caption="Uploaded User Data Image", width="stretch")
+            st.caption(image.describe())
         else:
             st.info("Please upload an image using the uploader.")
 
     with col2:
         st.header("Risk Analysis")
+        previous = session.result(uploaded_file, "insurance", prompt)
         if uploaded_file is not None and analyze_button:
             with st.spinner("Analyzing the image..."):
+                risk = st.empty()
                 try:
-                    image = PILImage.open(uploaded_file)
-                    analysis = analyze_image(image, prompt)
-                    st.markdown(analysis)
+                    analysis = render_analysis(image, prompt, on_section=lambda key, text: show_risk(risk, key, text))
+                    session.store_result(uploaded_file, "insurance", prompt, analysis=analysis)
                 except Exception as e:
                     st.error(f"An error occurred: {str(e)}")
+        elif previous is not None:
+            # Keep showing the last analysis across reruns instead of asking for another click
+            show_risk(st.empty(), "risk_percentage", parse_sections(previous["analysis"], "insurance").get("risk_percentage"))
+            st.markdown(previous["analysis"])
         elif uploaded_file is None:
             st.info("Upload an image and click 'Analyze Risk' to see the results.")
         elif not analyze_button:
             st.info("Click 'Analyze Risk' to start the analysis.")
+            offer_near_duplicate(session, uploaded_file, "insurance", image, prompt)
 
 # Function to handle Treatment and Diet Plan Generator section
 def treatment_diet_plan_generator():
     st.header("Treatment and Diet Plan Generator")
 
     st.header("Upload Patient Data Image")
-    uploaded_file = st.file_uploader("Choose an image containing patient data...", type=["jpg", "jpeg", "png"])
+    uploaded_file = st.file_uploader("Choose an image containing patient data...", type=["jpg", "jpeg", "png"] + DOCUMENT_TYPES)
     
     st.header("Analysis Options")
-    default_prompt = """You are a highly skilled medical professional. Please analyze the uploaded image containing patient data and generate a treatment plan and a diet plan based on the information provided.
-
-**Format for Output:**
-
-- **Treatment Plan:**
-  - [Generated Treatment Plan]
-
-- **Diet Plan:**
-  - [Generated Diet Plan]
-
-Ensure that the plans are accurate and well-explained."""
+    default_prompt = DEFAULT_PROMPTS["treatment"]
 
     prompt = st.text_area("Enter your prompt:", value=default_prompt, height=100)
     
     generate_plan_button = st.button("Generate Plan")
 
+    session = load_session_results()
+    session.retain("treatment", [uploaded_file])
+
     col1, col2 = st.columns(2)
 
     with col1:
         st.header("Uploaded Patient Data Image")
         if uploaded_file is not None:
-            image = PILImage.open(uploaded_file)
-            st.image(image, caption="Uploaded Patient Data Image", use_column_width=True)
+            image = session.image(uploaded_file, "treatment")
+            st.image(image.image, caption="Uploaded Patient Data Image", width="stretch")
+            st.caption(image.describe())
         else:
             st.info("Please upload an image using the uploader.")
 
     with col2:
         st.header("Treatment and Diet Plan")
+        previous = session.result(uploaded_file, "treatment", prompt)
         if uploaded_file is not None and generate_plan_button:
             with st.spinner("Generating plans..."):
                 try:
-                    image = PILImage.open(uploaded_file)
-                    analysis = analyze_image(image, prompt)
-                    st.markdown(analysis)
+                    analysis = render_analysis(image, prompt)
+                    session.store_result(uploaded_file, "treatment", prompt, analysis=analysis)
                 except Exception as e:
                     st.error(f"An error occurred: {str(e)}")
+        elif previous is not None:
+            # Keep showing the last analysis across reruns instead of asking for another click
+            st.markdown(previous["analysis"])
         elif uploaded_file is None:
             st.info("Upload an image and click 'Generate Plan' to see the results.")
         elif not generate_plan_button:
             st.info("Click 'Generate Plan' to start the analysis.")
+            offer_near_duplicate(session, uploaded_file, "treatment", image, prompt)
+
+# Result tabs on the Analyze Everything page, in display order
+COMBINED_TASK_LABELS = {
+    "transcription": "Transcription",
+    "coding": "ICD Codes",
+    "insurance": "Insurance Risk",
+    "treatment": "Treatment and Diet Plan",
+}
+
+# Function to show the per-task results of a combined analysis side by side in tabs
+def display_combined_results(sections, fallbacks):
+    tasks = list(sections)
+    for task, tab in zip(tasks, st.tabs([COMBINED_TASK_LABELS[task] for task in tasks])):
+        with tab:
+            st.markdown(sections[task])
+            if task == "coding":
+                display_code_check(sections[task])
+    if fallbacks:
+        st.caption(f"Answered with separate calls because their section could not be read: {', '.join(COMBINED_TASK_LABELS[task] for task in fallbacks)}")
+
+# Function to handle Analyze Everything section
+def analyze_everything():
+    # The combined analysis module is only needed on this page
+    from medusa.combined import run_combined_upload
+
+    st.header("Analyze Everything")
+
+    st.header("Upload Patient Document")
+    uploaded_file = st.file_uploader("Choose a patient document image...", type=["jpg", "jpeg", "png"] + DOCUMENT_TYPES)
+
+    st.header("Analysis Options")
+    tasks = st.multiselect("Results to generate:", COMBINED_TASKS, default=COMBINED_TASKS, format_func=COMBINED_TASK_LABELS.get)
+    tasks = [task for task in COMBINED_TASKS if task in tasks]
+    prompt = build_combined_prompt(tasks)
+
+    analyze_button = st.button("Analyze Everything")
+
+    session = load_session_results()
+    session.retain("combined", [uploaded_file])
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.header("Uploaded Document")
+        if uploaded_file is not None:
+            image = session.image(uploaded_file, "combined")
+            st.image(image.image, caption="Uploaded Patient Document", width="stretch")
+            st.caption(image.describe())
+        else:
+            st.info("Please upload an image using the uploader.")
+
+    with col2:
+        st.header("Results")
+        previous = session.result(uploaded_file, "combined", prompt)
+        if uploaded_file is not None and analyze_button and tasks:
+            with st.spinner("Analyzing the document..."):
+                try:
+                    sections, fallbacks = run_combined_upload(load_model(), load_result_cache(), image, tasks)
+                    session.store_result(uploaded_file, "combined", prompt, sections=sections, fallbacks=fallbacks)
+                    display_combined_results(sections, fallbacks)
+                except Exception as e:
+                    st.error(f"An error occurred: {str(e)}")
+        elif previous is not None:
+            # Keep showing the last results across reruns instead of asking for another click
+            display_combined_results(previous["sections"], previous["fallbacks"])
+        elif not tasks:
+            st.info("Choose at least one result to generate.")
+        elif uploaded_file is None:
+            st.info("Upload an image and click 'Analyze Everything' to see the results.")
+        elif not analyze_button:
+            st.info("Click 'Analyze Everything' to start the analysis.")
 
 # Main app
 def main():
+    # Tag this session's stage timings so operators can tell sessions apart
+    set_session(st.session_state.setdefault("medusa_session_id", uuid.uuid4().hex[:12]))
+    load_metrics_server()
+
     st.sidebar.markdown("<h3 style='text-align: center; color: #116466; font-family: comic sans ms;'>⚕️ MEDUSA AI</h3>", unsafe_allow_html=True)
     display_instructions(selected)
     display_medical_news()
+    display_cache_stats()
+    display_gateway_stats()
+    display_job_stats()
+    display_stage_metrics()
 
     if selected == "Medical Imaging Diagnostics":
         medical_imaging_diagnostics()
@@ -698,6 +1084,8 @@ def main():
         insurance_risk_analysis()
     elif selected == "Treatment and Diet Plan Generator":
         treatment_diet_plan_generator()
+    elif selected == "Analyze Everything":
+        analyze_everything()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,88 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BUDGET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cold_start_budget.json")
+
+# Runs the app script once in Streamlit's bare mode (the first page render after a scale-up) and
+# reports which of the deferred modules ended up loaded
+PROBE = """
+import json, runpy, sys
+runpy.run_path("MEDUSA_AI.py", run_name="__main__")
+deferred = json.loads(sys.argv[1])
+print(json.dumps([name for name in deferred if name in sys.modules]))
+"""
+
+# Function to parse `python -X importtime` output into (module, self_us, cumulative_us, depth) rows
+def parse_importtime(stderr):
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        # Nested imports are indented by two spaces per level after the separator's own space
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+# Function to run one cold start in a fresh interpreter and collect its import profile
+def measure(deferred_modules):
+    env = dict(os.environ, MEDUSA_BACKEND=os.environ.get("MEDUSA_BACKEND", "fake"))
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE, json.dumps(deferred_modules)],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    loaded = json.loads(result.stdout.strip().splitlines()[-1])
+    return parse_importtime(result.stderr), loaded
+
+# Function to sum cumulative import time per top-level package, counting only imports made at depth 0
+def package_totals(rows):
+    totals = {}
+    for name, _, cumulative_us, depth in rows:
+        if depth == 0:
+            package = name.split(".")[0]
+            totals[package] = totals.get(package, 0) + cumulative_us
+    return totals
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure MEDUSA AI cold-start import cost and check it against a budget.")
+    parser.add_argument("--budget", default=DEFAULT_BUDGET, help="JSON budget file.")
+    parser.add_argument("--runs", type=int, default=3, help="Cold starts to measure; the fastest run is reported.")
+    parser.add_argument("--top", type=int, default=15, help="Number of packages to list in the report.")
+    args = parser.parse_args(argv)
+
+    with open(args.budget, encoding="utf-8") as budget_file:
+        budget = json.load(budget_file)
+
+    best = None
+    for _ in range(args.runs):
+        rows, loaded = measure(budget["deferred_modules"])
+        totals = package_totals(rows)
+        total_us = sum(totals.values())
+        if best is None or total_us < best[0]:
+            best = (total_us, totals, loaded)
+    total_us, totals, loaded = best
+    app_us = sum(totals.get(package, 0) for package in budget["app_packages"])
+
+    print(f"{'package':<32}{'cumulative ms':>14}")
+    for package, cumulative_us in sorted(totals.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"{package:<32}{cumulative_us / 1000:>14.1f}")
+    print(f"\nTotal import time: {total_us / 1000:.1f} ms (budget {budget['max_total_import_ms']} ms)")
+    print(f"App import time:   {app_us / 1000:.1f} ms (budget {budget['max_app_import_ms']} ms)")
+
+    failures = []
+    if total_us / 1000 > budget["max_total_import_ms"]:
+        failures.append("total import time is over budget")
+    if app_us / 1000 > budget["max_app_import_ms"]:
+        failures.append("app import time is over budget")
+    if loaded:
+        failures.append(f"modules that should load lazily were imported at startup: {', '.join(loaded)}")
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from medusa.backends import FakeBackend, set_model_request  # noqa: E402
+from medusa.hedging import HedgedBackend  # noqa: E402
+from medusa.metrics import percentile  # noqa: E402
+
+# Function to build the policy under test around long-tailed stand-in models
+def make_backend(policy, args):
+    full = FakeBackend(
+        name="full", latency=args.latency, latency_distribution="lognormal", latency_jitter=args.sigma,
+        tokens_per_second=0, failure_rate=args.failure_rate, seed=1,
+    )
+    if policy == "single":
+        return HedgedBackend(full, hedge_budget=0)
+    if policy == "hedged":
+        return HedgedBackend(full, hedge_budget=args.budget, min_samples=args.warmup)
+    fast = FakeBackend(
+        name="fast", latency=args.latency * args.fast_ratio, latency_distribution="lognormal", latency_jitter=args.sigma,
+        tokens_per_second=0, failure_rate=args.failure_rate, seed=2,
+    )
+    return HedgedBackend(
+        full, fast_backend=fast, default_deadline=args.deadline, hedge_budget=args.budget, min_samples=args.warmup,
+        upgrade=policy == "tiered+upgrade",
+    )
+
+# Function to time `requests` calls through a policy, `concurrency` at a time; returns (sorted latencies, errors)
+def run_policy(backend, requests, concurrency):
+    def call(_):
+        set_model_request("imaging")
+        started = time.perf_counter()
+        try:
+            backend.generate("Analyze this image.", None)
+        except Exception:
+            return None
+        return time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(call, range(requests)))
+    return sorted(seconds for seconds in results if seconds is not None), results.count(None)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare tail latency of single, hedged and tiered model calls against long-tailed stand-in models.")
+    parser.add_argument("--requests", type=int, default=400, help="Calls per policy.")
+    parser.add_argument("--concurrency", type=int, default=16, help="Calls in flight at once.")
+    parser.add_argument("--latency", type=float, default=0.2, help="Median stand-in latency in seconds.")
+    parser.add_argument("--sigma", type=float, default=0.8, help="Log-space spread of the latency; larger means a longer tail.")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of stand-in calls that fail.")
+    parser.add_argument("--budget", type=float, default=0.1, help="Hedged duplicates allowed per call.")
+    parser.add_argument("--warmup", type=int, default=20, help="Calls observed before hedging starts.")
+    parser.add_argument("--fast-ratio", type=float, default=0.3, help="Fast-tier latency as a share of the full model's.")
+    parser.add_argument("--deadline", type=float, default=None, help="Deadline in seconds for the tiered policies.")
+    args = parser.parse_args(argv)
+
+    print(f"{'policy':<16}{'ok':>6}{'failed':>8}{'p50 (s)':>10}{'p95 (s)':>10}{'p99 (s)':>10}{'upstream calls':>16}")
+    for policy in ("single", "hedged", "tiered", "tiered+upgrade"):
+        backend = make_backend(policy, args)
+        latencies, errors = run_policy(backend, args.requests, args.concurrency)
+        # Let losing attempts and upgrade passes finish so every upstream call is counted
+        time.sleep(args.latency * 20)
+        calls = backend.backend.calls + (backend.fast_backend.calls if backend.fast_backend else 0)
+        print(
+            f"{policy:<16}{len(latencies):>6}{errors:>8}{percentile(latencies, 0.50) or 0:>10.3f}"
+            f"{percentile(latencies, 0.95) or 0:>10.3f}{percentile(latencies, 0.99) or 0:>10.3f}{calls:>16}"
+        )
+        stats = backend.stats()
+        print(
+            f"{'':<16}hedges {stats['hedges']} ({stats['hedge_wins']} won, {stats['hedges_denied']} over budget), "
+            f"fallbacks {stats['fallbacks']}, deadline exceeded {stats['deadline_exceeded']}, upgrades {stats['upgrades']} ({stats['upgrades_skipped']} over budget)"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+import argparse
+import io
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+# Page and action button of each scenario
+SCENARIOS = {
+    "imaging": {"page": "Medical Imaging Diagnostics", "click": "Analyze Image"},
+    "transcription": {"page": "Medical Transcription", "click": "Get Transcription"},
+    "pathology": {"page": "Medical Pathology Diagnostics", "click": "Analyze Report"},
+    "coding": {"page": "Medical Coding", "click": "Get ICD Codes"},
+    "insurance": {"page": "Insurance Risk Analysis", "click": "Analyze Risk"},
+    "treatment": {"page": "Treatment and Diet Plan Generator", "click": "Generate Plan"},
+    "combined": {"page": "Analyze Everything", "click": "Analyze Everything"},
+}
+
+# Script each simulated session runs; the browser stand-ins are installed by `install_stand_ins` beforehand
+DRIVER = """
+import runpy
+import sys
+
+root = {root!r}
+if root not in sys.path:
+    sys.path.insert(0, root)
+runpy.run_path(root + "/MEDUSA_AI.py", run_name="__main__")
+"""
+
+# Uploaded file as Streamlit hands it to the page
+class Upload(io.BytesIO):
+    def __init__(self, data, name):
+        super().__init__(data)
+        self.name = name
+        self.file_id = name
+        self.size = len(data)
+        self.type = "image/jpeg"
+
+# Function to stand in for the browser: the page menu, the file uploader and one button click are answered from
+# each session's own state. Installed once, before any session runs, since every session shares the module.
+def install_stand_ins():
+    import streamlit as st
+    import streamlit_option_menu
+
+    original_button = st.button
+
+    def file_uploader(label, *args, **kwargs):
+        upload = Upload(st.session_state["_load_test_upload"], st.session_state["_load_test_name"])
+        return [upload] if kwargs.get("accept_multiple_files") else upload
+
+    def button(label, *args, **kwargs):
+        if label == st.session_state.get("_load_test_click"):
+            # The click is consumed by the first run, like a real button press
+            st.session_state["_load_test_click"] = None
+            return True
+        return original_button(label, *args, **kwargs)
+
+    st.file_uploader = file_uploader
+    st.button = button
+    streamlit_option_menu.option_menu = lambda *args, **kwargs: st.session_state["_load_test_page"]
+
+# Function to let concurrent sessions share one runtime. AppTest installs a mock runtime for each script run
+# and clears the singleton when the run ends, which would pull it away from sessions still running; a real
+# server has one runtime for every session anyway.
+def share_test_runtime():
+    from streamlit.runtime.runtime import Runtime
+
+    latest = []
+
+    def instance(cls):
+        if cls._instance is not None:
+            latest[:] = [cls._instance]
+            return cls._instance
+        if not latest:
+            raise RuntimeError("Runtime hasn't been created!")
+        return latest[0]
+
+    def exists(cls):
+        return cls._instance is not None or bool(latest)
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(exists)
+
+# Function to draw a document-like test image; each seed gives different pixels, so sessions miss the cache
+def make_upload(seed):
+    from PIL import Image, ImageDraw
+
+    image = Image.new("RGB", (1600, 1200), (250, 250, 245))
+    draw = ImageDraw.Draw(image)
+    for line in range(30):
+        y = 60 + line * 36
+        width = 300 + (seed * 37 + line * 91) % 1100
+        draw.rectangle((80, y, 80 + width, y + 14), fill=(40, 40, 40))
+    draw.text((80, 20), f"Patient #{seed}", fill=(0, 0, 0))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+# Function to stand in for the research paper search so imaging sessions do not hit Google Scholar
+def stub_research(latency):
+    import medusa.research
+
+    def search_research_papers(query):
+        time.sleep(latency)
+        return [{"title": f"Related study on {query[:40]}", "link": "https://example.org/paper"}]
+
+    medusa.research.search_research_papers = search_research_papers
+
+# Function to read the process's resident set size in bytes
+def current_rss():
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # Without /proc only the lifetime peak is available (KiB on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+# Samples RSS in the background while a scenario runs, keeping the peak
+class RssSampler:
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = current_rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+# Function to run one simulated session: load the page with an upload, click the action button, and keep
+# rerunning while a background job shows progress, as the browser's polling would. Returns the page latency.
+def run_session(driver_path, scenario, seed, upload, timeout, poll_interval):
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(driver_path, default_timeout=timeout)
+    app.session_state["_load_test_page"] = scenario["page"]
+    app.session_state["_load_test_upload"] = upload
+    app.session_state["_load_test_name"] = f"session_{seed}.jpg"
+    app.session_state["_load_test_click"] = scenario["click"]
+    started = time.perf_counter()
+    app.run()
+    while app.get("progress") and time.perf_counter() - started < timeout:
+        time.sleep(poll_interval)
+        app.run()
+    latency = time.perf_counter() - started
+    errors = [str(exception.value) for exception in app.exception] + [error.value for error in app.error]
+    if app.get("progress"):
+        errors.append("timed out waiting for the background job")
+    return latency, errors
+
+# Function to run `sessions` concurrent sessions of one scenario and summarize latency, throughput, memory and
+# per-stage wall and CPU time
+def run_scenario(name, driver_path, sessions, timeout, poll_interval, same_image):
+    from medusa.metrics import metrics, percentile
+
+    scenario = SCENARIOS[name]
+    uploads = [make_upload(0 if same_image else seed) for seed in range(sessions)]
+    metrics.reset()
+    cpu_started = time.process_time()
+    with RssSampler() as sampler, ThreadPoolExecutor(max_workers=sessions, thread_name_prefix="load-test") as executor:
+        started = time.perf_counter()
+        # Seeds are offset per scenario so a scenario never reuses an upload name from an earlier one
+        futures = [
+            executor.submit(run_session, driver_path, scenario, f"{name}_{seed}", uploads[seed], timeout, poll_interval)
+            for seed in range(sessions)
+        ]
+        results = [future.result() for future in futures]
+        wall = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, errors in results if not errors)
+    failures = [errors for _, errors in results if errors]
+    cpu = {}
+    for (counter, labels), value in metrics.counters().items():
+        if counter == "stage_cpu_seconds":
+            labels = dict(labels)
+            cpu[(labels["stage"], labels["mode"])] = value
+    stages = {}
+    for row in metrics.summary():
+        cpu_seconds = cpu.get((row["stage"], row["mode"]), 0.0)
+        stages[f"{row['stage']}/{row['mode']}"] = {
+            "count": row["count"], "p50": row["p50"], "p99": row["p99"],
+            "cpu_per_call": cpu_seconds / row["count"] if row["count"] else 0.0,
+        }
+    return {
+        "sessions": sessions,
+        "completed": len(latencies),
+        "failed": len(failures),
+        "errors": sorted({error for errors in failures for error in errors})[:5],
+        "wall_seconds": wall,
+        "throughput": len(latencies) / wall if wall else 0.0,
+        "p50": percentile(latencies, 0.50) or 0.0,
+        "p99": percentile(latencies, 0.99) or 0.0,
+        "peak_rss_mb": sampler.peak / (1024 * 1024),
+        "cpu_seconds": time.process_time() - cpu_started,
+        "stages": stages,
+    }
+
+# Function to print one scenario's results
+def print_report(name, result):
+    print(f"\n== {name}: {result['completed']}/{result['sessions']} sessions in {result['wall_seconds']:.2f}s")
+    print(
+        f"throughput {result['throughput']:.2f} pages/s, p50 {result['p50']:.3f}s, p99 {result['p99']:.3f}s, "
+        f"peak RSS {result['peak_rss_mb']:.0f} MB, CPU {result['cpu_seconds']:.2f}s"
+    )
+    for error in result["errors"]:
+        print(f"  error: {error}")
+    print(f"  {'stage/mode':<36}{'count':>7}{'p50 (s)':>10}{'p99 (s)':>10}{'cpu/call (ms)':>15}")
+    for stage, row in sorted(result["stages"].items()):
+        print(f"  {stage:<36}{row['count']:>7}{row['p50']:>10.3f}{row['p99']:>10.3f}{row['cpu_per_call'] * 1000:>15.1f}")
+
+# Function to compare results with a saved baseline; returns the regressions beyond `tolerance` (a fraction)
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, result in results.items():
+        before = baseline["scenarios"].get(name)
+        if before is None:
+            continue
+        print(f"\n{name}: vs baseline")
+        # Lower is better for latency and memory, higher is better for throughput
+        for key, higher_is_better in (("p50", False), ("p99", False), ("peak_rss_mb", False), ("throughput", True)):
+            old, new = before[key], result[key]
+            change = (new - old) / old if old else 0.0
+            print(f"  {key:<12}{old:>10.3f} -> {new:>10.3f} ({change:+.0%})")
+            if (change < -tolerance) if higher_is_better else (change > tolerance):
+                regressions.append(f"{name} {key} {change:+.0%}")
+        if result["failed"] > before["failed"]:
+            regressions.append(f"{name} failed sessions {before['failed']} -> {result['failed']}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run concurrent simulated sessions through each MEDUSA AI page against a local stand-in model.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Comma-separated scenarios ({', '.join(SCENARIOS)}).")
+    parser.add_argument("--sessions", type=int, default=10, help="Concurrent sessions per scenario.")
+    parser.add_argument("--latency", type=float, default=0.5, help="Stand-in model latency in seconds.")
+    parser.add_argument("--tokens-per-second", type=float, default=400, help="Stand-in model streaming speed.")
+    parser.add_argument("--research-latency", type=float, default=0.2, help="Stand-in research paper search latency in seconds.")
+    parser.add_argument("--same-image", action="store_true", help="Upload the same image in every session to exercise caching and request merging.")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds a session may take.")
+    parser.add_argument("--poll-interval", type=float, default=0.25, help="Seconds between reruns while a background job runs.")
+    parser.add_argument("--save-baseline", metavar="NAME", help=f"Save the results as {DEFAULT_BASELINE_DIR}/NAME.json.")
+    parser.add_argument("--compare", metavar="FILE", help="Baseline JSON to diff against.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression against the baseline.")
+    args = parser.parse_args(argv)
+
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    # The app reads its settings at import, so the stand-in model is configured before anything loads it
+    os.environ.update({
+        "MEDUSA_BACKEND": "fake",
+        "MEDUSA_FAKE_LATENCY": str(args.latency),
+        "MEDUSA_FAKE_TOKENS_PER_SECOND": str(args.tokens_per_second),
+        "MEDUSA_CACHE_PATH": "",
+    })
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    stub_research(args.research_latency)
+    install_stand_ins()
+    share_test_runtime()
+
+    with tempfile.NamedTemporaryFile("w", suffix=".py", prefix="medusa_load_test_", delete=False, encoding="utf-8") as driver:
+        driver.write(DRIVER.format(root=ROOT))
+    driver_path = driver.name
+    try:
+        results = {}
+        for name in names:
+            results[name] = run_scenario(name, driver_path, args.sessions, args.timeout, args.poll_interval, args.same_image)
+            print_report(name, results[name])
+    finally:
+        os.remove(driver_path)
+
+    settings = {"sessions": args.sessions, "latency": args.latency, "tokens_per_second": args.tokens_per_second, "same_image": args.same_image}
+    if args.save_baseline:
+        os.makedirs(DEFAULT_BASELINE_DIR, exist_ok=True)
+        path = os.path.join(DEFAULT_BASELINE_DIR, f"{args.save_baseline}.json")
+        with open(path, "w", encoding="utf-8") as baseline_file:
+            json.dump({"created": time.time(), "settings": settings, "scenarios": results}, baseline_file, indent=2)
+        print(f"\nSaved baseline to {path}")
+
+    failures = [f"{name}: {result['failed']} failed session(s)" for name, result in results.items() if result["failed"]]
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+        if baseline["settings"] != settings:
+            print(f"\nNote: baseline settings differ: {baseline['settings']}")
+        failures += [f"regression: {regression}" for regression in compare(results, baseline, args.tolerance)]
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from medusa.backends import GENERATION_PROFILES, IMAGE_TOKENS, estimate_tokens, set_model_request
+from medusa.cache import make_cache_key
+from medusa.documents import PAGE_CONCURRENCY
+from medusa.metrics import current_session, metrics, span, with_current_context
+from medusa.preprocess import PreparedImage, preprocess_image
+from medusa.similar import HASH_BITS, NEAR_DUPLICATE_MODES, NEAR_DUPLICATE_SIMILARITY, image_signature, perceptual_hash
+
+# Function to make sure an image has been through the preprocessing pipeline
+def ensure_prepared(image):
+    if isinstance(image, PreparedImage):
+        return image
+    # DICOM studies, tiled large images and documents prepare their default view
+    if hasattr(image, "prepare"):
+        return image.prepare()
+    return preprocess_image(image)
+
+# Function to build the cache key of an analysis; the mode's generation profile is part of it, so answers made
+# with earlier settings are not served after a profile changes
+def analysis_key(fingerprint, prompt, model_name, mode):
+    return make_cache_key(fingerprint, prompt, model_name, GENERATION_PROFILES.get(mode))
+
+# Function to record token counts and payload sizes of one model response; a response shared with a coalesced
+# request is skipped, since the request that made the upstream call records it
+def record_generation(mode, input_tokens, output_tokens, payload_bytes, text, truncated=False, coalesced=False):
+    if coalesced:
+        return
+    metrics.record_usage(mode, input_tokens, output_tokens, current_session(), truncated)
+    metrics.add("model_request_bytes", payload_bytes, mode=mode)
+    metrics.add("model_response_bytes", len(text.encode("utf-8")), mode=mode)
+
+# Function to replace a fast-tier answer in the cache with the full model's answer once the upgrade pass finishes
+def cache_upgrade(cache, key, image, upgrade):
+    def store(future):
+        if future.cancelled() or future.exception() is not None:
+            return
+        generation = future.result()
+        record_generation(
+            image.mode, generation.input_tokens, generation.output_tokens, image.payload_bytes, generation.text, generation.truncated,
+        )
+        if not generation.truncated:
+            cache.put(key, generation.text)
+
+    upgrade.add_done_callback(store)
+
+# Function to add an analyzed image to the near-duplicate index of the session that uploaded it
+def remember_image(cache, image):
+    owner = current_session()
+    if cache.near_duplicates is None or owner is None or image.mode not in NEAR_DUPLICATE_MODES:
+        return
+    phash = perceptual_hash(image.image)
+    if phash is not None:
+        cache.near_duplicates.add(owner, image.fingerprint, phash, image_signature(image.image))
+
+# Function to look for a stored result of the same prompt on a closely matching image the current session analyzed
+# earlier. Returns (result text, signature similarity) or None; exact copies are left to the regular cache lookup.
+def find_near_duplicate(cache, image, prompt, model_name, min_similarity=NEAR_DUPLICATE_SIMILARITY):
+    owner = current_session()
+    if cache.near_duplicates is None or owner is None:
+        return None
+    image = ensure_prepared(image)
+    if image.mode not in NEAR_DUPLICATE_MODES:
+        return None
+    max_distance = int((1 - min_similarity) * HASH_BITS)
+    with span("near_duplicate_lookup", image.mode):
+        phash = perceptual_hash(image.image)
+        if phash is None:
+            return None
+        candidates = cache.near_duplicates.find(
+            owner, phash, image_signature(image.image), max_distance, exclude=image.fingerprint,
+        )
+        for fingerprint, similarity in candidates:
+            text = cache.peek(analysis_key(fingerprint, prompt, model_name, image.mode))
+            if text is not None:
+                return text, similarity
+    return None
+
+# Function to run a cached model call (no Streamlit calls, safe to use from worker threads)
+def run_analysis(backend, cache, image, prompt, bypass_cache=False):
+    image = ensure_prepared(image)
+    key = analysis_key(image.fingerprint, prompt, backend.name, image.mode)
+    if bypass_cache:
+        cache.record_bypass()
+    else:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+    request = set_model_request(image.mode)
+    with span("model", image.mode):
+        generation = backend.generate(prompt, image.blob)
+    record_generation(
+        image.mode, generation.input_tokens, generation.output_tokens, image.payload_bytes, generation.text,
+        generation.truncated, generation.coalesced,
+    )
+    # An answer cut off at the output cap is shown but not cached, so asking again gets a fresh attempt
+    if not generation.truncated:
+        cache.put(key, generation.text)
+    if request.upgrade is not None:
+        cache_upgrade(cache, key, image, request.upgrade)
+    remember_image(cache, image)
+    return generation.text
+
+# Function to stream a cached model call chunk by chunk; the full text is cached once the stream completes
+def stream_analysis(backend, cache, image, prompt, bypass_cache=False):
+    image = ensure_prepared(image)
+    key = analysis_key(image.fingerprint, prompt, backend.name, image.mode)
+    if bypass_cache:
+        cache.record_bypass()
+    else:
+        cached = cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+    chunks = []
+    request = set_model_request(image.mode)
+    started = time.perf_counter()
+    try:
+        for chunk in backend.stream(prompt, image.blob):
+            if not chunks:
+                metrics.observe("model_first_token", image.mode, time.perf_counter() - started, session=current_session())
+            chunks.append(chunk)
+            yield chunk
+    except Exception:
+        metrics.observe("model", image.mode, time.perf_counter() - started, error=True, session=current_session())
+        raise
+    metrics.observe("model", image.mode, time.perf_counter() - started, session=current_session())
+    text = "".join(chunks)
+    usage = request.usage
+    if usage is None:
+        # Backends that do not report stream usage get estimated token counts
+        record_generation(image.mode, estimate_tokens(prompt) + IMAGE_TOKENS, estimate_tokens(text), image.payload_bytes, text)
+    else:
+        record_generation(image.mode, usage.input_tokens, usage.output_tokens, image.payload_bytes, text, usage.truncated)
+    if usage is None or not usage.truncated:
+        cache.put(key, text)
+    if request.upgrade is not None:
+        cache_upgrade(cache, key, image, request.upgrade)
+    remember_image(cache, image)
+
+# Function to apply `analyze_page(page)` to every page of a document in parallel; at most `max_workers` pages are
+# rasterized and in flight at once, so memory is bounded by the concurrency rather than the page count.
+# Returns the results in page order.
+def map_pages(document, analyze_page, max_workers=PAGE_CONCURRENCY, on_page=None):
+    results = [None] * document.page_count
+    pages = iter(range(document.page_count))
+    completed = 0
+    workers = max(1, min(max_workers, document.page_count))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="medusa-page") as executor:
+        pending = {}
+
+        def submit_next():
+            index = next(pages, None)
+            if index is not None:
+                pending[executor.submit(with_current_context(lambda: analyze_page(document.page(index))))] = index
+
+        for _ in range(workers):
+            submit_next()
+        try:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[pending.pop(future)] = future.result()
+                    completed += 1
+                    if on_page is not None:
+                        on_page(completed, document.page_count, results)
+                    submit_next()
+        finally:
+            # On failure or cancellation, pages that have not started yet are dropped
+            for future in pending:
+                future.cancel()
+    return results
+
+# Function to analyze every page of a document in parallel; returns the per-page texts in page order
+def run_document_analysis(backend, cache, document, prompt, bypass_cache=False, max_workers=PAGE_CONCURRENCY, on_page=None):
+    return map_pages(document, lambda page: run_analysis(backend, cache, page, prompt, bypass_cache), max_workers, on_page)
+
+# Function to join per-page analyses into one text; pages that are not done yet are skipped
+def merge_page_analyses(analyses):
+    if len(analyses) == 1:
+        return analyses[0] or ""
+    return "\n\n".join(
+        f"**Page {number}**\n\n{analysis}" for number, analysis in enumerate(analyses, start=1) if analysis is not None
+    )
@@ -0,0 +1,312 @@
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+
+from medusa.prompts import DEFAULT_PROMPTS, combined_tasks, section_end, section_start
+
+DEFAULT_MODEL_NAME = 'gemini-1.5-flash'
+# Gemini bills every image as a fixed number of input tokens
+IMAGE_TOKENS = 258
+
+# Generation settings per mode. Output caps bound generation time and spend: ICD codes are a short list, a treatment
+# and diet plan is long. Document modes run cold so repeated extractions agree. `response_mime_type` asks for
+# JSON output; the interactive pages render markdown, so only structured-extraction modes may set it.
+GENERATION_PROFILES = {
+    "imaging": {"max_output_tokens": 2048, "temperature": 0.2},
+    "transcription": {"max_output_tokens": 2048, "temperature": 0.0},
+    "pathology": {"max_output_tokens": 1536, "temperature": 0.0},
+    "coding": {"max_output_tokens": 512, "temperature": 0.0},
+    "insurance": {"max_output_tokens": 768, "temperature": 0.1},
+    "treatment": {"max_output_tokens": 4096, "temperature": 0.4},
+    "combined": {"max_output_tokens": 8192, "temperature": 0.1},
+}
+
+# Settings can be overridden per mode, e.g. MEDUSA_MAX_OUTPUT_TOKENS_CODING=256 or MEDUSA_TEMPERATURE_TREATMENT=0.7
+for _mode, _profile in GENERATION_PROFILES.items():
+    if os.getenv(f"MEDUSA_MAX_OUTPUT_TOKENS_{_mode.upper()}"):
+        _profile["max_output_tokens"] = int(os.getenv(f"MEDUSA_MAX_OUTPUT_TOKENS_{_mode.upper()}"))
+    if os.getenv(f"MEDUSA_TEMPERATURE_{_mode.upper()}"):
+        _profile["temperature"] = float(os.getenv(f"MEDUSA_TEMPERATURE_{_mode.upper()}"))
+
+# Model call the current code is making; set by the analysis layer, read by the layers below the gateway
+_request = contextvars.ContextVar("medusa_model_request", default=None)
+
+# What the layers below the gateway know about a model call (its mode, which picks the deadline and generation
+# profile, and the upstream timeout the deadline sets) and what they report back: the model that answered, for
+# fast-tier answers the pending upgrade pass, and for streams the usage of the whole generation once the stream
+# ends (streams only yield text)
+class ModelRequest:
+    def __init__(self, mode):
+        self.mode = mode
+        self.profile = GENERATION_PROFILES.get(mode, {})
+        self.timeout = None
+        self.tier = None
+        self.upgrade = None
+        self.usage = None
+
+# Function to describe the model call about to be made in this context; returns the request the lower layers fill in
+def set_model_request(mode):
+    request = ModelRequest(mode)
+    _request.set(request)
+    return request
+
+def current_model_request():
+    return _request.get() or ModelRequest(None)
+
+# Raised when a backend cannot be created from the current configuration
+class BackendConfigError(RuntimeError):
+    pass
+
+# Raised by a backend for a failed generation; `retryable` marks transient upstream errors
+class BackendError(RuntimeError):
+    def __init__(self, message, retryable=False):
+        super().__init__(message)
+        self.retryable = retryable
+
+# The text of one generation plus its token usage; `truncated` marks output cut off at the profile's token cap and
+# `coalesced` a copy handed to a request that shared another request's upstream call
+class Generation:
+    def __init__(self, text, input_tokens=0, output_tokens=0, truncated=False, coalesced=False):
+        self.text = text
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+        self.truncated = truncated
+        self.coalesced = coalesced
+
+    # Function to copy the generation for a request that waited on this one's upstream call
+    def shared(self):
+        return Generation(self.text, self.input_tokens, self.output_tokens, self.truncated, coalesced=True)
+
+# Function to roughly count tokens when the backend does not report usage
+def estimate_tokens(text):
+    return max(1, len(text) // 4) if text else 0
+
+# Backend that calls the Gemini API
+class GeminiBackend:
+    def __init__(self, model_name=DEFAULT_MODEL_NAME, api_key=None):
+        api_key = api_key or os.getenv("GOOGLE_API_KEY")
+        if not api_key:
+            raise BackendConfigError("Google API Key not found in .env file.")
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self.name = model_name
+        self._model = genai.GenerativeModel(model_name)
+
+    # Function to read the token usage and finish reason of a response, or of the last chunk of a stream
+    def _generation(self, response, prompt, text):
+        usage = getattr(response, "usage_metadata", None)
+        candidates = getattr(response, "candidates", None)
+        finish_reason = getattr(candidates[0].finish_reason, "name", "") if candidates else ""
+        return Generation(
+            text,
+            getattr(usage, "prompt_token_count", 0) or estimate_tokens(prompt) + IMAGE_TOKENS,
+            getattr(usage, "candidates_token_count", 0) or estimate_tokens(text),
+            truncated=finish_reason == "MAX_TOKENS",
+        )
+
+    # Streams get no upstream timeout: it would bound the whole stream, while the deadline only covers the first chunk
+    def generate(self, prompt, blob):
+        request = current_model_request()
+        response = self._model.generate_content(
+            [prompt, blob], generation_config=request.profile or None,
+            request_options={"timeout": request.timeout} if request.timeout else None,
+        )
+        return self._generation(response, prompt, response.text)
+
+    def stream(self, prompt, blob):
+        request = current_model_request()
+        last = None
+        parts = []
+        for chunk in self._model.generate_content([prompt, blob], generation_config=request.profile or None, stream=True):
+            last = chunk
+            if chunk.parts:
+                parts.append(chunk.text)
+                yield chunk.text
+        # Usage totals and the finish reason arrive with the last chunk
+        request.usage = self._generation(last, prompt, "".join(parts))
+
+# Canned, section-formatted answers returned by the fake backend for each mode
+FAKE_RESPONSES = {
+    "imaging": (
+        "The image shows a frontal chest radiograph with clear lung fields and no focal consolidation. "
+        "The cardiac silhouette is within normal limits and the costophrenic angles are sharp. "
+        "No pneumothorax, pleural effusion or acute osseous abnormality is identified. "
+        "Potential diagnoses: normal study; clinical correlation is advised if symptoms persist."
+    ),
+    "transcription": (
+        "| Medicine | Dosage | Frequency | Duration |\n"
+        "| --- | --- | --- | --- |\n"
+        "| Amoxicillin | 500 mg | Three times a day | 7 days |\n"
+        "| Paracetamol | 650 mg | As needed for fever | 5 days |\n"
+        "| Cetirizine | 10 mg | Once at night | 5 days |"
+    ),
+    "pathology": (
+        "- **Patient Information:**\n"
+        "  - Patient Name: Jane Doe\n"
+        "  - MRN: 00012345\n"
+        "  - DOB: 01/02/1970 (Age: 54)\n"
+        "  - Gender: Female\n"
+        "  - HCN: 1234-567-890\n"
+        "  - Ordering Physician: Dr. A. Smith\n"
+        "  - Copy To: N.A.\n\n"
+        "- **Observation:**\n"
+        "  - Sections show breast tissue with an infiltrating ductal carcinoma measuring 1.8 cm, "
+        "with moderate nuclear pleomorphism and no lymphovascular invasion.\n\n"
+        "- **Inferences:**\n"
+        "  - Findings are consistent with a grade 2 invasive ductal carcinoma with clear margins.\n\n"
+        "- **Conclusion:**\n"
+        "  - Invasive ductal carcinoma, grade 2, margins negative; hormone receptor studies to follow."
+    ),
+    "coding": (
+        "- **E11.9** - Type 2 diabetes mellitus without complications\n"
+        "- **I10** - Essential (primary) hypertension\n"
+        "- **E78.5** - Hyperlipidemia, unspecified"
+    ),
+    "insurance": (
+        "- **Risk Percentage:** 27%\n"
+        "- **Justification:** The applicant is 52 years old with controlled hypertension and a BMI of 29. "
+        "There is no history of smoking or major surgery, which offsets the age-related risk."
+    ),
+    "treatment": (
+        "- **Treatment Plan:**\n"
+        "  - Continue metformin 500 mg twice daily and review HbA1c in three months.\n"
+        "  - Start a moderate-intensity walking program of 30 minutes, five days a week.\n\n"
+        "- **Diet Plan:**\n"
+        "  - Breakfast: oats with nuts and a boiled egg.\n"
+        "  - Lunch: brown rice, lentils and a green salad.\n"
+        "  - Dinner: grilled fish or paneer with steamed vegetables."
+    ),
+}
+
+# Keywords used to pick a canned answer when the prompt is not one of the default prompts
+_MODE_KEYWORDS = [
+    ("pathology", "pathology"),
+    ("icd", "coding"),
+    ("insurance", "insurance"),
+    ("diet", "treatment"),
+    ("prescription", "transcription"),
+    ("transcribe", "transcription"),
+]
+
+# Function to guess which analysis mode a prompt belongs to
+def detect_mode(prompt):
+    normalized = " ".join(prompt.split())
+    for mode, default_prompt in DEFAULT_PROMPTS.items():
+        if normalized == " ".join(default_prompt.split()):
+            return mode
+    lowered = normalized.lower()
+    for keyword, mode in _MODE_KEYWORDS:
+        if keyword in lowered:
+            return mode
+    return "imaging"
+
+# Function to pick the canned answer for a prompt; combined prompts get one marked section per task
+def fake_response(responses, prompt):
+    tasks = combined_tasks(prompt)
+    if tasks:
+        return "\n\n".join(f"{section_start(task)}\n{responses[task]}\n{section_end(task)}" for task in tasks)
+    return responses[detect_mode(prompt)]
+
+# Deterministic local stand-in for the model, for offline benchmarking and load tests
+class FakeBackend:
+    def __init__(self, name="fake", latency=1.0, latency_distribution="fixed", latency_jitter=0.25,
+                 tokens_per_second=80.0, failure_rate=0.0, seed=0, responses=None, chunk_tokens=8):
+        self.name = name
+        self.latency = latency
+        self.latency_distribution = latency_distribution
+        self.latency_jitter = latency_jitter
+        self.tokens_per_second = tokens_per_second
+        self.failure_rate = failure_rate
+        self.responses = dict(FAKE_RESPONSES, **(responses or {}))
+        self.chunk_tokens = chunk_tokens
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    # Function to draw the time-to-first-token and decide whether this call fails
+    def _sample(self):
+        with self._lock:
+            self.calls += 1
+            failed = self._random.random() < self.failure_rate
+            if self.latency_distribution == "uniform":
+                delay = self._random.uniform(self.latency * (1 - self.latency_jitter), self.latency * (1 + self.latency_jitter))
+            elif self.latency_distribution == "lognormal":
+                # `latency` is the median and `latency_jitter` the log-space sigma, which gives a long tail
+                delay = self.latency * self._random.lognormvariate(0, self.latency_jitter)
+            elif self.latency_distribution == "exponential":
+                delay = self._random.expovariate(1 / self.latency) if self.latency > 0 else 0.0
+            else:
+                delay = self.latency
+        return max(0.0, delay), failed
+
+    # Function to pick the canned response and cut it at the request's output cap, as the real model would
+    def _respond(self, prompt):
+        text = fake_response(self.responses, prompt)
+        cap = current_model_request().profile.get("max_output_tokens")
+        if cap and estimate_tokens(text) > cap:
+            return text[:cap * 4], True
+        return text, False
+
+    def _generation_delay(self, tokens):
+        return tokens / self.tokens_per_second if self.tokens_per_second else 0.0
+
+    def generate(self, prompt, blob):
+        delay, failed = self._sample()
+        text, truncated = self._respond(prompt)
+        output_tokens = estimate_tokens(text)
+        time.sleep(delay)
+        if failed:
+            raise BackendError("Simulated upstream failure (503 Service Unavailable).", retryable=True)
+        time.sleep(self._generation_delay(output_tokens))
+        return Generation(text, estimate_tokens(prompt) + IMAGE_TOKENS, output_tokens, truncated)
+
+    def stream(self, prompt, blob):
+        request = current_model_request()
+        delay, failed = self._sample()
+        text, truncated = self._respond(prompt)
+        time.sleep(delay)
+        if failed:
+            raise BackendError("Simulated upstream failure (503 Service Unavailable).", retryable=True)
+        words = text.split(" ")
+        step = max(1, int(self.chunk_tokens * 0.75))
+        for start in range(0, len(words), step):
+            chunk = " ".join(words[start:start + step])
+            if start + step < len(words):
+                chunk += " "
+            time.sleep(self._generation_delay(estimate_tokens(chunk)))
+            yield chunk
+        request.usage = Generation(text, estimate_tokens(prompt) + IMAGE_TOKENS, estimate_tokens(text), truncated)
+
+# Function to build the fake backend from environment settings; a named fake model (the fast tier)
+# answers after MEDUSA_FAKE_FAST_LATENCY instead
+def fake_backend_from_env(model_name=None):
+    responses = None
+    responses_path = os.getenv("MEDUSA_FAKE_RESPONSES")
+    if responses_path:
+        with open(responses_path, encoding="utf-8") as responses_file:
+            responses = json.load(responses_file)
+    latency = os.getenv("MEDUSA_FAKE_LATENCY", "1.0")
+    if model_name:
+        latency = os.getenv("MEDUSA_FAKE_FAST_LATENCY", latency)
+    return FakeBackend(
+        name=model_name or "fake",
+        latency=float(latency),
+        latency_distribution=os.getenv("MEDUSA_FAKE_LATENCY_DISTRIBUTION", "fixed"),
+        latency_jitter=float(os.getenv("MEDUSA_FAKE_LATENCY_JITTER", "0.25")),
+        tokens_per_second=float(os.getenv("MEDUSA_FAKE_TOKENS_PER_SECOND", "80")),
+        failure_rate=float(os.getenv("MEDUSA_FAKE_FAILURE_RATE", "0")),
+        seed=int(os.getenv("MEDUSA_FAKE_SEED", "0")),
+        responses=responses,
+    )
+
+# Function to create the model backend selected by MEDUSA_BACKEND
+def create_backend(name=None, api_key=None, model_name=None):
+    name = name or os.getenv("MEDUSA_BACKEND", "gemini")
+    if name == "gemini":
+        return GeminiBackend(model_name or os.getenv("MEDUSA_MODEL", DEFAULT_MODEL_NAME), api_key)
+    if name == "fake":
+        return fake_backend_from_env(model_name)
+    raise BackendConfigError(f"Unknown model backend '{name}'. Use 'gemini' or 'fake'.")
@@ -0,0 +1,247 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from dotenv import load_dotenv
+
+from medusa.analysis import merge_page_analyses, run_analysis, run_document_analysis
+from medusa.backends import create_backend
+from medusa.cache import cache_from_env
+from medusa.gateway import gateway_from_env
+from medusa.hedging import hedging_from_env
+from medusa.icd10 import default_index
+from medusa.metrics import metrics, start_metrics_server
+from medusa.documents import Document, prepare_bytes
+from medusa.pathology_report import create_pathology_report, extract_info_from_pages
+from medusa.pdf_report import build_imaging_report
+from medusa.portfolio import ScoreWriter, portfolio_summary, print_summary
+from medusa.prompts import DEFAULT_PROMPTS
+from medusa.sections import parse_sections, risk_percentage
+
+INPUT_EXTENSIONS = (".jpg", ".jpeg", ".png", ".pdf", ".tif", ".tiff", ".dcm", ".dicom")
+
+# Per-process worker state, created lazily so thread and process pools can share the same entry point
+_worker_state = None
+_worker_lock = threading.Lock()
+
+# Function to list the images and documents to process from a directory or a manifest file
+def discover_items(source):
+    items = []
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(INPUT_EXTENSIONS):
+                    path = os.path.join(root, name)
+                    items.append({"id": os.path.relpath(path, source), "path": path})
+        return items
+
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, encoding="utf-8") as manifest:
+        for line in manifest:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            # JSONL manifests may carry an explicit id and a per-item prompt
+            item = json.loads(line) if line.startswith("{") else {"path": line}
+            item["path"] = os.path.join(base, item["path"])
+            item.setdefault("id", os.path.relpath(item["path"], base))
+            items.append(item)
+    return items
+
+# Function to read the ids that already completed successfully from an earlier run's output
+def load_completed(output_path):
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, encoding="utf-8") as results:
+        for line in results:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash can leave a truncated last line; that item simply runs again
+                continue
+            if record.get("status") == "ok":
+                completed.add(record["id"])
+    return completed
+
+# Function to create the model backend and cache once per worker process. `limits` is (requests per minute,
+# processes): the rate limits apply to upstream calls through the process's gateway, split between the processes.
+def _get_worker_state(limits=(None, 1)):
+    global _worker_state
+    with _worker_lock:
+        if _worker_state is None or _worker_state[0] != limits:
+            load_dotenv()
+            gateway = gateway_from_env(hedging_from_env(create_backend()), *limits)
+            _worker_state = (limits, gateway, cache_from_env())
+        return _worker_state[1:]
+
+# Function to turn an item id into a safe report file name; the source extension is kept so that
+# scan.jpg and scan.png (or doc.pdf and doc.tiff) get separate reports
+def _report_name(item_id, extension):
+    stem = item_id.replace(os.sep, "__").replace("/", "__")
+    return f"{stem}.{extension}"
+
+# Function to analyze one item and optionally write its report (runs inside a worker)
+def process_item(item, mode, prompt, reports_dir=None, report_format="Format 1", bypass_cache=False, limits=(None, 1)):
+    started = time.perf_counter()
+    record = {"id": item["id"], "path": item["path"], "mode": mode}
+    try:
+        backend, cache = _get_worker_state(limits)
+        with open(item["path"], "rb") as source:
+            image = prepare_bytes(source.read(), mode)
+        if isinstance(image, Document):
+            analyses = run_document_analysis(backend, cache, image, item.get("prompt") or prompt, bypass_cache)
+            record["pages"] = len(analyses)
+            image = image.page(0)
+        else:
+            if hasattr(image, "prepare"):
+                # DICOM studies and tiled large images are analyzed in their default view
+                image = image.prepare()
+            analyses = [run_analysis(backend, cache, image, item.get("prompt") or prompt, bypass_cache)]
+        analysis = merge_page_analyses(analyses)
+        record["status"] = "ok"
+        record["analysis"] = analysis
+
+        if mode == "pathology":
+            patient_info, service_info, specimens, theranostic_report = extract_info_from_pages(analyses)
+            record["sections"] = {
+                "patient_info": patient_info,
+                "observation": service_info,
+                "inferences": specimens,
+                "conclusion": theranostic_report,
+            }
+            if reports_dir:
+                report_buf = create_pathology_report(patient_info, service_info, specimens, theranostic_report)
+                record["report"] = os.path.join(reports_dir, _report_name(item["id"], "png"))
+                with open(record["report"], "wb") as report:
+                    report.write(report_buf.getvalue())
+        elif mode == "coding":
+            record["codes"] = default_index().check_text(analysis)
+        elif mode in ("insurance", "treatment"):
+            record["sections"] = parse_sections(analysis, mode)
+            if mode == "insurance":
+                record["risk_percentage"] = risk_percentage(record["sections"].get("risk_percentage"))
+        elif mode == "imaging" and reports_dir:
+            pdf_buffer = build_imaging_report(image, analysis, report_format)
+            record["report"] = os.path.join(reports_dir, _report_name(item["id"], "pdf"))
+            with open(record["report"], "wb") as report:
+                report.write(pdf_buffer.getvalue())
+    except Exception as e:
+        record["status"] = "error"
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["elapsed"] = round(time.perf_counter() - started, 3)
+    return record
+
+# Function to run a resumable batch; results are appended to `output_path` as they complete
+def run_batch(items, mode, output_path, prompt=None, workers=4, executor="thread", requests_per_minute=None,
+              reports_dir=None, report_format="Format 1", bypass_cache=False, scores_dir=None, log=sys.stderr):
+    prompt = prompt or DEFAULT_PROMPTS[mode]
+    completed = load_completed(output_path)
+    pending = [item for item in items if item["id"] not in completed]
+    if reports_dir:
+        os.makedirs(reports_dir, exist_ok=True)
+    # Rate limits count upstream calls (every page of a document is one), not items. Thread workers share one
+    # gateway; each process worker runs its own, so the limits are split between them.
+    limits = (requests_per_minute, workers if executor == "process" else 1)
+    pool_class = ProcessPoolExecutor if executor == "process" else ThreadPoolExecutor
+    summary = {"skipped": len(items) - len(pending), "ok": 0, "error": 0}
+    print(f"{len(items)} item(s), {summary['skipped']} already done, {len(pending)} to process", file=log)
+
+    # Start on a fresh line if the previous run died mid-write
+    needs_newline = False
+    if os.path.exists(output_path) and os.path.getsize(output_path):
+        with open(output_path, "rb") as existing:
+            existing.seek(-1, os.SEEK_END)
+            needs_newline = existing.read(1) != b"\n"
+
+    # Insurance scores also go to a columnar table; results from earlier runs that it lacks are added first
+    scores = None
+    if scores_dir:
+        scores = ScoreWriter(scores_dir)
+        scores.backfill(output_path)
+
+    try:
+        with open(output_path, "a", encoding="utf-8") as out, pool_class(max_workers=workers) as pool:
+            if needs_newline:
+                out.write("\n")
+
+            def write_results(done):
+                for future in done:
+                    record = future.result()
+                    out.write(json.dumps(record) + "\n")
+                    out.flush()
+                    if scores is not None:
+                        scores.add(record)
+                    summary[record["status"]] += 1
+                    finished = summary["ok"] + summary["error"]
+                    print(f"[{finished}/{len(pending)}] {record['status']}: {record['id']} ({record['elapsed']}s)", file=log)
+
+            # Keep a bounded number of submissions in flight so memory stays under control
+            in_flight = set()
+            for item in pending:
+                if len(in_flight) >= workers * 2:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    write_results(done)
+                in_flight.add(pool.submit(process_item, item, mode, prompt, reports_dir, report_format, bypass_cache, limits))
+            while in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                write_results(done)
+    finally:
+        # An interrupted run still leaves a readable score file with every row group written so far
+        if scores is not None:
+            scores.close()
+
+    print(f"Done: {summary['ok']} ok, {summary['error']} failed, {summary['skipped']} skipped", file=log)
+    # Process workers keep their own timings and usage, so these breakdowns are only available for thread workers
+    for row in metrics.summary():
+        print(f"  {row['stage']:<18} {row['mode']:<14} n={row['count']:<5} p50={row['p50']:.3f}s p95={row['p95']:.3f}s p99={row['p99']:.3f}s", file=log)
+    for row in metrics.usage():
+        print(f"  tokens {row['mode']:<14} n={row['requests']:<5} in={row['input_tokens']:<9,} out={row['output_tokens']:,}", file=log)
+    if scores_dir:
+        print_summary(portfolio_summary(scores_dir), log)
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m medusa.batch", description="Run a MEDUSA AI analysis mode over many images without the Streamlit UI.")
+    parser.add_argument("source", help="Directory of images, or a manifest (.txt with one path per line, or .jsonl with 'path' and optional 'id'/'prompt').")
+    parser.add_argument("--mode", required=True, choices=sorted(DEFAULT_PROMPTS), help="Analysis mode to run.")
+    parser.add_argument("--output", required=True, help="JSONL results file. Re-running with the same file resumes where the last run stopped.")
+    parser.add_argument("--prompt-file", help="File containing a prompt to use instead of the mode's default prompt.")
+    parser.add_argument("--reports-dir", help="Write pathology PNG or imaging PDF reports to this directory.")
+    parser.add_argument("--report-format", default="Format 1", help="Imaging PDF report format.")
+    parser.add_argument("--workers", type=int, default=4, help="Number of concurrent workers.")
+    parser.add_argument(
+        "--executor", choices=["thread", "process"], default="thread",
+        help="Run workers as threads or processes. With processes, --rpm and MEDUSA_RPM/MEDUSA_TPM are divided evenly between the workers.",
+    )
+    parser.add_argument(
+        "--rpm", type=float,
+        help="Maximum upstream model calls per minute, across all workers. Every page of a document, retry and hedge counts as a call. Also capped by MEDUSA_RPM.",
+    )
+    parser.add_argument("--no-cache", action="store_true", help="Always call the model, ignoring cached results.")
+    parser.add_argument("--scores", help="Insurance mode: also write risk percentages and justifications to this directory as Parquet, and print portfolio statistics.")
+    args = parser.parse_args(argv)
+    if args.scores and args.mode != "insurance":
+        parser.error("--scores is only available in insurance mode")
+
+    load_dotenv()
+    if os.getenv("MEDUSA_METRICS_PORT"):
+        start_metrics_server(int(os.getenv("MEDUSA_METRICS_PORT")), os.getenv("MEDUSA_METRICS_HOST", "127.0.0.1"))
+    prompt = None
+    if args.prompt_file:
+        with open(args.prompt_file, encoding="utf-8") as prompt_file:
+            prompt = prompt_file.read()
+    summary = run_batch(
+        discover_items(args.source), args.mode, args.output, prompt=prompt, workers=args.workers,
+        executor=args.executor, requests_per_minute=args.rpm, reports_dir=args.reports_dir,
+        report_format=args.report_format, bypass_cache=args.no_cache, scores_dir=args.scores,
+    )
+    return 1 if summary["error"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,203 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Function to hash the decoded pixels of an image, independent of file format and metadata
+def image_fingerprint(image):
+    digest = hashlib.sha256()
+    digest.update(image.mode.encode())
+    digest.update(repr(image.size).encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+# Function to normalize a prompt so whitespace-only edits share a cache entry
+def normalize_prompt(prompt):
+    return " ".join(prompt.split())
+
+# Function to build the cache key from the image hash, the prompt, the model name and the generation settings
+# (output cap, temperature, ...) the answer is made with
+def make_cache_key(image_hash, prompt, model_name, profile=None):
+    raw = "\x00".join([image_hash, normalize_prompt(prompt), model_name, json.dumps(profile or {}, sort_keys=True)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+# In-process LRU tier with size and TTL eviction
+class MemoryTier:
+    def __init__(self, max_entries=256, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, created = entry
+            if self.ttl and time.time() - created > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value, created=None):
+        with self._lock:
+            self._entries[key] = (value, created or time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+# SQLite tier shared by every session and process on the host
+class DiskTier:
+    def __init__(self, path, max_entries=10000, ttl=7 * 24 * 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, created = row
+            if self.ttl and now - created > self.ttl:
+                self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE results SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return value, created
+
+    def put(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            self._conn.execute(
+                "DELETE FROM results WHERE key IN ("
+                "SELECT key FROM results ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM results")
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+# Two-tier result cache: memory first, then disk, with hit/miss counters for operators.
+# `near_duplicates` optionally indexes analyzed images by perceptual hash so earlier results can be offered
+# for re-photographed or re-compressed copies.
+class ResultCache:
+    def __init__(self, memory, disk=None, near_duplicates=None):
+        self.memory = memory
+        self.disk = disk
+        self.near_duplicates = near_duplicates
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "bypasses": 0, "stores": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not None:
+            self._count("memory_hits")
+            return value
+        if self.disk is not None:
+            row = self.disk.get(key)
+            if row is not None:
+                value, created = row
+                self.memory.put(key, value, created)
+                self._count("disk_hits")
+                return value
+        self._count("misses")
+        return None
+
+    # Function to read an entry without counting a hit or miss, for speculative lookups
+    def peek(self, key):
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            row = self.disk.get(key)
+            if row is not None:
+                value = row[0]
+        return value
+
+    def put(self, key, value):
+        self.memory.put(key, value)
+        if self.disk is not None:
+            self.disk.put(key, value)
+        self._count("stores")
+
+    def record_bypass(self):
+        self._count("bypasses")
+
+    # Function to drop every stored analysis, and the image hashes that would offer them for near-duplicates
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+        if self.near_duplicates is not None:
+            self.near_duplicates.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        stats["memory_entries"] = len(self.memory)
+        stats["disk_entries"] = len(self.disk) if self.disk is not None else 0
+        stats["image_hashes"] = len(self.near_duplicates) if self.near_duplicates is not None else 0
+        return stats
+
+# Function to build the result cache from environment settings
+def cache_from_env():
+    memory = MemoryTier(
+        max_entries=int(os.getenv("MEDUSA_CACHE_MEMORY_ENTRIES", "256")),
+        ttl=float(os.getenv("MEDUSA_CACHE_MEMORY_TTL", "3600")),
+    )
+    disk = None
+    disk_path = os.getenv("MEDUSA_CACHE_PATH", os.path.join(".medusa_cache", "results.sqlite3"))
+    if disk_path:
+        disk = DiskTier(
+            disk_path,
+            max_entries=int(os.getenv("MEDUSA_CACHE_DISK_ENTRIES", "10000")),
+            ttl=float(os.getenv("MEDUSA_CACHE_DISK_TTL", str(7 * 24 * 3600))),
+        )
+    near_duplicates = None
+    if os.getenv("MEDUSA_NEAR_DUPLICATES", "1") != "0":
+        # numpy (via the index) is only loaded once a cache is actually built
+        from medusa.similar import PerceptualIndex
+
+        near_duplicates = PerceptualIndex(max_entries=int(os.getenv("MEDUSA_NEAR_DUPLICATE_ENTRIES", "500000")))
+    return ResultCache(memory, disk, near_duplicates)
@@ -0,0 +1,58 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from medusa.analysis import analysis_key, ensure_prepared, map_pages, merge_page_analyses, run_analysis
+from medusa.documents import Document
+from medusa.metrics import with_current_context
+from medusa.prompts import COMBINED_TASKS, DEFAULT_PROMPTS, build_combined_prompt, section_end, section_start
+
+# Function to split a combined response into per-task texts; a task maps to None if its section is missing or empty
+def parse_combined_response(text, tasks=COMBINED_TASKS):
+    sections = {}
+    for task in tasks:
+        start = text.find(section_start(task))
+        if start < 0:
+            sections[task] = None
+            continue
+        body_start = start + len(section_start(task))
+        end = text.find(section_end(task), body_start)
+        if end < 0:
+            # Without its end marker a section runs until the next section starts; one that runs to the end of
+            # the response may have been cut off, so it is not trusted
+            following = [text.find(section_start(other), body_start) for other in tasks if other != task]
+            following = [position for position in following if position >= 0]
+            if not following:
+                sections[task] = None
+                continue
+            end = min(following)
+        sections[task] = text[body_start:end].strip() or None
+    return sections
+
+# Function to answer several document tasks with one model call on one image; tasks whose section could not be
+# parsed fall back to their own call. Returns (sections by task, tasks that needed a fallback call).
+def run_combined_analysis(backend, cache, image, tasks=COMBINED_TASKS, prompts=None, bypass_cache=False):
+    prompts = prompts or DEFAULT_PROMPTS
+    image = ensure_prepared(image)
+    response = run_analysis(backend, cache, image, build_combined_prompt(tasks, prompts), bypass_cache)
+    sections = parse_combined_response(response, tasks)
+
+    # Seed each task's own cache entry, so opening that task's page on the same document is a cache hit
+    for task, text in sections.items():
+        if text is not None:
+            cache.put(analysis_key(image.fingerprint, prompts[task], backend.name, task), text)
+
+    failed = [task for task in tasks if sections[task] is None]
+    if failed:
+        with ThreadPoolExecutor(max_workers=len(failed), thread_name_prefix="medusa-fallback") as executor:
+            fallbacks = {task: executor.submit(with_current_context(run_analysis), backend, cache, image, prompts[task], bypass_cache) for task in failed}
+            for task, future in fallbacks.items():
+                sections[task] = future.result()
+    return sections, failed
+
+# Function to run the combined analysis on an image or every page of a document, merging the pages per task
+def run_combined_upload(backend, cache, upload, tasks=COMBINED_TASKS, prompts=None, bypass_cache=False, on_page=None):
+    if not isinstance(upload, Document):
+        return run_combined_analysis(backend, cache, upload, tasks, prompts, bypass_cache)
+    pages = map_pages(upload, lambda page: run_combined_analysis(backend, cache, page, tasks, prompts, bypass_cache), on_page=on_page)
+    sections = {task: merge_page_analyses([page_sections[task] for page_sections, _ in pages]) for task in tasks}
+    failed = sorted({task for _, page_failed in pages for task in page_failed}, key=tasks.index)
+    return sections, failed
@@ -0,0 +1,151 @@
+import io
+import threading
+from collections import OrderedDict
+
+from PIL import Image as PILImage
+
+from medusa.large_image import MAX_ROI_DIMENSION, PREPARED_CACHE_SIZE, region_box
+from medusa.metrics import span
+from medusa.preprocess import bitmap_bytes, format_bytes, preprocess_image
+
+# Window/level presets as (center, width) in Hounsfield units; "Default" uses the file's own window
+WINDOW_PRESETS = {
+    "Default": None,
+    "Lung": (-600, 1500),
+    "Mediastinum": (50, 350),
+    "Abdomen": (40, 400),
+    "Liver": (60, 160),
+    "Bone": (400, 1800),
+    "Brain": (40, 80),
+}
+PREVIEW_DIMENSION = 1024
+
+# Function to tell DICOM files apart by the "DICM" marker after the 128-byte preamble
+def is_dicom(data):
+    return data[128:132] == b"DICM"
+
+# Function to take the first value of a possibly multi-valued DICOM element
+def _first(value):
+    if value is None:
+        return None
+    try:
+        return float(value[0])
+    except TypeError:
+        return float(value)
+
+# Function to map modality values into 8-bit display values for a window center and width
+def apply_window(pixels, center, width):
+    import numpy as np
+
+    low = center - width / 2
+    high = center + width / 2
+    scaled = (np.clip(pixels, low, high) - low) * (255.0 / max(high - low, 1e-6))
+    return scaled.astype(np.uint8)
+
+# A DICOM upload: the header is parsed up front, pixel data is decoded one frame at a time on first use,
+# and only the most recently used frame is kept at full resolution
+class DicomImage:
+    def __init__(self, data, mode="imaging"):
+        # pydicom is only needed once someone uploads a DICOM file
+        import pydicom
+
+        self.data = data
+        self.mode = mode
+        header = pydicom.dcmread(io.BytesIO(data), stop_before_pixels=True)
+        self.modality = header.get("Modality", "OT")
+        self.rows = int(header.Rows)
+        self.columns = int(header.Columns)
+        self.frame_count = int(header.get("NumberOfFrames", 1) or 1)
+        self.photometric = header.get("PhotometricInterpretation", "MONOCHROME2")
+        self.slope = float(header.get("RescaleSlope", 1) or 1)
+        self.intercept = float(header.get("RescaleIntercept", 0) or 0)
+        center, width = _first(header.get("WindowCenter")), _first(header.get("WindowWidth"))
+        self.default_window = (center, width) if center is not None and width else None
+        self.description = str(header.get("SeriesDescription") or header.get("StudyDescription") or "")
+        self._frame = None
+        self._previews = OrderedDict()
+        self._prepared = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def size(self):
+        return self.columns, self.rows
+
+    # Function to decode one frame's pixel data, reusing the last decoded frame
+    def _pixels(self, frame):
+        from pydicom.pixels import pixel_array
+
+        if self._frame is None or self._frame[0] != frame:
+            with span("decode", self.mode):
+                pixels = pixel_array(io.BytesIO(self.data), index=frame if self.frame_count > 1 else None)
+            self._frame = (frame, pixels)
+        return self._frame[1]
+
+    # Function to render one frame at full resolution as an 8-bit image with the given window preset
+    def render(self, window="Default", frame=0):
+        import numpy as np
+
+        with self._lock:
+            pixels = self._pixels(frame)
+            if pixels.ndim == 3:
+                # Colour images (ultrasound, photographs) are shown as stored
+                return PILImage.fromarray(pixels.astype(np.uint8), "RGB")
+            values = pixels.astype(np.float32) * self.slope + self.intercept
+            preset = WINDOW_PRESETS.get(window) or self.default_window
+            if preset is None:
+                # No window in the file: stretch to the frame's own value range
+                low, high = float(values.min()), float(values.max())
+                preset = ((low + high) / 2, high - low)
+            display = apply_window(values, *preset)
+            if self.photometric == "MONOCHROME1":
+                display = 255 - display
+            return PILImage.fromarray(display, "L")
+
+    # Function to get a downsampled preview for display
+    def preview(self, window="Default", frame=0):
+        key = (window, frame)
+        if key not in self._previews:
+            image = self.render(window, frame)
+            image.thumbnail((PREVIEW_DIMENSION, PREVIEW_DIMENSION), PILImage.Resampling.LANCZOS)
+            self._previews[key] = image
+            while len(self._previews) > PREPARED_CACHE_SIZE:
+                self._previews.popitem(last=False)
+        return self._previews[key]
+
+    # Function to prepare the image sent to the model; `roi` is (left, top, right, bottom) as fractions
+    def prepare(self, roi=None, window="Default", frame=0):
+        key = (roi, window, frame)
+        if key not in self._prepared:
+            image = self.render(window, frame)
+            max_dimension = None
+            if roi is not None:
+                # Regions keep their full resolution instead of being reduced to the profile's size
+                image = image.crop(region_box(self.size, roi))
+                max_dimension = MAX_ROI_DIMENSION
+            self._prepared[key] = preprocess_image(image, self.mode, original_bytes=len(self.data), max_dimension=max_dimension)
+            while len(self._prepared) > PREPARED_CACHE_SIZE:
+                self._prepared.popitem(last=False)
+        self._prepared.move_to_end(key)
+        return self._prepared[key]
+
+    @property
+    def image(self):
+        return self.preview()
+
+    @property
+    def payload_bytes(self):
+        return len(self.data)
+
+    # Only what has been decoded so far counts: the current frame, previews and prepared images
+    @property
+    def memory_bytes(self):
+        frame = self._frame
+        size = len(self.data) + (frame[1].nbytes if frame is not None else 0)
+        size += sum(bitmap_bytes(preview) for preview in list(self._previews.values()))
+        return size + sum(prepared.memory_bytes for prepared in list(self._prepared.values()))
+
+    # Function to summarize the study for display
+    def describe(self):
+        frames = f", {self.frame_count} frames" if self.frame_count > 1 else ""
+        description = f" {self.description}" if self.description else ""
+        return f"DICOM {self.modality}{description}: {self.columns}×{self.rows}{frames}, {format_bytes(len(self.data))}"
@@ -0,0 +1,130 @@
+import os
+import threading
+from contextlib import nullcontext
+
+from medusa.dicom import DicomImage, is_dicom
+from medusa.large_image import LARGE_IMAGE_PIXELS, MAX_IMAGE_PIXELS, LargeImage, _decode_slots
+from medusa.metrics import span
+from medusa.preprocess import PREPROCESS_PROFILES, DEFAULT_PROFILE, format_bytes, load_image, open_image, preprocess_image
+
+DOCUMENT_TYPES = ["pdf", "tif", "tiff"]
+MAX_DOCUMENT_PAGES = int(os.getenv("MEDUSA_MAX_DOCUMENT_PAGES", "50"))
+PAGE_CONCURRENCY = int(os.getenv("MEDUSA_PAGE_CONCURRENCY", "4"))
+# Upper bound on PDF rasterization resolution; pages are rendered just large enough for the mode's profile
+MAX_PDF_DPI = 300
+
+# pdfium is not thread-safe, so page rendering is serialized; the model calls still run in parallel
+_pdfium_lock = threading.Lock()
+
+# Function to tell multi-page document formats apart from plain images by their magic bytes
+def document_kind(data):
+    if data[:5] == b"%PDF-":
+        return "pdf"
+    if data[:4] in (b"II*\x00", b"MM\x00*"):
+        return "tiff"
+    return None
+
+# Function to pick the decompression-bomb limit uploads of a mode are opened with; only the imaging mode, which
+# tiles large scans, accepts images past Pillow's default limit
+def pixel_limit(mode):
+    return MAX_IMAGE_PIXELS if mode == "imaging" else None
+
+# A multi-page PDF or TIFF upload whose pages are rasterized one at a time, only when asked for
+class Document:
+    def __init__(self, data, mode=DEFAULT_PROFILE):
+        self.data = data
+        self.kind = document_kind(data)
+        self.mode = mode
+        if self.kind == "pdf":
+            # pdfium (and its import) is only needed once someone uploads a PDF
+            import pypdfium2 as pdfium
+            with _pdfium_lock:
+                self._pdf = pdfium.PdfDocument(data)
+                self.page_count = len(self._pdf)
+        else:
+            self._pdf = None
+            self.page_count = getattr(open_image(data, pixel_limit(mode)), "n_frames", 1)
+        if self.page_count > MAX_DOCUMENT_PAGES:
+            raise ValueError(f"Documents are limited to {MAX_DOCUMENT_PAGES} pages; this one has {self.page_count}.")
+        self._first_page = None
+        self._picked = None
+
+    # Function to rasterize and preprocess one page; the first page is kept since it doubles as the preview
+    def page(self, index):
+        if index == 0 and self._first_page is not None:
+            return self._first_page
+        if self.kind == "pdf":
+            with span("rasterize", self.mode):
+                page = self._render_pdf_page(index)
+            prepared = preprocess_image(page, self.mode)
+        else:
+            max_pixels = pixel_limit(self.mode)
+            frame = open_image(self.data, max_pixels)
+            frame.seek(index)
+            # A scan-sized frame is decoded whole, so it waits for a slot like a large image does
+            with _decode_slots if frame.width * frame.height > LARGE_IMAGE_PIXELS else nullcontext():
+                prepared = preprocess_image(load_image(frame, max_pixels), self.mode)
+        if index == 0:
+            self._first_page = prepared
+        return prepared
+
+    # Function to prepare the page picked for analysis; the latest pick is kept across reruns
+    def prepare(self, page=0):
+        picked = self._picked
+        if picked is None or picked[0] != page:
+            picked = (page, self.page(page))
+            self._picked = picked
+        return picked[1]
+
+    def _render_pdf_page(self, index):
+        max_dimension = PREPROCESS_PROFILES.get(self.mode, PREPROCESS_PROFILES[DEFAULT_PROFILE])["max_dimension"]
+        with _pdfium_lock:
+            page = self._pdf[index]
+            try:
+                width, height = page.get_size()
+                scale = min(max_dimension / max(width, height), MAX_PDF_DPI / 72)
+                return page.render(scale=scale).to_pil()
+            finally:
+                page.close()
+
+    @property
+    def image(self):
+        return self.page(0).image
+
+    @property
+    def payload_bytes(self):
+        return len(self.data)
+
+    @property
+    def memory_bytes(self):
+        first_page, picked = self._first_page, self._picked
+        size = len(self.data) + (first_page.memory_bytes if first_page is not None else 0)
+        if picked is not None and picked[1] is not first_page:
+            size += picked[1].memory_bytes
+        return size
+
+    # Function to summarize the document for display
+    def describe(self):
+        pages = "1 page" if self.page_count == 1 else f"{self.page_count} pages"
+        shown = self._picked[0] + 1 if self._picked is not None else 1
+        return f"{self.kind.upper()} document: {pages}, {format_bytes(len(self.data))} (page {shown} shown)"
+
+# Function to load encoded upload bytes as a DICOM study, a Document if they are a multi-page PDF/TIFF, a tiled
+# LargeImage if they are a very large single image, otherwise as a single preprocessed image
+def prepare_bytes(data, mode=DEFAULT_PROFILE):
+    if is_dicom(data):
+        return DicomImage(data, mode)
+    kind = document_kind(data)
+    if kind == "pdf":
+        return Document(data, mode)
+    # Opening only reads the header, so the size is known before any pixels are decoded
+    image = open_image(data, pixel_limit(mode))
+    if kind == "tiff" and getattr(image, "n_frames", 1) > 1:
+        return Document(data, mode)
+    if image.width * image.height > LARGE_IMAGE_PIXELS:
+        return LargeImage(image, mode, original_bytes=len(data))
+    return preprocess_image(image, mode, original_bytes=len(data))
+
+# Function to load an uploaded file as a Document or a single preprocessed image
+def prepare_upload(uploaded_file, mode=DEFAULT_PROFILE):
+    return prepare_bytes(uploaded_file.getvalue(), mode)
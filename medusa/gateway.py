@@ -0,0 +1,203 @@
+import hashlib
+import os
+import random
+import threading
+import time
+
+from medusa.backends import IMAGE_TOKENS, BackendError, current_model_request, estimate_tokens
+from medusa.cache import normalize_prompt
+from medusa.metrics import current_session, metrics
+from medusa.ratelimit import TokenBucket
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+# google.api_core and requests exception names for quota, overload and transient network errors
+RETRYABLE_ERROR_NAMES = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "InternalServerError",
+    "DeadlineExceeded", "GatewayTimeout", "Aborted", "ConnectionError", "Timeout",
+}
+
+# Function to decide whether a failed model call is worth retrying
+def is_retryable(error):
+    if isinstance(error, BackendError):
+        return error.retryable
+    if type(error).__name__ in RETRYABLE_ERROR_NAMES:
+        return True
+    code = getattr(error, "code", None)
+    return isinstance(code, int) and code in RETRYABLE_STATUS_CODES
+
+# One upstream call that identical concurrent requests wait on
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+# Process-wide gateway in front of a backend: rate limiting, retries with backoff and single-flight coalescing
+class ModelGateway:
+    def __init__(self, backend, requests_per_minute=None, tokens_per_minute=None, max_retries=3,
+                 base_delay=1.0, max_delay=30.0):
+        self.backend = backend
+        self.name = backend.name
+        # Allow bursts of up to ten seconds' worth of budget, e.g. a ward uploading at shift change
+        self.request_bucket = TokenBucket(requests_per_minute, max(1.0, requests_per_minute / 6)) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute, max(1.0, tokens_per_minute / 6)) if tokens_per_minute else None
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._random = random.Random()
+        self._stats = {
+            "requests": 0, "upstream_calls": 0, "extra_calls": 0, "extra_denied": 0, "coalesced": 0, "retries": 0, "failures": 0,
+            "queue_depth": 0, "max_queue_depth": 0, "in_flight": 0, "total_wait": 0.0, "max_wait": 0.0,
+        }
+        # Backends that make upstream calls of their own (hedges, tier fallbacks, upgrade passes) admit them here
+        if hasattr(backend, "limiter"):
+            backend.limiter = self
+
+    def _add(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    # Function to wait for request and token budget; this wait is what queue depth and wait time measure
+    def _admit(self, prompt):
+        with self._lock:
+            self._stats["queue_depth"] += 1
+            self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], self._stats["queue_depth"])
+        started = time.monotonic()
+        try:
+            if self.request_bucket:
+                self.request_bucket.acquire()
+            if self.token_bucket:
+                self.token_bucket.acquire(estimate_tokens(prompt) + IMAGE_TOKENS)
+        finally:
+            waited = time.monotonic() - started
+            metrics.observe("gateway_wait", current_model_request().mode, waited, session=current_session())
+            with self._lock:
+                self._stats["queue_depth"] -= 1
+                self._stats["total_wait"] += waited
+                self._stats["max_wait"] = max(self._stats["max_wait"], waited)
+
+    # Function to take request and token budget only if both are available right now
+    def _try_admit(self, prompt):
+        if self.request_bucket and self.request_bucket.try_acquire() > 0:
+            return False
+        tokens = estimate_tokens(prompt) + IMAGE_TOKENS
+        if self.token_bucket and self.token_bucket.try_acquire(tokens) > 0:
+            if self.request_bucket:
+                self.request_bucket.refund()
+            return False
+        return True
+
+    # Function to admit an upstream call the backend makes beyond the one the gateway admitted for the request.
+    # With `wait=False` the call is only admitted if the rate limits allow it right now; returns whether it was.
+    def admit_extra(self, prompt, wait=True):
+        if wait:
+            self._admit(prompt)
+        elif not self._try_admit(prompt):
+            self._add("extra_denied")
+            return False
+        self._add("upstream_calls")
+        self._add("extra_calls")
+        return True
+
+    # Function to give back the budget of an extra call that was admitted but then never made
+    def release_extra(self, prompt):
+        if self.request_bucket:
+            self.request_bucket.refund()
+        if self.token_bucket:
+            self.token_bucket.refund(estimate_tokens(prompt) + IMAGE_TOKENS)
+        self._add("upstream_calls", -1)
+        self._add("extra_calls", -1)
+
+    # Function to compute the next backoff delay (exponential with full jitter)
+    def _backoff(self, attempt):
+        return self._random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    # Function to run one upstream call with admission control and retries
+    def _call(self, prompt, call):
+        attempt = 0
+        while True:
+            self._admit(prompt)
+            self._add("upstream_calls")
+            self._add("in_flight")
+            try:
+                return call()
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    self._add("failures")
+                    raise
+            finally:
+                self._add("in_flight", -1)
+            self._add("retries")
+            time.sleep(self._backoff(attempt))
+            attempt += 1
+
+    def _flight_key(self, prompt, blob):
+        digest = hashlib.sha256(blob["data"]).hexdigest() if blob else ""
+        return digest, normalize_prompt(prompt)
+
+    def generate(self, prompt, blob):
+        self._add("requests")
+        key = self._flight_key(prompt, blob)
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self._stats["coalesced"] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            # The leader records the call's usage; followers get a copy marked as shared
+            return flight.result.shared()
+
+        try:
+            flight.result = self._call(prompt, lambda: self.backend.generate(prompt, blob))
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    # Streams are not coalesced; a failed stream is retried only if it fails before its first chunk
+    def stream(self, prompt, blob):
+        self._add("requests")
+
+        def first_chunk():
+            chunks = iter(self.backend.stream(prompt, blob))
+            return chunks, next(chunks, None)
+
+        chunks, chunk = self._call(prompt, first_chunk)
+        while chunk is not None:
+            yield chunk
+            chunk = next(chunks, None)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        admitted = stats["upstream_calls"]
+        stats["average_wait"] = stats["total_wait"] / admitted if admitted else 0.0
+        return stats
+
+# Function to wrap a backend in a gateway configured from environment settings. `max_requests_per_minute` caps the
+# request limit further; `processes` splits both limits between that many processes that each run a gateway.
+def gateway_from_env(backend, max_requests_per_minute=None, processes=1):
+    requests_per_minute = float(os.getenv("MEDUSA_RPM") or 0) or None
+    tokens_per_minute = float(os.getenv("MEDUSA_TPM") or 0) or None
+    if max_requests_per_minute:
+        requests_per_minute = min(requests_per_minute or max_requests_per_minute, max_requests_per_minute)
+    return ModelGateway(
+        backend,
+        requests_per_minute=requests_per_minute / processes if requests_per_minute else None,
+        tokens_per_minute=tokens_per_minute / processes if tokens_per_minute else None,
+        max_retries=int(os.getenv("MEDUSA_MAX_RETRIES", "3")),
+        base_delay=float(os.getenv("MEDUSA_RETRY_BASE_DELAY", "1.0")),
+        max_delay=float(os.getenv("MEDUSA_RETRY_MAX_DELAY", "30")),
+    )
@@ -0,0 +1,234 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from medusa.backends import BackendError, create_backend, current_model_request
+from medusa.metrics import metrics, percentile, with_current_context
+from medusa.ratelimit import RatioBudget
+
+# Recent successful latencies kept per tier, mode and call kind for the hedge delay
+LATENCY_SAMPLES = 200
+# With a fast tier and a deadline, the fast model gets this share of the deadline before the full model takes over
+FAST_TIER_SHARE = 0.5
+# Upstream attempts (first calls, hedges, fallbacks and upgrade passes) run on a pool of at most this many threads
+ATTEMPT_WORKERS = int(os.getenv("MEDUSA_HEDGE_WORKERS", "64"))
+# Seconds a model call may take unless its mode sets its own deadline. Upstream calls cannot be cancelled, so the
+# deadline is also passed down as the upstream request timeout; that is what frees the pool threads of attempts
+# that lost the race or stalled.
+DEFAULT_DEADLINE = 120.0
+
+# Raised when no tier answered within the mode's deadline; not retried, the deadline is the user's wait
+class ModelDeadlineExceeded(BackendError):
+    def __init__(self, deadline):
+        super().__init__(f"The model did not answer within {deadline:g} seconds. Please try again.", retryable=False)
+
+# Per-mode deadlines, hedged requests and an optional fast tier in front of a backend. A call still running after
+# the observed p95 latency of its mode gets one duplicate and the first answer wins. Duplicates and upgrade passes
+# are limited to a share of all calls, so they cannot multiply load while the upstream is struggling; behind a
+# gateway (`limiter`), every upstream call beyond the one it admitted also goes through its rate limits. With a
+# fast tier, the fast model answers first and the full model is the fallback (and, with `upgrade`, re-answers in
+# the background).
+class HedgedBackend:
+    def __init__(self, backend, fast_backend=None, deadlines=None, default_deadline=DEFAULT_DEADLINE, hedge_quantile=0.95,
+                 hedge_budget=0.05, min_samples=20, min_hedge_delay=0.05, upgrade=False, max_workers=ATTEMPT_WORKERS):
+        self.backend = backend
+        self.fast_backend = fast_backend
+        # Tiered answers are cached apart from answers of the full model alone
+        self.name = f"{fast_backend.name}>{backend.name}" if fast_backend else backend.name
+        self.deadlines = deadlines or {}
+        self.default_deadline = default_deadline
+        self.hedge_quantile = hedge_quantile
+        self.budget = RatioBudget(hedge_budget)
+        self.min_samples = min_samples
+        self.min_hedge_delay = min_hedge_delay
+        self.upgrade = upgrade
+        self.limiter = None
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="medusa-hedge")
+        self._latencies = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            "calls": 0, "hedges": 0, "hedge_wins": 0, "hedges_denied": 0, "fallbacks": 0,
+            "deadline_exceeded": 0, "upgrades": 0, "upgrades_skipped": 0, "upgrade_failures": 0,
+        }
+
+    def _add(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def deadline(self, mode):
+        return self.deadlines.get(mode, self.default_deadline)
+
+    def _observe(self, tier, mode, kind, seconds):
+        key = (tier.name, mode, kind)
+        with self._lock:
+            samples = self._latencies.get(key)
+            if samples is None:
+                samples = self._latencies[key] = deque(maxlen=LATENCY_SAMPLES)
+            samples.append(seconds)
+
+    # Function to get how long a call may run before it is hedged: the observed latency quantile, once known
+    def hedge_delay(self, tier, mode, kind):
+        if self.budget.ratio <= 0:
+            return None
+        with self._lock:
+            samples = sorted(self._latencies.get((tier.name, mode, kind), ()))
+        if len(samples) < self.min_samples:
+            return None
+        return max(self.min_hedge_delay, percentile(samples, self.hedge_quantile))
+
+    # Function to run one attempt on the attempt pool. Upstream calls cannot be cancelled, so a losing attempt
+    # finishes in the background (bounded by the upstream timeout) and still contributes its latency. Attempts
+    # are admitted by the limiter before they are submitted, so pool threads never wait for rate-limit budget.
+    def _start(self, tier, mode, kind, call):
+        def run():
+            started = time.monotonic()
+            result = call()
+            self._observe(tier, mode, kind, time.monotonic() - started)
+            return result
+
+        return self._executor.submit(with_current_context(run))
+
+    # Function to race one tier: start a call, add a duplicate once it runs past the hedge delay and return the
+    # first success. Raises the last error if every attempt failed, or ModelDeadlineExceeded at `deadline_at`.
+    # `extra` marks a call beyond the one the limiter admitted for the request (a tier fallback).
+    def _race(self, tier, mode, kind, call, prompt, deadline, deadline_at, extra=False):
+        if extra and self.limiter is not None:
+            # The request's own thread waits for the budget; a deadline that passes meanwhile still applies
+            self.limiter.admit_extra(prompt)
+            if deadline_at is not None and time.monotonic() >= deadline_at:
+                self.limiter.release_extra(prompt)
+                raise ModelDeadlineExceeded(deadline)
+        first = self._start(tier, mode, kind, call)
+        attempts = [first]
+        hedges = []
+        delay = self.hedge_delay(tier, mode, kind)
+        hedge_at = time.monotonic() + delay if delay is not None else None
+        error = None
+        try:
+            while attempts:
+                wake_at = min([moment for moment in (hedge_at, deadline_at) if moment is not None], default=None)
+                timeout = max(0.0, wake_at - time.monotonic()) if wake_at is not None else None
+                done, _ = wait(attempts, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    attempts.remove(future)
+                    if future.exception() is None:
+                        if future is not first:
+                            self._add("hedge_wins")
+                        return future.result()
+                    error = future.exception()
+                now = time.monotonic()
+                if attempts and deadline_at is not None and now >= deadline_at:
+                    raise ModelDeadlineExceeded(deadline)
+                if attempts and hedge_at is not None and now >= hedge_at:
+                    hedge_at = None
+                    # A hedge is only sent if both the hedge budget and the rate limits allow it right now
+                    if self.budget.try_spend() and (self.limiter is None or self.limiter.admit_extra(prompt, wait=False)):
+                        self._add("hedges")
+                        hedges.append(self._start(tier, mode, kind, call))
+                        attempts.append(hedges[-1])
+                    else:
+                        self._add("hedges_denied")
+            raise error
+        finally:
+            # Attempts still waiting for a pool thread are dropped once the race is decided
+            for future in attempts:
+                if future.cancel() and future in hedges:
+                    self._add("hedges", -1)
+                    if self.limiter is not None:
+                        self.limiter.release_extra(prompt)
+            sent = sum(1 for future in hedges if not future.cancelled())
+            if sent:
+                metrics.add("model_hedges", sent, mode=mode or "none")
+
+    # Function to run a call on each tier in turn until one answers; `make_call(tier)` builds the call
+    def _run(self, kind, prompt, make_call):
+        request = current_model_request()
+        self._add("calls")
+        self.budget.deposit()
+        deadline = self.deadline(request.mode)
+        request.timeout = deadline
+        started = time.monotonic()
+        tiers = [self.fast_backend, self.backend] if self.fast_backend else [self.backend]
+        for index, tier in enumerate(tiers):
+            last = index == len(tiers) - 1
+            tier_deadline = deadline if last or deadline is None else deadline * FAST_TIER_SHARE
+            try:
+                result = self._race(
+                    tier, request.mode, kind, make_call(tier), prompt, deadline,
+                    started + tier_deadline if tier_deadline is not None else None, extra=index > 0,
+                )
+            except ModelDeadlineExceeded:
+                if last:
+                    self._add("deadline_exceeded")
+                    raise
+                self._add("fallbacks")
+                continue
+            except Exception:
+                if last:
+                    raise
+                self._add("fallbacks")
+                continue
+            request.tier = tier.name
+            metrics.add("model_answers", tier=tier.name)
+            return result, request, tier
+
+    # Function to start the background upgrade pass after a fast-tier answer. Upgrades share the hedge budget and
+    # are skipped rather than queued when the rate limits have no room for them right now.
+    def _start_upgrade(self, request, prompt, blob):
+        if not self.budget.try_spend() or (self.limiter is not None and not self.limiter.admit_extra(prompt, wait=False)):
+            self._add("upgrades_skipped")
+            return
+        self._add("upgrades")
+        request.upgrade = self._start(self.backend, request.mode, "generate", lambda: self.backend.generate(prompt, blob))
+
+        def count_failure(future):
+            if future.cancelled() or future.exception() is not None:
+                self._add("upgrade_failures")
+
+        request.upgrade.add_done_callback(count_failure)
+
+    def generate(self, prompt, blob):
+        generation, request, tier = self._run("generate", prompt, lambda tier: lambda: tier.generate(prompt, blob))
+        if tier is self.fast_backend and self.upgrade:
+            self._start_upgrade(request, prompt, blob)
+        return generation
+
+    # Streams are hedged and bounded by the deadline up to their first chunk; after that the winner streams on
+    def stream(self, prompt, blob):
+        def make_call(tier):
+            def first_chunk():
+                chunks = iter(tier.stream(prompt, blob))
+                return chunks, next(chunks, None)
+            return first_chunk
+
+        (chunks, chunk), request, tier = self._run("stream", prompt, make_call)
+        if tier is self.fast_backend and self.upgrade:
+            self._start_upgrade(request, prompt, blob)
+        while chunk is not None:
+            yield chunk
+            chunk = next(chunks, None)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["hedge_budget"] = self.budget.available
+        return stats
+
+# Function to wrap a backend in the hedging and tiering layer configured from environment settings
+def hedging_from_env(backend, api_key=None):
+    fast_model = os.getenv("MEDUSA_FAST_MODEL")
+    default_deadline = os.getenv("MEDUSA_MODEL_DEADLINE", str(DEFAULT_DEADLINE))
+    prefix = "MEDUSA_MODEL_DEADLINE_"
+    deadlines = {key[len(prefix):].lower(): float(value) for key, value in os.environ.items() if key.startswith(prefix) and value}
+    return HedgedBackend(
+        backend,
+        fast_backend=create_backend(api_key=api_key, model_name=fast_model) if fast_model else None,
+        deadlines=deadlines,
+        default_deadline=float(default_deadline) if default_deadline else None,
+        hedge_quantile=float(os.getenv("MEDUSA_HEDGE_QUANTILE", "0.95")),
+        hedge_budget=float(os.getenv("MEDUSA_HEDGE_BUDGET", "0.05")),
+        min_samples=int(os.getenv("MEDUSA_HEDGE_MIN_SAMPLES", "20")),
+        upgrade=os.getenv("MEDUSA_TIER_UPGRADE", "0") == "1",
+    )
@@ -0,0 +1,20 @@
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+_session = None
+_session_lock = threading.Lock()
+
+# Function to get the shared HTTP session, so connections are pooled and reused across lookups
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers["User-Agent"] = "Mozilla/5.0 (compatible; MEDUSA-AI)"
+            _session = session
+        return _session
@@ -0,0 +1,219 @@
+import array
+import bisect
+import gzip
+import os
+import re
+import threading
+
+# The bundled file holds common ICD-10-CM codes; point this at the full CMS order file
+# (icd10cm_order_<year>.txt, optionally gzipped) for complete coverage
+BUNDLED_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "icd10cm_order.txt")
+ICD10_PATH = os.getenv("MEDUSA_ICD10_PATH") or BUNDLED_PATH
+# A code file with at least this many codes is taken as a complete release (CMS order files list about 97,000,
+# of which about 74,000 are billable); only then is a code missing from the index reported as invalid
+COMPLETE_RELEASE_CODES = 70000
+
+# ICD-10-CM codes are at most 7 characters once the dot is removed
+CODE_WIDTH = 7
+# A letter, two characters and an optional dotted extension, as codes are written in model output
+CODE_PATTERN = re.compile(r"\b([A-Z][0-9][0-9A-Z](?:\.[0-9A-Z]{1,4})?)\b")
+# Text before a dotless three-character code that marks it as a code on its own: the start of a line or table cell,
+# a list marker, emphasis or a label colon ("- O80: ...", "| O80 |", "Code: O80"), but not "vitamin B12"
+CODE_CONTEXT = re.compile(r"(?:^|[|:(\[])[\s*_>#•\-]*(?:\d+[.)]\s*)?$")
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+STOP_WORDS = frozenset(["a", "an", "and", "as", "at", "by", "for", "in", "of", "on", "or", "the", "to"])
+
+VALID = "valid"
+NON_BILLABLE = "non-billable"
+INVALID = "invalid"
+# A code missing from an index that is not a complete release may still be a valid code
+NOT_INDEXED = "not in local index"
+
+_default_index = None
+_default_lock = threading.Lock()
+
+# Function to turn "e11.9" or "E119" into the dotless upper-case form used as the index key
+def normalize_code(code):
+    return code.strip().upper().replace(".", "")
+
+# Function to write a dotless code the usual way, with a dot after the category
+def format_code(code):
+    return f"{code[:3]}.{code[3:]}" if len(code) > 3 else code
+
+def _words(text):
+    return [word for word in WORD_PATTERN.findall(text.lower()) if word not in STOP_WORDS]
+
+# Function to test membership in a sorted posting list
+def _contains(posting, position):
+    index = bisect.bisect_left(posting, position)
+    return index < len(posting) and posting[index] == position
+
+# Fixed-width view of the packed code block, so bisect can search it without a list of strings
+class _PackedCodes:
+    def __init__(self, block, count):
+        self.block = block
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        start = index * CODE_WIDTH
+        return self.block[start:start + CODE_WIDTH]
+
+# In-memory ICD-10 index. Codes are packed into one sorted fixed-width byte block, so an exact lookup is a
+# binary search and a prefix (every code below a category) is one contiguous range of it. Descriptions share
+# one string with an offset table, and an inverted index maps description words to code positions.
+# Only a `complete` index (a full code release) reports codes it does not hold as invalid.
+class ICD10Index:
+    def __init__(self, entries, complete=False, source=None):
+        entries = sorted((normalize_code(code), billable, description) for code, billable, description in entries)
+        self.complete = complete
+        self.source = source
+        self._codes = _PackedCodes(b"".join(code.ljust(CODE_WIDTH).encode("ascii") for code, _, _ in entries), len(entries))
+        self._billable = bytes(1 if billable else 0 for _, billable, _ in entries)
+        self._text = "".join(description for _, _, description in entries)
+        self._offsets = array.array("I", [0])
+        postings = {}
+        for position, (_, _, description) in enumerate(entries):
+            self._offsets.append(self._offsets[-1] + len(description))
+            for word in set(_words(description)):
+                posting = postings.get(word)
+                if posting is None:
+                    posting = postings[word] = array.array("I")
+                posting.append(position)
+        self._postings = postings
+        self._vocabulary = sorted(postings)
+
+    def __len__(self):
+        return len(self._codes)
+
+    def _code(self, position):
+        return self._codes[position].decode("ascii").rstrip()
+
+    def _entry(self, position):
+        return {
+            "code": format_code(self._code(position)),
+            "description": self._text[self._offsets[position]:self._offsets[position + 1]],
+            "billable": bool(self._billable[position]),
+        }
+
+    def _position(self, code):
+        key = normalize_code(code).ljust(CODE_WIDTH).encode("ascii", "replace")
+        position = bisect.bisect_left(self._codes, key)
+        if position < len(self._codes) and self._codes[position] == key:
+            return position
+        return None
+
+    # Function to find the positions of every code starting with a prefix (including the prefix itself)
+    def _prefix_range(self, prefix):
+        key = normalize_code(prefix).encode("ascii", "replace")
+        return bisect.bisect_left(self._codes, key), bisect.bisect_left(self._codes, key + b"\x7f")
+
+    # Function to look one code up; returns its entry or None
+    def lookup(self, code):
+        position = self._position(code)
+        return None if position is None else self._entry(position)
+
+    # Function to list the codes below a category or subcategory
+    def children(self, code, billable_only=False, limit=None):
+        start, end = self._prefix_range(code)
+        found = []
+        for position in range(start, end):
+            if self._code(position) == normalize_code(code) or (billable_only and not self._billable[position]):
+                continue
+            found.append(self._entry(position))
+            if limit is not None and len(found) >= limit:
+                break
+        return found
+
+    # Function to check one code; missing codes suggest their closest existing parent and headers suggest
+    # billable codes below them
+    def validate(self, code):
+        normalized = normalize_code(code)
+        entry = self.lookup(normalized)
+        if entry is not None and entry["billable"]:
+            return dict(entry, status=VALID, suggestions=[])
+        if entry is not None:
+            return dict(entry, status=NON_BILLABLE, suggestions=self.children(normalized, billable_only=True, limit=3))
+        missing = {"code": format_code(normalized), "description": None, "billable": False, "status": INVALID if self.complete else NOT_INDEXED}
+        for length in range(len(normalized) - 1, 2, -1):
+            parent = self.lookup(normalized[:length])
+            if parent is not None:
+                return dict(missing, suggestions=[parent])
+        return dict(missing, suggestions=[])
+
+    # Function to find and check every code mentioned in a text, in order of first mention. Dotless
+    # three-character matches ("B12" in "vitamin B12") are only taken when they are indexed codes or
+    # written as codes of their own.
+    def check_text(self, text):
+        checked = []
+        seen = set()
+        text = text.upper()
+        for match in CODE_PATTERN.finditer(text):
+            normalized = normalize_code(match.group(1))
+            if normalized in seen:
+                continue
+            if "." not in match.group(1) and self._position(normalized) is None:
+                line_start = text.rfind("\n", 0, match.start()) + 1
+                if not CODE_CONTEXT.search(text[line_start:match.start()]):
+                    continue
+            seen.add(normalized)
+            checked.append(self.validate(normalized))
+        return checked
+
+    # Function to search descriptions by keywords; every word must match the start of a description word
+    def search(self, query, limit=20):
+        # A query that looks like a code searches the code prefix instead
+        if CODE_PATTERN.fullmatch(query.strip().upper()):
+            start, end = self._prefix_range(query)
+            return [self._entry(position) for position in range(start, min(end, start + limit))]
+        candidates = []
+        for word in _words(query):
+            start = bisect.bisect_left(self._vocabulary, word)
+            end = bisect.bisect_left(self._vocabulary, word + "\x7f")
+            postings = [self._postings[vocabulary_word] for vocabulary_word in self._vocabulary[start:end]]
+            if not postings:
+                return []
+            candidates.append(postings)
+        if not candidates:
+            return []
+        # Intersect starting from the rarest word so the working set stays small
+        candidates.sort(key=lambda postings: sum(len(posting) for posting in postings))
+        matches = set().union(*candidates[0])
+        for postings in candidates[1:]:
+            matches = {position for position in matches if any(_contains(posting, position) for posting in postings)}
+            if not matches:
+                return []
+        # Billable codes first, then the more general (shorter) codes, then code order
+        ranked = sorted(matches, key=lambda position: (not self._billable[position], len(self._code(position)), position))
+        return [self._entry(position) for position in ranked[:limit]]
+
+# Function to read entries from a CMS order file ("00001 A000    1 short  long") or a plain
+# "code description" file where every code is billable
+def read_code_file(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8", errors="replace") as codes:
+        for line in codes:
+            line = line.rstrip("\n")
+            if not line.strip():
+                continue
+            if line[:5].isdigit() and len(line) > 16:
+                yield line[6:13].strip(), line[14] == "1", (line[77:] or line[16:76]).strip()
+            else:
+                code, _, description = line.partition(" ")
+                yield code, True, description.strip()
+
+# Function to build an index from a code file; the bundled subset is never taken as complete
+def load_index(path=ICD10_PATH):
+    entries = list(read_code_file(path))
+    complete = os.path.abspath(path) != BUNDLED_PATH and len(entries) >= COMPLETE_RELEASE_CODES
+    return ICD10Index(entries, complete=complete, source=os.path.basename(path))
+
+# Function to get the process-wide index, loaded on first use
+def default_index():
+    global _default_index
+    with _default_lock:
+        if _default_index is None:
+            _default_index = load_index()
+        return _default_index
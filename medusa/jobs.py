@@ -0,0 +1,167 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from medusa.metrics import with_current_context
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = {DONE, FAILED, CANCELLED}
+
+# Raised by `JobQueue.submit` when the number of unfinished jobs has reached the queue size
+class JobQueueFull(RuntimeError):
+    pass
+
+# Raised inside a job function by `Job.update` once the job has been cancelled
+class JobCancelled(Exception):
+    pass
+
+# One unit of background work; the job function gets it as its first argument to report progress
+class Job:
+    def __init__(self, kind, label):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.label = label
+        self.status = QUEUED
+        self.progress = 0.0
+        self.message = "Waiting for a free worker..."
+        self.partial = ""
+        self.sections = []
+        self.result = None
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self._cancel = threading.Event()
+        self._future = None
+
+    @property
+    def done(self):
+        return self.status in FINISHED
+
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    # Function for job functions to report progress and partial output; stops the job if it was cancelled
+    def update(self, progress=None, message=None, partial=None, sections=None):
+        if self._cancel.is_set():
+            raise JobCancelled()
+        if progress is not None:
+            self.progress = progress
+        if message is not None:
+            self.message = message
+        if partial is not None:
+            self.partial = partial
+        if sections is not None:
+            self.sections = sections
+
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+# Bounded worker pool for analyses and reports that must outlive a single Streamlit script run.
+# Finished jobs are kept for `retention` seconds so their results can be picked up after reruns.
+class JobQueue:
+    def __init__(self, max_workers=8, max_pending=64, retention=3600):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.retention = retention
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="medusa-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._stats = {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0, "rejected": 0}
+
+    # Function to drop finished jobs that nobody picked up within the retention period
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.done and job.finished < cutoff]:
+            del self._jobs[job_id]
+
+    # Function to queue `fn(job, *args, **kwargs)` on the worker pool; returns the job id
+    def submit(self, kind, label, fn, *args, **kwargs):
+        with self._lock:
+            self._prune()
+            pending = sum(1 for job in self._jobs.values() if not job.done)
+            if pending >= self.max_pending:
+                self._stats["rejected"] += 1
+                raise JobQueueFull(f"The job queue is full ({pending} jobs waiting or running). Please try again shortly.")
+            job = Job(kind, label)
+            self._jobs[job.id] = job
+            self._stats["submitted"] += 1
+        # The job keeps the submitting session's metrics tag
+        job._future = self._executor.submit(with_current_context(self._run), job, fn, args, kwargs)
+        return job.id
+
+    def _finish(self, job, status):
+        with self._lock:
+            if job.done:
+                return
+            job.status = status
+            job.finished = time.time()
+            self._stats[{DONE: "completed", FAILED: "failed", CANCELLED: "cancelled"}[status]] += 1
+
+    def _run(self, job, fn, args, kwargs):
+        if job.cancel_requested():
+            self._finish(job, CANCELLED)
+            return
+        job.status = RUNNING
+        job.started = time.time()
+        job.message = "Running..."
+        try:
+            result = fn(job, *args, **kwargs)
+        except JobCancelled:
+            self._finish(job, CANCELLED)
+            return
+        except Exception as e:
+            job.error = e
+            self._finish(job, FAILED)
+            return
+        # A model call cannot be interrupted midway, so a job cancelled during one just discards its result
+        if job.cancel_requested():
+            self._finish(job, CANCELLED)
+            return
+        job.result = result
+        job.progress = 1.0
+        self._finish(job, DONE)
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    # Function to cancel a job: queued jobs never start, running jobs stop at their next progress update
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is None or job.done:
+            return False
+        job._cancel.set()
+        if job._future is not None and job._future.cancel():
+            self._finish(job, CANCELLED)
+        return True
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["queued"] = sum(1 for job in self._jobs.values() if job.status == QUEUED)
+            stats["running"] = sum(1 for job in self._jobs.values() if job.status == RUNNING)
+        stats["workers"] = self.max_workers
+        stats["max_pending"] = self.max_pending
+        return stats
+
+    def shutdown(self, wait=True):
+        for job_id in list(self._jobs):
+            self.cancel(job_id)
+        self._executor.shutdown(wait=wait)
+
+# Function to create the job queue configured from environment settings
+def job_queue_from_env():
+    return JobQueue(
+        max_workers=int(os.getenv("MEDUSA_JOB_WORKERS", "8")),
+        max_pending=int(os.getenv("MEDUSA_JOB_QUEUE_SIZE", "64")),
+        retention=float(os.getenv("MEDUSA_JOB_RETENTION", "3600")),
+    )
@@ -0,0 +1,133 @@
+import io
+import math
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image as PILImage
+from PIL import ImageDraw, ImageOps
+
+from medusa.metrics import span
+from medusa.preprocess import DEFAULT_PROFILE, PREPROCESS_PROFILES, _flatten, bitmap_bytes, format_bytes, load_image, preprocess_image
+
+# Images above this many pixels are tiled instead of being kept whole
+LARGE_IMAGE_PIXELS = int(os.getenv("MEDUSA_LARGE_IMAGE_PIXELS", str(4096 * 4096)))
+# Largest image the imaging mode accepts; a full-resolution decode of this size has to fit in memory once.
+# Other modes keep Pillow's decompression-bomb limit.
+MAX_IMAGE_PIXELS = int(os.getenv("MEDUSA_MAX_IMAGE_PIXELS", "300000000"))
+# Full-resolution decodes allowed at once across all sessions; each holds a whole bitmap while it is tiled
+LARGE_IMAGE_DECODES = int(os.getenv("MEDUSA_LARGE_IMAGE_DECODES", "2"))
+_decode_slots = threading.BoundedSemaphore(LARGE_IMAGE_DECODES)
+TILE_SIZE = 1024
+TILE_QUALITY = 95
+# Regions of interest are sent at full resolution up to this many pixels on their longer side; larger regions
+# are reduced to it
+MAX_ROI_DIMENSION = int(os.getenv("MEDUSA_MAX_ROI_DIMENSION", "4096"))
+# Prepared views (regions, frames, windows) kept per upload, so going back to a recent one does not decode it again
+PREPARED_CACHE_SIZE = 4
+
+# Function to turn a fractional (left, top, right, bottom) region into a pixel box for an image size
+def region_box(size, roi):
+    width, height = size
+    left, top, right, bottom = roi
+    return (
+        int(left * width), int(top * height),
+        max(int(left * width) + 1, int(right * width)), max(int(top * height) + 1, int(bottom * height)),
+    )
+
+# Function to draw the selected region onto a copy of a preview image
+def outline_region(image, roi):
+    outlined = image.convert("RGB")
+    ImageDraw.Draw(outlined).rectangle(region_box(outlined.size, roi), outline=(255, 64, 64), width=max(2, outlined.width // 300))
+    return outlined
+
+# A very large image kept as JPEG-compressed full-resolution tiles plus one reduced-resolution overview.
+# The full-resolution bitmap exists only while the tiles are cut; previews and whole-image analyses use
+# the overview, and region-of-interest crops decode just the tiles they touch.
+class LargeImage:
+    def __init__(self, image, mode=DEFAULT_PROFILE, original_bytes=None):
+        if image.width * image.height > MAX_IMAGE_PIXELS:
+            raise ValueError(
+                f"Image is {image.width}×{image.height} ({image.width * image.height / 1e6:.0f} MP); "
+                f"the limit is {MAX_IMAGE_PIXELS / 1e6:.0f} MP. Export a lower resolution or a cropped region."
+            )
+        self.mode = mode
+        self.original_bytes = original_bytes
+        profile = PREPROCESS_PROFILES.get(mode, PREPROCESS_PROFILES[DEFAULT_PROFILE])
+
+        # Waiting for a decode slot is not part of the tile stage
+        with _decode_slots, span("tile", mode):
+            load_image(image, MAX_IMAGE_PIXELS)
+            if image.getexif().get(0x0112, 1) != 1:
+                image = ImageOps.exif_transpose(image)
+            image = _flatten(image)
+            if image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            self.size = image.size
+            self.tiles = {}
+            for top in range(0, image.height, TILE_SIZE):
+                for left in range(0, image.width, TILE_SIZE):
+                    box = (left, top, min(left + TILE_SIZE, image.width), min(top + TILE_SIZE, image.height))
+                    buffer = io.BytesIO()
+                    image.crop(box).save(buffer, format="JPEG", quality=TILE_QUALITY, subsampling=0)
+                    self.tiles[(left, top)] = buffer.getvalue()
+            # reduce() builds the overview straight from the full-resolution image without another full copy
+            factor = max(1, math.ceil(max(image.size) / profile["max_dimension"]))
+            self.overview = image.reduce(factor)
+        self._overview = None
+        self._prepared = OrderedDict()
+
+    # Function to decode the full-resolution pixels of one region from the tiles it overlaps
+    def crop(self, box):
+        left, top, right, bottom = box
+        region = None
+        for tile_top in range(top - top % TILE_SIZE, bottom, TILE_SIZE):
+            for tile_left in range(left - left % TILE_SIZE, right, TILE_SIZE):
+                tile = PILImage.open(io.BytesIO(self.tiles[(tile_left, tile_top)]))
+                if region is None:
+                    region = PILImage.new(tile.mode, (right - left, bottom - top))
+                region.paste(tile, (tile_left - left, tile_top - top))
+        return region
+
+    # Function to prepare the image sent to the model: the overview, or a region at full detail (see MAX_ROI_DIMENSION)
+    def prepare(self, roi=None):
+        if roi is None:
+            if self._overview is None:
+                prepared = preprocess_image(self.overview.copy(), self.mode, self.original_bytes)
+                prepared.original_size = self.size
+                self._overview = prepared
+            return self._overview
+        if roi not in self._prepared:
+            crop = self.crop(region_box(self.size, roi))
+            self._prepared[roi] = preprocess_image(crop, self.mode, self.original_bytes, max_dimension=MAX_ROI_DIMENSION)
+            while len(self._prepared) > PREPARED_CACHE_SIZE:
+                self._prepared.popitem(last=False)
+        self._prepared.move_to_end(roi)
+        return self._prepared[roi]
+
+    @property
+    def image(self):
+        return self.overview
+
+    @property
+    def tile_bytes(self):
+        return sum(len(tile) for tile in self.tiles.values())
+
+    @property
+    def payload_bytes(self):
+        return self.tile_bytes
+
+    @property
+    def memory_bytes(self):
+        size = self.tile_bytes + bitmap_bytes(self.overview)
+        overview = self._overview
+        size += overview.memory_bytes if overview is not None else 0
+        return size + sum(prepared.memory_bytes for prepared in list(self._prepared.values()))
+
+    # Function to summarize the image for display
+    def describe(self):
+        width, height = self.size
+        return (
+            f"Large image: {width}×{height} ({width * height / 1e6:.0f} MP) kept as {len(self.tiles)} tiles "
+            f"({format_bytes(self.tile_bytes)}); overview {self.overview.width}×{self.overview.height}"
+        )
@@ -0,0 +1,267 @@
+import contextvars
+import functools
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+# Histogram buckets in seconds, from a cached lookup up to a slow multi-page model call
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+SAMPLE_SIZE = int(os.getenv("MEDUSA_METRICS_SAMPLES", "2048"))
+RECENT_SPANS = int(os.getenv("MEDUSA_METRICS_RECENT_SPANS", "1000"))
+# Sessions whose model usage is kept, least recently active dropped first
+USAGE_SESSIONS = int(os.getenv("MEDUSA_METRICS_USAGE_SESSIONS", "1000"))
+
+# Session the current code runs on behalf of; copied into worker threads by the pools that run session work
+_session = contextvars.ContextVar("medusa_session", default=None)
+
+# Function to tag every span recorded from now on in this context with a session id
+def set_session(session_id):
+    _session.set(session_id)
+
+def current_session():
+    return _session.get()
+
+# Function to run `fn` in a worker thread with the caller's session tag (for executor.submit)
+def with_current_context(fn):
+    return functools.partial(contextvars.copy_context().run, fn)
+
+# Function to compute a percentile from a sorted list using linear interpolation
+def percentile(ordered, fraction):
+    if not ordered:
+        return None
+    position = (len(ordered) - 1) * fraction
+    lower = math.floor(position)
+    upper = math.ceil(position)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+# Timing totals, histogram buckets and a bounded sample of recent durations for one stage and mode
+class _StageStats:
+    def __init__(self, sample_size):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.samples = deque(maxlen=sample_size)
+
+    def observe(self, seconds, error):
+        self.count += 1
+        self.errors += int(error)
+        self.total += seconds
+        self.samples.append(seconds)
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[index] += 1
+
+# Process-wide registry of stage timings and counters, exported as a summary table or Prometheus text.
+# Session ids are kept on recent spans only; they are not metric labels, so cardinality stays bounded.
+class MetricsRegistry:
+    def __init__(self, sample_size=SAMPLE_SIZE, recent_spans=RECENT_SPANS, usage_sessions=USAGE_SESSIONS):
+        self.sample_size = sample_size
+        self.usage_sessions = usage_sessions
+        self._stages = {}
+        self._counters = {}
+        self._gauges = {}
+        self._recent = deque(maxlen=recent_spans)
+        self._usage = OrderedDict()
+        self._lock = threading.Lock()
+
+    def observe(self, stage, mode, seconds, error=False, session=None, **tags):
+        key = (stage, mode or "none")
+        with self._lock:
+            stats = self._stages.get(key)
+            if stats is None:
+                stats = self._stages[key] = _StageStats(self.sample_size)
+            stats.observe(seconds, error)
+            self._recent.append({
+                "time": time.time(), "stage": stage, "mode": mode or "none", "session": session,
+                "seconds": seconds, "error": error, **tags,
+            })
+
+    # Function to add to a counter, e.g. ("model_tokens", {"mode": "imaging", "direction": "input"})
+    def add(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    # Function to count one model request and its tokens, per mode and for the session that made it
+    def record_usage(self, mode, input_tokens, output_tokens, session=None, truncated=False):
+        mode = mode or "none"
+        self.add("model_requests", mode=mode)
+        self.add("model_tokens", input_tokens, mode=mode, direction="input")
+        self.add("model_tokens", output_tokens, mode=mode, direction="output")
+        if truncated:
+            self.add("model_truncated", mode=mode)
+        if session is None:
+            return
+        with self._lock:
+            usage = self._usage.pop(session, None) or {}
+            totals = usage.setdefault(mode, [0, 0, 0])
+            totals[0] += 1
+            totals[1] += input_tokens
+            totals[2] += output_tokens
+            self._usage[session] = usage
+            while len(self._usage) > self.usage_sessions:
+                self._usage.popitem(last=False)
+
+    # Function to list requests and tokens per mode, for the whole process or one session
+    def usage(self, session=None):
+        with self._lock:
+            if session is not None:
+                totals = {mode: list(values) for mode, values in self._usage.get(session, {}).items()}
+            else:
+                totals = {}
+                for (name, labels), value in self._counters.items():
+                    if name not in ("model_requests", "model_tokens"):
+                        continue
+                    labels = dict(labels)
+                    row = totals.setdefault(labels["mode"], [0, 0, 0])
+                    if name == "model_requests":
+                        row[0] += value
+                    else:
+                        row[1 if labels["direction"] == "input" else 2] += value
+        return [
+            {"mode": mode, "requests": requests, "input_tokens": input_tokens, "output_tokens": output_tokens}
+            for mode, (requests, input_tokens, output_tokens) in sorted(totals.items())
+        ]
+
+    # Function to export the values of `collect()` (a dict of numbers) as gauges named `<prefix>_<key>`
+    def register_gauges(self, prefix, collect):
+        with self._lock:
+            self._gauges[prefix] = collect
+
+    # Function to list p50/p95/p99 per stage and mode, optionally only for one session's recent spans
+    def summary(self, session=None):
+        with self._lock:
+            if session is None:
+                grouped = {key: (list(stats.samples), stats.count, stats.errors) for key, stats in self._stages.items()}
+            else:
+                grouped = {}
+                for span in self._recent:
+                    if span["session"] != session:
+                        continue
+                    samples, count, errors = grouped.get((span["stage"], span["mode"]), ([], 0, 0))
+                    samples.append(span["seconds"])
+                    grouped[(span["stage"], span["mode"])] = (samples, count + 1, errors + int(span["error"]))
+        rows = []
+        for (stage, mode), (samples, count, errors) in sorted(grouped.items()):
+            ordered = sorted(samples)
+            rows.append({
+                "stage": stage, "mode": mode, "count": count, "errors": errors,
+                "p50": percentile(ordered, 0.50), "p95": percentile(ordered, 0.95), "p99": percentile(ordered, 0.99),
+            })
+        return rows
+
+    def counters(self):
+        with self._lock:
+            return {(name, labels): value for (name, labels), value in self._counters.items()}
+
+    def recent_spans(self, session=None):
+        with self._lock:
+            return [span for span in self._recent if session is None or span["session"] == session]
+
+    # Function to render every metric in the Prometheus text exposition format
+    def to_prometheus(self):
+        with self._lock:
+            stages = {key: (stats.count, stats.errors, stats.total, list(stats.buckets)) for key, stats in self._stages.items()}
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+
+        lines = [
+            "# HELP medusa_stage_duration_seconds Time spent in each processing stage.",
+            "# TYPE medusa_stage_duration_seconds histogram",
+        ]
+        for (stage, mode), (count, _, total, buckets) in sorted(stages.items()):
+            labels = f'stage="{_escape(stage)}",mode="{_escape(mode)}"'
+            for bound, value in zip(LATENCY_BUCKETS, buckets):
+                lines.append(f'medusa_stage_duration_seconds_bucket{{{labels},le="{bound}"}} {value}')
+            lines.append(f'medusa_stage_duration_seconds_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"medusa_stage_duration_seconds_sum{{{labels}}} {total}")
+            lines.append(f"medusa_stage_duration_seconds_count{{{labels}}} {count}")
+        lines += ["# HELP medusa_stage_errors_total Stage runs that raised an error.", "# TYPE medusa_stage_errors_total counter"]
+        for (stage, mode), (_, errors, _, _) in sorted(stages.items()):
+            lines.append(f'medusa_stage_errors_total{{stage="{_escape(stage)}",mode="{_escape(mode)}"}} {errors}')
+
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"# TYPE medusa_{name}_total counter")
+            for (counter, labels), value in sorted(counters.items()):
+                if counter == name:
+                    rendered = ",".join(f'{key}="{_escape(str(label))}"' for key, label in labels)
+                    lines.append(f"medusa_{name}_total{{{rendered}}} {value}")
+
+        for prefix, collect in sorted(gauges.items()):
+            try:
+                values = collect()
+            except Exception:
+                continue
+            for key, value in sorted(values.items()):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append(f"# TYPE medusa_{prefix}_{key} gauge")
+                    lines.append(f"medusa_{prefix}_{key} {value}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._counters.clear()
+            self._recent.clear()
+            self._usage.clear()
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+# The registry every stage reports to
+metrics = MetricsRegistry()
+
+# Context manager that times a stage; `mode` and the current session are attached as tags.
+# The CPU time of the calling thread is added to the `stage_cpu_seconds` counter.
+@contextmanager
+def span(stage, mode=None, **tags):
+    started = time.perf_counter()
+    cpu_started = time.thread_time()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        metrics.observe(stage, mode, time.perf_counter() - started, error, current_session(), **tags)
+        metrics.add("stage_cpu_seconds", time.thread_time() - cpu_started, stage=stage, mode=mode or "none")
+
+# Decorator form of `span` for functions that always belong to the same stage
+def timed(stage, mode=None):
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage, mode):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+# Function to serve /metrics for a Prometheus scraper from a daemon thread; returns the server
+def start_metrics_server(port, host="127.0.0.1"):
+    # http.server is only needed when an operator asks for the endpoint
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
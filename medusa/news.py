@@ -0,0 +1,103 @@
+import threading
+import time
+
+import feedparser
+
+from medusa.http import get_session
+from medusa.metrics import span
+
+# Function to parse RSS feed content into article dicts
+def parse_feed(content):
+    feed = feedparser.parse(content)
+    if feed.bozo and not feed.entries:
+        raise ValueError(f"Failed to parse RSS feed: {feed.get('bozo_exception', 'malformed feed')}")
+    return [{'title': entry.title, 'link': entry.link, 'published': entry.get('published', 'No publication date')} for entry in feed.entries]
+
+# Shared, background-refreshed feed cache using conditional GETs; readers always get the last good copy
+class FeedCache:
+    def __init__(self, url, refresh_interval=900, timeout=(3, 10)):
+        self.url = url
+        self.refresh_interval = refresh_interval
+        self.timeout = timeout
+        self._articles = None
+        self._etag = None
+        self._last_modified = None
+        self._meta = {
+            "last_refresh": None, "last_attempt": None, "last_error": None,
+            "fetches": 0, "not_modified": 0, "failures": 0,
+        }
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # Function to fetch the feed, sending ETag/Last-Modified so an unchanged feed costs a 304 and no parsing
+    def refresh(self):
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            headers = {}
+            if self._etag:
+                headers["If-None-Match"] = self._etag
+            if self._last_modified:
+                headers["If-Modified-Since"] = self._last_modified
+            now = time.time()
+            try:
+                with span("rss_fetch", "news"):
+                    response = get_session().get(self.url, headers=headers, timeout=self.timeout)
+                if response.status_code == 304:
+                    with self._lock:
+                        self._meta.update(last_refresh=now, last_attempt=now, last_error=None)
+                        self._meta["not_modified"] += 1
+                    return
+                response.raise_for_status()
+                with span("rss_parse", "news"):
+                    articles = parse_feed(response.content)
+            except Exception as e:
+                with self._lock:
+                    self._meta.update(last_attempt=now, last_error=str(e))
+                    self._meta["failures"] += 1
+                return
+            with self._lock:
+                self._articles = articles
+                self._etag = response.headers.get("ETag")
+                self._last_modified = response.headers.get("Last-Modified")
+                self._meta.update(last_refresh=now, last_attempt=now, last_error=None)
+                self._meta["fetches"] += 1
+        finally:
+            self._refresh_lock.release()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.refresh()
+            self._stop.wait(self.refresh_interval)
+
+    # Function to start the background refresh thread (idempotent)
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="feed-refresh", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    # Function to return the cached articles and refresh metadata without touching the network
+    def snapshot(self):
+        with self._lock:
+            meta = dict(self._meta)
+            articles = self._articles
+        meta["age"] = time.time() - meta["last_refresh"] if meta["last_refresh"] else None
+        # Serve stale data but kick off a revalidation if the background schedule has fallen behind
+        if meta["age"] is not None and meta["age"] > self.refresh_interval * 2:
+            threading.Thread(target=self.refresh, daemon=True).start()
+        return articles, meta
+
+    # Function to wait for the first load to finish, for callers that have nothing to show yet
+    def wait_until_loaded(self, timeout):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                if self._articles is not None or self._meta["last_error"]:
+                    return
+            time.sleep(0.05)
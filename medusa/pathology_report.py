@@ -0,0 +1,183 @@
+import io
+import threading
+from functools import lru_cache
+
+import matplotlib.patches as patches
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.font_manager import FontProperties
+from matplotlib.textpath import text_to_path
+
+from medusa.metrics import timed
+from medusa.sections import parse_sections
+
+# Text shown in a report box whose section is missing from the analysis
+PATHOLOGY_DEFAULTS = {
+    "patient_info": "Patient Name:         N.A.\n"
+                    "MRN:                          N.A.\n"
+                    "DOB:                          N.A. (Age: N.A.)\n"
+                    "Gender:                      N.A.\n"
+                    "HCN:                          N.A.\n"
+                    "Ordering MD:            N.A.\n"
+                    "Copy To:                   N.A.\n"
+                    "                                      N.A.",
+    "observation": """lorem ipsum
+    lorem ipsum
+    lorem ipsum""",
+    "inferences": """lorem ipsum
+    lorem ipsum
+    lorem ipsum""",
+    "conclusion": """lorem ipsum
+    lorem ipsum
+    lorem ipsum""",
+}
+PATHOLOGY_KEYS = ("patient_info", "observation", "inferences", "conclusion")
+
+# Function to order parsed sections into the report's four boxes, with placeholders for missing ones
+def pathology_texts(sections):
+    return tuple(sections.get(key) or PATHOLOGY_DEFAULTS[key] for key in PATHOLOGY_KEYS)
+
+# Function to list the completed sections as (box title, text) for a progressive preview of the report
+def pathology_boxes(sections):
+    return [(title, sections[key]) for (title, _, _), key in zip(PATHOLOGY_SECTIONS, PATHOLOGY_KEYS) if key in sections]
+
+# Function to merge the sections extracted from each page of a multi-page report, skipping repeated text
+@timed("extract_sections", "pathology")
+def extract_info_from_pages(analyses):
+    parsed = [parse_sections(analysis, "pathology") for analysis in analyses]
+    merged = {}
+    for key in PATHOLOGY_KEYS:
+        parts = dict.fromkeys(sections[key] for sections in parsed if sections.get(key))
+        merged[key] = "\n\n".join(parts)
+    return pathology_texts(merged)
+
+# Layout of the pathology report; coordinates are fractions of the report axes
+PATHOLOGY_FIGSIZE = (10, 12)
+PATHOLOGY_DPI = 100
+PATHOLOGY_FONT = 'DejaVu Sans'
+PATHOLOGY_SECTION_HEIGHT = 0.8 / 4
+PATHOLOGY_SECTIONS = [
+    # (header, wrap_text, background color)
+    ('Patient Information', False, '#E6F2FF'),
+    ('Observation', True, '#F5F5F5'),
+    ('Inferences', True, '#E6F2FF'),
+    ('Conclusion', True, '#F5F5F5'),
+]
+PATHOLOGY_BOX_X = 0.05
+PATHOLOGY_BOX_WIDTH = 0.9
+PATHOLOGY_FONTSIZE = 10
+PATHOLOGY_LINE_HEIGHT = 0.025
+PATHOLOGY_FORMATS = {"png": "image/png", "pdf": "application/pdf", "svg": "image/svg+xml"}
+
+_pathology_template = None
+_pathology_template_lock = threading.Lock()
+
+# Function to create a figure and report axes without pyplot, so each call owns its own state
+def _new_pathology_figure():
+    fig = Figure(figsize=PATHOLOGY_FIGSIZE, dpi=PATHOLOGY_DPI)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.set_xlim(0, 1)
+    ax.set_ylim(0, 1)
+    ax.axis('off')
+    return fig, ax
+
+def _section_y(index):
+    return 0.88 - (index + 1) * PATHOLOGY_SECTION_HEIGHT
+
+# Function to draw the fixed parts of the pathology report: titles, section boxes and footer
+def _draw_pathology_template(ax):
+    # Add the main header
+    ax.text(0.5, 0.96, 'LABORATORY MEDICINE PROGRAM', ha='center', va='center', fontsize=15, family=PATHOLOGY_FONT, fontweight='bold')
+
+    # Add the subheader
+    ax.text(0.5, 0.93, 'Surgical Pathology Consultation Report', ha='center', va='center', fontsize=13, family=PATHOLOGY_FONT, fontweight='bold')
+
+    # Add a box and header for each section
+    for index, (header, _, color) in enumerate(PATHOLOGY_SECTIONS):
+        y = _section_y(index)
+        ax.add_patch(patches.Rectangle((PATHOLOGY_BOX_X, y), PATHOLOGY_BOX_WIDTH, PATHOLOGY_SECTION_HEIGHT, linewidth=1.5, edgecolor='black', facecolor=color))
+        ax.text(PATHOLOGY_BOX_X + 0.01, y + PATHOLOGY_SECTION_HEIGHT - 0.01, header, ha='left', va='top', fontsize=PATHOLOGY_FONTSIZE, fontweight='bold', family=PATHOLOGY_FONT)
+
+    # Add footer information
+    ax.text(0.95, 0.01, 'Page 1 of 5', ha='right', va='center', fontsize=10, family=PATHOLOGY_FONT)
+
+# Function to get the pre-rendered raster of the static template layer (rendered once per process)
+def get_pathology_template():
+    global _pathology_template
+    with _pathology_template_lock:
+        if _pathology_template is None:
+            fig, ax = _new_pathology_figure()
+            _draw_pathology_template(ax)
+            fig.canvas.draw()
+            _pathology_template = np.asarray(fig.canvas.buffer_rgba()).copy()
+        return _pathology_template
+
+# Function to measure the rendered width of a string in points using the font's glyph metrics
+@lru_cache(maxsize=8192)
+def _text_width(text, fontsize):
+    width, _, _ = text_to_path.get_text_width_height_descent(text, FontProperties(family=PATHOLOGY_FONT, size=fontsize), ismath=False)
+    return width
+
+# Function to wrap text into lines that fit `max_width` points, keeping the author's line breaks
+def wrap_text_to_width(text, max_width, fontsize):
+    space = _text_width(" ", fontsize)
+    lines = []
+    for paragraph in text.splitlines() or [""]:
+        current_line, current_width = "", 0.0
+        for word in paragraph.split():
+            word_width = _text_width(word, fontsize)
+            if current_line and current_width + space + word_width > max_width:
+                lines.append(current_line)
+                current_line, current_width = word, word_width
+            elif current_line:
+                current_line += " " + word
+                current_width += space + word_width
+            else:
+                current_line, current_width = word, word_width
+        if current_line:
+            lines.append(current_line)
+    return lines
+
+# Function to draw the per-report text into the section boxes
+def _draw_pathology_text(ax, fig, texts):
+    # Axes width in points, used to convert measured text widths into axes fractions
+    axes_width_points = ax.get_position().width * PATHOLOGY_FIGSIZE[0] * 72
+    max_width = (PATHOLOGY_BOX_WIDTH - 0.02) * axes_width_points
+    for index, ((_, wrap_text, _), text) in enumerate(zip(PATHOLOGY_SECTIONS, texts)):
+        x = PATHOLOGY_BOX_X + 0.01
+        top = _section_y(index) + PATHOLOGY_SECTION_HEIGHT - 0.03
+        if not wrap_text:
+            ax.text(x, top, text, ha='left', va='top', fontsize=PATHOLOGY_FONTSIZE, family=PATHOLOGY_FONT, clip_on=True)
+            continue
+        for i, line in enumerate(wrap_text_to_width(text, max_width, PATHOLOGY_FONTSIZE)):
+            if i * PATHOLOGY_LINE_HEIGHT >= PATHOLOGY_SECTION_HEIGHT - PATHOLOGY_LINE_HEIGHT:
+                break
+            ax.text(x, top - i * PATHOLOGY_LINE_HEIGHT, line, ha='left', va='top', fontsize=PATHOLOGY_FONTSIZE, family=PATHOLOGY_FONT, clip_on=True)
+
+# Function to render a pathology report to bytes; thread-safe and picklable, so it can run in a worker pool
+@timed("pathology_report", "pathology")
+def render_pathology_report(patient_info, service_info, specimens, theranostic_report, output_format="png"):
+    if output_format not in PATHOLOGY_FORMATS:
+        raise ValueError(f"Unsupported pathology report format '{output_format}'.")
+    fig, ax = _new_pathology_figure()
+    if output_format == "png":
+        # Raster output stamps the pre-rendered template and only draws the text on top
+        fig.figimage(get_pathology_template(), 0, 0, zorder=0)
+        ax.set_zorder(1)
+        ax.patch.set_visible(False)
+    else:
+        # Vector output draws the template as vectors so it stays sharp at any zoom
+        _draw_pathology_template(ax)
+    _draw_pathology_text(ax, fig, (patient_info, service_info, specimens, theranostic_report))
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format=output_format, dpi=PATHOLOGY_DPI)
+    return buf.getvalue()
+
+# Function to create a pathology report with matplotlib
+def create_pathology_report(patient_info, service_info, specimens, theranostic_report, output_format="png"):
+    buf = io.BytesIO(render_pathology_report(patient_info, service_info, specimens, theranostic_report, output_format))
+    buf.seek(0)
+    return buf
@@ -0,0 +1,135 @@
+import io
+import threading
+from functools import lru_cache
+from xml.sax.saxutils import escape
+
+from reportlab.lib.pagesizes import letter
+from reportlab.lib import colors
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Image, Spacer, PageBreak
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.pdfbase.ttfonts import TTFont, TTFError
+from reportlab.pdfbase import pdfmetrics
+
+from medusa.metrics import timed
+
+# Background color and header for each PDF report format
+REPORT_FORMATS = {
+    "Format 1": {"color": colors.lightblue, "header": "SWAYAM IMAGING CENTER"},
+    "Format 2": {"color": colors.lightgreen, "header": "SWAYAM IMAGING CENTER"},
+    "Format 3": {"color": colors.lightyellow, "header": "Medical Imaging Report"},
+    "Format 4": {"color": colors.lightpink, "header": "IMAGING DIAGNOSTIC CENTER"},
+    "Format 5": {"color": colors.lightgrey, "header": "RADIOLOGY REPORT"}
+}
+
+_report_styles = None
+_report_styles_lock = threading.Lock()
+
+# Function to register the report font and build the paragraph styles once per process
+def get_report_styles():
+    global _report_styles
+    with _report_styles_lock:
+        if _report_styles is None:
+            # Fall back to the built-in Helvetica on hosts without arial.ttf
+            font_name = 'Helvetica'
+            try:
+                pdfmetrics.registerFont(TTFont('Arial', 'arial.ttf'))
+                font_name = 'Arial'
+            except TTFError:
+                pass
+            _report_styles = {
+                "normal": ParagraphStyle('Normal', fontName=font_name, fontSize=10, leading=12),
+                "heading1": ParagraphStyle('Heading1', fontName=font_name, fontSize=20, leading=20, alignment=1, spaceAfter=12, underline=True),
+                "heading2": ParagraphStyle('Heading2', fontName=font_name, fontSize=14, leading=14, spaceAfter=8),
+            }
+        return _report_styles
+
+# Function to get the cached page decoration (background and border) for a report format
+@lru_cache(maxsize=None)
+def get_page_template(report_format):
+    background_color = REPORT_FORMATS[report_format]["color"]
+
+    def add_background_and_border(canvas, doc):
+        canvas.saveState()
+        margin = 36
+        canvas.setFillColor(background_color)
+        canvas.rect(margin, margin, doc.pagesize[0] - 2 * margin, doc.pagesize[1] - 2 * margin, fill=1)
+        canvas.setStrokeColor(colors.black)
+        canvas.setLineWidth(2)
+        canvas.rect(margin, margin, doc.pagesize[0] - 2 * margin, doc.pagesize[1] - 2 * margin)
+        canvas.restoreState()
+
+    return add_background_and_border
+
+# Function to build the flowables for one imaging report section
+def _report_elements(patient_info, service_info, specimens, theranostic_report, diagnosis, detailed_diagnosis, image_buffer, report_format):
+    styles = get_report_styles()
+    styleN, styleH, styleH2 = styles["normal"], styles["heading1"], styles["heading2"]
+    # Model output is plain text, so escape anything Paragraph would read as markup
+    patient_info, service_info, specimens, theranostic_report, diagnosis, detailed_diagnosis = (
+        escape(str(value)) for value in (patient_info, service_info, specimens, theranostic_report, diagnosis, detailed_diagnosis)
+    )
+    return [
+        Paragraph(REPORT_FORMATS[report_format]["header"], styleH),
+        Spacer(1, 12),
+        Paragraph(f"Patient Information: {patient_info}", styleN),
+        Paragraph(f"Observation: {service_info}", styleN),
+        Paragraph(f"Inferences: {specimens}", styleN),
+        Spacer(1, 12),
+        Paragraph("DIAGNOSIS", styleH2),
+        Paragraph(detailed_diagnosis, styleN),
+        Spacer(1, 12),
+        Paragraph("Conclusion:", styleH2),
+        Paragraph(theranostic_report, styleN),
+        Spacer(1, 12),
+        Paragraph("X-Ray Image:", styleH2),
+        Image(image_buffer, width=5 * inch, height=3.5 * inch),
+        Spacer(1, 12),
+        Paragraph("IMPRESSION", styleH2),
+        Paragraph(diagnosis, styleN),
+        Spacer(1, 12),
+        Paragraph("ADVICE", styleH2),
+        Paragraph("Clinical correlation.", styleN),
+        Spacer(1, 12),
+        Paragraph("Radiologic Technologists: MSC, PGDM", styleN),
+        Paragraph("Dr. Payal Shah (MD, Radiologist)", styleN),
+        Paragraph("Dr. Vimal Shah (MD, Radiologist)", styleN)
+    ]
+
+# Function to render flowables into a PDF buffer using the cached page template for the format
+def _build_pdf(elements, report_format):
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    page_template = get_page_template(report_format)
+    doc.build(elements, onFirstPage=page_template, onLaterPages=page_template)
+    buffer.seek(0)
+    return buffer
+
+# Function to create a PDF report
+@timed("pdf_report", "imaging")
+def create_pdf_report(patient_info, service_info, specimens, theranostic_report, diagnosis, detailed_diagnosis, image_buffer, report_format):
+    return _build_pdf(_report_elements(patient_info, service_info, specimens, theranostic_report, diagnosis, detailed_diagnosis, image_buffer, report_format), report_format)
+
+# Function to build the report arguments for one analyzed imaging study image
+def _imaging_report_args(image, analysis):
+    # Extract the diagnosis from the analysis
+    detailed_diagnosis = analysis
+    diagnosis = analysis.split('.')[0]
+
+    # Reuse the already encoded model payload for the report image
+    img_buffer = io.BytesIO(image.data)
+    return ("Yashvi M. Patel", 21, "Female", diagnosis, detailed_diagnosis, "", img_buffer)
+
+# Function to build the imaging PDF report for one analyzed image
+def build_imaging_report(image, analysis, report_format):
+    return create_pdf_report(*_imaging_report_args(image, analysis), report_format)
+
+# Function to build one multi-page PDF for a whole study in a single pass; `studies` is a list of (image, analysis)
+@timed("pdf_report", "imaging")
+def build_study_report(studies, report_format):
+    elements = []
+    for index, (image, analysis) in enumerate(studies):
+        if index:
+            elements.append(PageBreak())
+        elements.extend(_report_elements(*_imaging_report_args(image, analysis), report_format))
+    return _build_pdf(elements, report_format)
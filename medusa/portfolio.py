@@ -0,0 +1,177 @@
+import argparse
+import glob
+import heapq
+import json
+import os
+import sys
+import time
+import uuid
+
+# Rows buffered before they are written out as one Parquet row group
+ROW_GROUP_ROWS = 1024
+PERCENTILES = (10, 25, 50, 75, 90, 95, 99)
+# Applicants further than this many interquartile ranges outside the middle half are outliers (Tukey's fences)
+OUTLIER_IQR = 1.5
+SCORE_COLUMNS = ("id", "path", "risk_percentage", "justification", "elapsed")
+
+def _schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ("id", pa.string()), ("path", pa.string()), ("risk_percentage", pa.float64()),
+        ("justification", pa.string()), ("elapsed", pa.float64()),
+    ])
+
+def _part_paths(directory):
+    return sorted(glob.glob(os.path.join(directory, "part-*.parquet")))
+
+# Columnar table of insurance risk scores, kept as a directory of Parquet files (one per run). Rows are written
+# as row groups of ROW_GROUP_ROWS while the run goes on, so memory stays bounded however large the portfolio is.
+# A file left without its footer by a crash is dropped on the next run; its rows are restored from the JSONL results.
+class ScoreWriter:
+    def __init__(self, directory, row_group_rows=ROW_GROUP_ROWS):
+        import pyarrow.parquet as pq
+
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.row_group_rows = row_group_rows
+        self.ids = set()
+        for path in _part_paths(directory):
+            try:
+                self.ids.update(pq.read_table(path, columns=["id"]).column("id").to_pylist())
+            except Exception:
+                os.remove(path)
+        # A random suffix keeps two writers started in the same second from sharing a file
+        self.path = os.path.join(directory, f"part-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.parquet")
+        self._writer = None
+        self._columns = {name: [] for name in SCORE_COLUMNS}
+
+    # Function to add one successful insurance batch record; records already in the table are skipped
+    def add(self, record):
+        if record.get("status") != "ok" or record["id"] in self.ids:
+            return
+        self.ids.add(record["id"])
+        sections = record.get("sections") or {}
+        self._columns["id"].append(record["id"])
+        self._columns["path"].append(record.get("path"))
+        self._columns["risk_percentage"].append(record.get("risk_percentage"))
+        self._columns["justification"].append(sections.get("justification"))
+        self._columns["elapsed"].append(record.get("elapsed"))
+        if len(self._columns["id"]) >= self.row_group_rows:
+            self.flush()
+
+    # Function to add the successful records of a JSONL results file that the table does not have yet
+    def backfill(self, results_path):
+        if not os.path.exists(results_path):
+            return
+        with open(results_path, encoding="utf-8") as results:
+            for line in results:
+                try:
+                    self.add(json.loads(line))
+                except (json.JSONDecodeError, KeyError):
+                    continue
+
+    def flush(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if not self._columns["id"]:
+            return
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.path, _schema())
+        self._writer.write_table(pa.table(self._columns, schema=_schema()))
+        self._columns = {name: [] for name in SCORE_COLUMNS}
+
+    def close(self):
+        self.flush()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+# Function to compute portfolio aggregates over a score directory: counts, mean and spread, percentiles, a 10-point
+# histogram and the applicants furthest outside Tukey's fences. Only the risk column is loaded for the statistics;
+# outliers are found in a second pass one row group at a time, keeping the `outlier_limit` most extreme.
+def portfolio_summary(directory, outlier_limit=20):
+    import numpy as np
+    import pyarrow.parquet as pq
+
+    paths = _part_paths(directory)
+    if not paths:
+        return {"applicants": 0, "scored": 0, "unscored": 0}
+    risks = np.concatenate([
+        pq.read_table(path, columns=["risk_percentage"]).column("risk_percentage").to_numpy(zero_copy_only=False)
+        for path in paths
+    ]).astype(np.float64)
+    scored = risks[~np.isnan(risks)]
+    summary = {"applicants": int(risks.size), "scored": int(scored.size), "unscored": int(risks.size - scored.size)}
+    if not scored.size:
+        return summary
+
+    quantiles = np.percentile(scored, PERCENTILES)
+    q1, q3 = np.percentile(scored, (25, 75))
+    low, high = q1 - OUTLIER_IQR * (q3 - q1), q3 + OUTLIER_IQR * (q3 - q1)
+    counts, edges = np.histogram(np.clip(scored, 0, 100), bins=np.arange(0, 101, 10))
+    summary.update({
+        "mean": float(scored.mean()),
+        "std": float(scored.std()),
+        "min": float(scored.min()),
+        "max": float(scored.max()),
+        "percentiles": {f"p{point}": float(value) for point, value in zip(PERCENTILES, quantiles)},
+        "distribution": [
+            {"range": f"{int(start)}-{int(end)}%", "count": int(count)} for start, end, count in zip(edges[:-1], edges[1:], counts)
+        ],
+        "outlier_fences": [float(low), float(high)],
+        # Values outside 0-100% are impossible and always reported
+        "outlier_count": int(np.count_nonzero((scored < max(low, 0)) | (scored > min(high, 100)))),
+    })
+
+    outliers = []
+    for path in paths:
+        for batch in pq.ParquetFile(path).iter_batches(columns=["id", "risk_percentage"]):
+            values = batch.column(1).to_numpy(zero_copy_only=False).astype(np.float64)
+            distance = np.fmax(np.fmax(max(low, 0) - values, values - min(high, 100)), 0)
+            found = np.flatnonzero(distance > 0)
+            if found.size:
+                ids = batch.column(0)
+                candidates = [(float(distance[index]), ids[int(index)].as_py(), float(values[index])) for index in found]
+                outliers = heapq.nlargest(outlier_limit, outliers + candidates)
+    summary["outliers"] = [{"id": applicant, "risk_percentage": value} for _, applicant, value in outliers]
+    return summary
+
+# Function to print a portfolio summary as a short report
+def print_summary(summary, log=sys.stderr):
+    print(f"Portfolio: {summary['applicants']} applicant(s), {summary['scored']} scored, {summary['unscored']} without a risk percentage", file=log)
+    if not summary["scored"]:
+        return
+    print(f"  mean {summary['mean']:.1f}% (sd {summary['std']:.1f}), range {summary['min']:g}-{summary['max']:g}%", file=log)
+    print("  " + "  ".join(f"{name} {value:.1f}%" for name, value in summary["percentiles"].items()), file=log)
+    widest = max(bucket["count"] for bucket in summary["distribution"]) or 1
+    for bucket in summary["distribution"]:
+        print(f"  {bucket['range']:>8} {bucket['count']:>7} {'#' * round(40 * bucket['count'] / widest)}".rstrip(), file=log)
+    low, high = summary["outlier_fences"]
+    print(f"  {summary['outlier_count']} outlier(s) outside {max(low, 0):.1f}-{min(high, 100):.1f}%", file=log)
+    for outlier in summary["outliers"]:
+        print(f"    {outlier['id']}: {outlier['risk_percentage']:g}%", file=log)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m medusa.portfolio", description="Summarize the insurance risk scores written by a batch run with --scores.")
+    parser.add_argument("scores", help="Score directory written by `python -m medusa.batch --mode insurance --scores DIR`.")
+    parser.add_argument("--outliers", type=int, default=20, help="Most extreme outliers to list.")
+    parser.add_argument("--json", action="store_true", help="Print the summary as JSON.")
+    args = parser.parse_args(argv)
+
+    summary = portfolio_summary(args.scores, args.outliers)
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        print_summary(summary, sys.stdout)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+import io
+import threading
+from contextlib import contextmanager
+
+from PIL import Image as PILImage
+from PIL import ImageOps
+
+from medusa.cache import image_fingerprint
+from medusa.metrics import metrics, span
+
+# Per-mode preprocessing profiles; document modes need far less resolution than imaging
+PREPROCESS_PROFILES = {
+    "imaging": {"max_dimension": 2048, "grayscale": False, "format": "JPEG", "quality": 92},
+    "transcription": {"max_dimension": 1600, "grayscale": True, "format": "JPEG", "quality": 85},
+    "pathology": {"max_dimension": 1600, "grayscale": True, "format": "JPEG", "quality": 85},
+    "coding": {"max_dimension": 1600, "grayscale": True, "format": "JPEG", "quality": 85},
+    "insurance": {"max_dimension": 1600, "grayscale": True, "format": "JPEG", "quality": 85},
+    "treatment": {"max_dimension": 1600, "grayscale": True, "format": "JPEG", "quality": 85},
+    "combined": {"max_dimension": 1600, "grayscale": True, "format": "JPEG", "quality": 85},
+}
+DEFAULT_PROFILE = "imaging"
+
+MIME_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp"}
+
+# Pillow's decompression-bomb limit stays at its default. A caller that accepts larger images passes `max_pixels`,
+# which is only in effect while that one header is read; uploads are all opened under this lock, so no other
+# upload is ever opened with the raised limit.
+_open_lock = threading.Lock()
+_DEFAULT_MAX_PIXELS = PILImage.MAX_IMAGE_PIXELS
+
+# An image after preprocessing, together with the encoded payload sent to the model
+class PreparedImage:
+    def __init__(self, image, data, mime_type, original_bytes, original_size, mode):
+        self.image = image
+        self.data = data
+        self.mime_type = mime_type
+        self.original_bytes = original_bytes
+        self.original_size = original_size
+        self.mode = mode
+        self._fingerprint = None
+
+    @property
+    def fingerprint(self):
+        if self._fingerprint is None:
+            self._fingerprint = image_fingerprint(self.image)
+        return self._fingerprint
+
+    @property
+    def blob(self):
+        return {"mime_type": self.mime_type, "data": self.data}
+
+    @property
+    def payload_bytes(self):
+        return len(self.data)
+
+    @property
+    def memory_bytes(self):
+        return bitmap_bytes(self.image) + len(self.data)
+
+    # Function to summarize the size reduction for display
+    def describe(self):
+        before = format_bytes(self.original_bytes) if self.original_bytes is not None else "unknown"
+        width, height = self.original_size
+        return (
+            f"Payload: {before} → {format_bytes(self.payload_bytes)} "
+            f"({width}×{height} → {self.image.width}×{self.image.height})"
+        )
+
+# Function to format a byte count for display
+def format_bytes(count):
+    for unit in ("B", "KB", "MB"):
+        if count < 1024:
+            return f"{count:.0f} {unit}" if unit == "B" else f"{count:.1f} {unit}"
+        count /= 1024
+    return f"{count:.1f} GB"
+
+# Function to estimate the memory held by a decoded bitmap
+def bitmap_bytes(image):
+    return image.width * image.height * len(image.getbands())
+
+# Function to flatten transparency onto white so the image can be saved without an alpha channel
+def _flatten(image):
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        rgba = image.convert("RGBA")
+        background = PILImage.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+    return image
+
+# Function to run the preprocessing pipeline on a decoded image
+def _preprocess_image(image, mode, original_bytes, max_dimension=None):
+    profile = PREPROCESS_PROFILES.get(mode, PREPROCESS_PROFILES[DEFAULT_PROFILE])
+    max_dimension = max_dimension or profile["max_dimension"]
+    original_size = image.size
+
+    # Let the JPEG decoder downscale while decoding instead of materializing every pixel
+    if image.format == "JPEG":
+        image.draft("L" if profile["grayscale"] else "RGB", (max_dimension, max_dimension))
+
+    # Apply the EXIF orientation before the metadata is dropped
+    image = ImageOps.exif_transpose(image)
+    image = _flatten(image)
+    if profile["grayscale"]:
+        image = image.convert("L")
+    elif image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+
+    if max(image.size) > max_dimension:
+        image.thumbnail((max_dimension, max_dimension), PILImage.Resampling.LANCZOS)
+
+    # Re-encode without EXIF/ICC/text chunks, which strips the metadata
+    buffer = io.BytesIO()
+    if profile["format"] == "PNG":
+        image.save(buffer, format="PNG", optimize=True)
+    else:
+        image.save(buffer, format=profile["format"], quality=profile["quality"], optimize=True)
+    return PreparedImage(image, buffer.getvalue(), MIME_TYPES[profile["format"]], original_bytes, original_size, mode)
+
+# Function to preprocess a decoded image, recording decode time and payload sizes before and after.
+# `max_dimension` overrides the profile's size limit, e.g. for region-of-interest crops kept at full detail.
+def preprocess_image(image, mode=DEFAULT_PROFILE, original_bytes=None, max_dimension=None):
+    with span("decode", mode):
+        prepared = _preprocess_image(image, mode, original_bytes, max_dimension)
+    if original_bytes is not None:
+        metrics.add("payload_bytes", original_bytes, mode=mode, kind="original")
+    metrics.add("payload_bytes", prepared.payload_bytes, mode=mode, kind="sent")
+    return prepared
+
+# Function to raise Pillow's decompression-bomb limit to `max_pixels` for the duration of the block
+@contextmanager
+def _pixel_limit(max_pixels):
+    with _open_lock:
+        default = PILImage.MAX_IMAGE_PIXELS
+        if max_pixels is not None and default is not None:
+            PILImage.MAX_IMAGE_PIXELS = max(default, max_pixels)
+        try:
+            yield
+        finally:
+            PILImage.MAX_IMAGE_PIXELS = default
+
+# Function to open encoded image bytes; only the header is read, pixels are decoded on first use
+def open_image(data, max_pixels=None):
+    with _pixel_limit(max_pixels):
+        return PILImage.open(io.BytesIO(data))
+
+# Function to decode the pixels of an image opened with `max_pixels`. Some formats (TIFF) check the limit again
+# when decoding, so images past Pillow's default are decoded under the same raised limit they were opened with.
+def load_image(image, max_pixels=None):
+    if max_pixels is None or _DEFAULT_MAX_PIXELS is None or image.width * image.height <= _DEFAULT_MAX_PIXELS:
+        image.load()
+    else:
+        with _pixel_limit(max_pixels):
+            image.load()
+    return image
+
+# Function to decode encoded image bytes and preprocess them for the given mode
+def preprocess_bytes(data, mode=DEFAULT_PROFILE):
+    return preprocess_image(open_image(data), mode, original_bytes=len(data))
+
+# Function to decode an uploaded file and preprocess it for the given mode
+def preprocess_upload(uploaded_file, mode=DEFAULT_PROFILE):
+    return preprocess_bytes(uploaded_file.getvalue(), mode)
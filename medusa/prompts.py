@@ -0,0 +1,112 @@
+# Default prompts for each analysis mode, shared by the Streamlit pages and the batch CLI
+IMAGING_PROMPT = "Analyze this medical image. Describe what you see, identify any abnormalities, and suggest potential diagnoses."
+
+TRANSCRIPTION_PROMPT = "Analyze this medical prescription and transcribe it in tabular format."
+
+PATHOLOGY_PROMPT = """You are a highly skilled medical professional specializing in pathology. Please analyze the uploaded medical pathology report and extract the following information accurately and concisely. Present the information in a structured format with clear labels:
+
+1. **Patient Information:**
+   - Patient Name
+   - Medical Record Number (MRN)
+   - Date of Birth (DOB) with Age
+   - Gender
+   - Health Card Number (HCN)
+   - Ordering Physician
+   - Copy To (if any)
+
+2. **Observation:**
+   - Summarize the key observations noted in the report in a short paragraph.
+
+3. **Inferences:**
+   - Summarize the main inferences derived from the observations in a short paragraph.
+
+4. **Conclusion:**
+   - Provide the final conclusion or diagnosis mentioned in the report in a short paragraph.
+
+**Format for Output:**
+
+- **Patient Information:**
+  - Patient Name: [Extracted Name]
+  - MRN: [Extracted MRN]
+  - DOB: [Extracted DOB] (Age: [Extracted Age])
+  - Gender: [Extracted Gender]
+  - HCN: [Extracted HCN]
+  - Ordering Physician: [Extracted Physician]
+  - Copy To: [Extracted Copy To (if any)]
+
+- **Observation:**
+  - [Summarized Observations]
+
+- **Inferences:**
+  - [Summarized Inferences]
+
+- **Conclusion:**
+  - [Final Conclusion or Diagnosis]
+
+Ensure that the extracted information is accurate and formatted correctly.
+
+
+"""
+
+CODING_PROMPT = "Analyze the image and suggest the ICD medical codes with description. Make it simple and concise."
+
+INSURANCE_PROMPT = """You are a highly skilled insurance analyst. Please analyze the uploaded image containing user data and calculate the insurance risk percentage. Provide a detailed justification for the calculated risk percentage based on the data.
+
+**Format for Output:**
+
+- **Risk Percentage:** [Calculated Percentage]%
+- **Justification:** [Detailed Justification]
+
+Ensure that the calculated risk and justification are accurate and well-explained."""
+
+TREATMENT_PROMPT = """You are a highly skilled medical professional. Please analyze the uploaded image containing patient data and generate a treatment plan and a diet plan based on the information provided.
+
+**Format for Output:**
+
+- **Treatment Plan:**
+  - [Generated Treatment Plan]
+
+- **Diet Plan:**
+  - [Generated Diet Plan]
+
+Ensure that the plans are accurate and well-explained."""
+
+DEFAULT_PROMPTS = {
+    "imaging": IMAGING_PROMPT,
+    "transcription": TRANSCRIPTION_PROMPT,
+    "pathology": PATHOLOGY_PROMPT,
+    "coding": CODING_PROMPT,
+    "insurance": INSURANCE_PROMPT,
+    "treatment": TREATMENT_PROMPT,
+}
+
+# Tasks answered together by the "Analyze Everything" page from a single upload of the document
+COMBINED_TASKS = ["transcription", "coding", "insurance", "treatment"]
+
+COMBINED_PROMPT_HEADER = """You are assisting with several independent tasks on the same uploaded medical document. Complete every task below fully, exactly as you would if it were asked on its own.
+
+Put the answer to each task between its start and end markers. Copy each marker exactly, on a line of its own, and write nothing outside the markers."""
+
+# Function to get the line that opens a task's section in a combined response
+def section_start(task):
+    return f"[[BEGIN {task.upper()}]]"
+
+# Function to get the line that closes a task's section in a combined response
+def section_end(task):
+    return f"[[END {task.upper()}]]"
+
+# Function to build one sectioned prompt that asks for every task's answer in a single model call
+def build_combined_prompt(tasks=COMBINED_TASKS, prompts=None):
+    prompts = prompts or DEFAULT_PROMPTS
+    parts = [COMBINED_PROMPT_HEADER]
+    for number, task in enumerate(tasks, start=1):
+        parts.append(f"### Task {number}\n\n{prompts[task].strip()}")
+    output_format = "\n\n".join(
+        f"{section_start(task)}\n[Complete answer to Task {number}]\n{section_end(task)}" for number, task in enumerate(tasks, start=1)
+    )
+    parts.append(f"**Overall Response Layout** (inside each section, follow that task's own format):\n\n{output_format}")
+    return "\n\n".join(parts)
+
+# Function to list the tasks a combined prompt asks for
+def combined_tasks(prompt):
+    return [task for task in DEFAULT_PROMPTS if section_start(task) in prompt]
@@ -0,0 +1,68 @@
+import threading
+import time
+
+# Thread-safe token bucket refilled continuously at `rate_per_minute`
+class TokenBucket:
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else max(1.0, rate_per_minute / 60.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    # Function to take `amount` tokens without waiting; returns the seconds to wait if not enough are available
+    def try_acquire(self, amount=1.0):
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            # Requests larger than the bucket are allowed once it is full, so they cannot block forever
+            needed = min(amount, self.capacity)
+            if self._tokens >= needed:
+                self._tokens -= amount
+                return 0.0
+            return (needed - self._tokens) / self.rate
+
+    # Function to give back tokens taken for a call that was not made after all
+    def refund(self, amount=1.0):
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+    # Function to block until `amount` tokens are available; returns the total time waited
+    def acquire(self, amount=1.0):
+        waited = 0.0
+        while True:
+            delay = self.try_acquire(amount)
+            if delay <= 0:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+# Thread-safe budget that earns `ratio` of a token per deposit (one per request) and holds at most `capacity`,
+# so extra work such as hedged requests and upgrade passes stays a fixed share of traffic however slow the upstream gets
+class RatioBudget:
+    def __init__(self, ratio, capacity=10.0):
+        self.ratio = ratio
+        self.capacity = capacity
+        self._tokens = capacity if ratio > 0 else 0.0
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + self.ratio)
+
+    # Function to spend one token if available; returns whether it was spent
+    def try_spend(self):
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    @property
+    def available(self):
+        with self._lock:
+            return self._tokens
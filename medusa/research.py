@@ -0,0 +1,48 @@
+import os
+
+from bs4 import BeautifulSoup
+
+from medusa.cache import MemoryTier
+from medusa.http import get_session
+from medusa.metrics import timed
+
+SCHOLAR_URL = "https://scholar.google.com/scholar"
+CONNECT_TIMEOUT = float(os.getenv("MEDUSA_SCHOLAR_CONNECT_TIMEOUT", "3"))
+READ_TIMEOUT = float(os.getenv("MEDUSA_SCHOLAR_READ_TIMEOUT", "10"))
+
+_paper_cache = MemoryTier(
+    max_entries=int(os.getenv("MEDUSA_SCHOLAR_CACHE_ENTRIES", "512")),
+    ttl=float(os.getenv("MEDUSA_SCHOLAR_CACHE_TTL", str(24 * 3600))),
+)
+
+# Function to normalize a query so trivially different searches share a cache entry
+def normalize_query(query):
+    return " ".join(query.lower().split())
+
+# Function to parse paper titles and links, skipping results without a title and keeping those without a link
+def parse_papers(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    papers = []
+    for item in soup.select('[data-lid]'):
+        title = item.select_one('.gs_rt')
+        if title is None:
+            continue
+        link = item.select_one('.gs_rt a')
+        papers.append({'title': title.get_text(" ", strip=True), 'link': link.get('href') if link is not None else None})
+    return papers
+
+# Function to search for research papers
+@timed("research_search", "imaging")
+def search_research_papers(query):
+    key = normalize_query(query)
+    if not key:
+        return []
+    cached = _paper_cache.get(key)
+    if cached is not None:
+        return cached
+    response = get_session().get(SCHOLAR_URL, params={"q": query}, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+    response.raise_for_status()
+    papers = parse_papers(response.content)
+    _paper_cache.put(key, papers)
+    return papers
+
@@ -0,0 +1,129 @@
+import re
+
+# Sections of each mode's output format as (key, heading labels). Labels are matched case-insensitively against
+# the text before the colon of a heading line, after markdown decoration ("## ", "- ", "1. ", "**") is removed.
+SECTION_LAYOUTS = {
+    "pathology": (
+        ("patient_info", ("patient information", "patient info", "patient details", "patient name")),
+        ("observation", ("observation", "observations")),
+        ("inferences", ("inferences", "inference")),
+        ("conclusion", ("conclusion", "conclusions")),
+    ),
+    "insurance": (
+        ("risk_percentage", ("risk percentage", "insurance risk percentage", "risk")),
+        ("justification", ("justification",)),
+    ),
+    "treatment": (
+        ("treatment_plan", ("treatment plan",)),
+        ("diet_plan", ("diet plan",)),
+    ),
+}
+# Headings that are also the first field of their section; their line is kept ("Patient Name: Jane Doe")
+FIELD_HEADINGS = {"patient name": "Patient Name"}
+
+LEADING_MARKER = re.compile(r"^(?:[-*+•]\s+|\d+[.)]\s+)+")
+PERCENTAGE = re.compile(r"(\d+(?:\.\d+)?)\s*%")
+NUMBER = re.compile(r"\d+(?:\.\d+)?")
+BLANK_LINES = re.compile(r"\n{3,}")
+
+# Function to strip markdown emphasis and list markers from one line of model output
+def clean_line(line):
+    return LEADING_MARKER.sub("", line.replace("**", "").replace("__", "").strip()).strip()
+
+# Function to split a heading line into (normalized label, text after the colon); None if it is not a heading
+def _heading(line):
+    text = line.strip()
+    hashes = text.startswith("#")
+    text = clean_line(text.lstrip("#"))
+    label, colon, rest = text.partition(":")
+    if not colon and not hashes:
+        return None
+    return " ".join(label.lower().split()), rest.strip()
+
+# Incremental parser for sectioned model output. Text is fed in chunks as it streams in; every complete line is
+# looked at once, and a section is returned as soon as the next section's heading (or the end) closes it.
+# Text before the first heading is ignored, and each section is taken from its first occurrence.
+class SectionParser:
+    def __init__(self, mode):
+        self.layout = SECTION_LAYOUTS[mode]
+        self._labels = {label: key for key, labels in self.layout for label in labels}
+        self._buffer = ""
+        self._current = None
+        self._lines = []
+        self.sections = {}
+
+    # Function to add streamed text; returns the (key, text) sections this chunk closed
+    def feed(self, chunk):
+        self._buffer += chunk
+        closed = []
+        start = 0
+        end = self._buffer.find("\n")
+        while end >= 0:
+            closed += self._line(self._buffer[start:end])
+            start = end + 1
+            end = self._buffer.find("\n", start)
+        self._buffer = self._buffer[start:]
+        return closed
+
+    # Function to end the stream; returns the sections still open
+    def close(self):
+        closed = self._line(self._buffer) if self._buffer else []
+        self._buffer = ""
+        return closed + self._close_current()
+
+    # Function to get the section being written right now as (key, text so far), or None
+    def current(self):
+        if self._current is None:
+            return None
+        return self._current, "\n".join(self._lines).strip()
+
+    def _line(self, line):
+        heading = _heading(line)
+        key = self._labels.get(heading[0]) if heading else None
+        if key is None or key == self._current or key in self.sections:
+            if self._current is not None:
+                self._lines.append(clean_line(line))
+            return []
+        closed = self._close_current()
+        label, rest = heading
+        self._current = key
+        self._lines = [f"{FIELD_HEADINGS[label]}: {rest}" if label in FIELD_HEADINGS else rest]
+        return closed
+
+    def _close_current(self):
+        key = self._current
+        if key is None:
+            return []
+        # Collapse the blank lines the model puts between list items
+        text = BLANK_LINES.sub("\n\n", "\n".join(self._lines).strip())
+        self.sections[key] = text
+        self._current = None
+        self._lines = []
+        return [(key, text)]
+
+# Function to parse a complete response; returns {key: text} for the sections found
+def parse_sections(text, mode):
+    parser = SectionParser(mode)
+    parser.feed(text)
+    parser.close()
+    return parser.sections
+
+# Function to pass streamed chunks through unchanged while calling `on_section(key, text)` as sections close
+def watch_sections(chunks, mode, on_section):
+    parser = SectionParser(mode)
+    for chunk in chunks:
+        for key, text in parser.feed(chunk):
+            on_section(key, text)
+        yield chunk
+    for key, text in parser.close():
+        on_section(key, text)
+
+# Function to read the risk percentage out of an insurance risk section; None if it holds no number
+def risk_percentage(text):
+    if not text:
+        return None
+    match = PERCENTAGE.search(text)
+    if match:
+        return float(match.group(1))
+    match = NUMBER.search(text)
+    return float(match.group(0)) if match else None
@@ -0,0 +1,153 @@
+import hashlib
+import os
+from collections import OrderedDict
+
+from medusa.cache import normalize_prompt
+from medusa.documents import prepare_upload
+
+STATE_KEY = "medusa_session_results"
+MAX_SESSION_BYTES = int(float(os.getenv("MEDUSA_SESSION_MAX_MB", "64")) * 1024 * 1024)
+
+# Function to get a stable id for an uploaded file across reruns
+def upload_id(uploaded_file):
+    return getattr(uploaded_file, "file_id", None) or f"{uploaded_file.name}:{uploaded_file.size}"
+
+def _prompt_key(prompt):
+    return hashlib.sha1(normalize_prompt(prompt).encode("utf-8")).hexdigest()[:16]
+
+# Function to estimate how much memory a stored entry holds right now; uploads fill their caches lazily
+# (decoded frames, previews, prepared regions), so the size is re-measured instead of fixed when stored
+def _entry_size(entry):
+    size = 0
+    image = entry.get("image")
+    if image is not None:
+        size += image.memory_bytes
+    if entry.get("analysis"):
+        size += len(entry["analysis"].encode("utf-8"))
+    sections = entry.get("sections") or ()
+    for section in sections.values() if isinstance(sections, dict) else sections:
+        size += len(section.encode("utf-8"))
+    for report in entry.get("reports", {}).values():
+        size += len(report)
+    return size
+
+# Per-session store for decoded uploads, analyses and rendered reports that survives Streamlit reruns.
+# Entries are keyed by mode and upload id (and prompt for results) and evicted LRU past `max_bytes`,
+# checked whenever an entry is read or stored.
+class SessionResults:
+    def __init__(self, state, max_bytes=MAX_SESSION_BYTES):
+        if STATE_KEY not in state:
+            state[STATE_KEY] = OrderedDict()
+        self._entries = state[STATE_KEY]
+        self.max_bytes = max_bytes
+
+    def _get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self._evict()
+        return entry
+
+    def _put(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        self._evict()
+
+    # Function to evict least recently used entries past `max_bytes`, but never the most recent one
+    def _evict(self):
+        sizes = [_entry_size(entry) for entry in self._entries.values()]
+        total = sum(sizes)
+        while total > self.max_bytes and len(self._entries) > 1:
+            self._entries.popitem(last=False)
+            total -= sizes.pop(0)
+
+    def total_bytes(self):
+        return sum(_entry_size(entry) for entry in self._entries.values())
+
+    # Function to drop everything stored for `mode` that does not belong to the current uploads
+    def retain(self, mode, uploaded_files):
+        current = {upload_id(uploaded_file) for uploaded_file in uploaded_files if uploaded_file is not None}
+        for key in [key for key in self._entries if key[1] == mode and key[2] not in current]:
+            del self._entries[key]
+
+    # Function to get the preprocessed upload (or multi-page document), decoding it only the first time it is seen
+    def image(self, uploaded_file, mode):
+        key = ("image", mode, upload_id(uploaded_file))
+        entry = self._get(key)
+        if entry is None:
+            entry = {"image": prepare_upload(uploaded_file, mode)}
+            self._put(key, entry)
+        return entry["image"]
+
+    # Function to get the stored result for this upload and prompt, or None
+    def result(self, uploaded_file, mode, prompt):
+        if uploaded_file is None:
+            return None
+        return self._get(("result", mode, upload_id(uploaded_file), _prompt_key(prompt)))
+
+    # Function to store or update the result for this upload and prompt; results for older prompts are dropped
+    def store_result(self, uploaded_file, mode, prompt, **values):
+        file_id = upload_id(uploaded_file)
+        key = ("result", mode, file_id, _prompt_key(prompt))
+        for stale in [other for other in self._entries if other[:3] == key[:3] and other != key]:
+            del self._entries[stale]
+        entry = dict(self._entries.get(key) or {"reports": {}})
+        reports = values.pop("reports", None)
+        entry.update(values)
+        if reports:
+            entry["reports"] = dict(entry["reports"], **reports)
+        self._put(key, entry)
+        return entry
+
+JOBS_KEY = "medusa_session_jobs"
+MAX_SESSION_JOBS = int(os.getenv("MEDUSA_SESSION_MAX_JOBS", "20"))
+
+# Per-session record of background jobs, so submitted work is found again after reruns and page switches.
+# The jobs themselves (and their results) live in the shared job queue.
+class SessionJobs:
+    def __init__(self, state, queue, max_jobs=MAX_SESSION_JOBS):
+        if JOBS_KEY not in state:
+            state[JOBS_KEY] = OrderedDict()
+        self._records = state[JOBS_KEY]
+        self.queue = queue
+        self.max_jobs = max_jobs
+
+    # Function to submit a job for an upload; an unfinished earlier job for the same upload is cancelled
+    def submit(self, mode, uploaded_file, prompt, fn, *args, **kwargs):
+        file_id = upload_id(uploaded_file)
+        for job_id, record in list(self._records.items()):
+            if record["mode"] == mode and record["upload"] == file_id:
+                self.queue.cancel(job_id)
+                del self._records[job_id]
+        job_id = self.queue.submit(mode, uploaded_file.name, fn, *args, **kwargs)
+        self._records[job_id] = {"mode": mode, "upload": file_id, "label": uploaded_file.name, "prompt": prompt}
+        while len(self._records) > self.max_jobs:
+            self._records.popitem(last=False)
+        return job_id
+
+    # Function to list (job_id, record, job) for this session's jobs in `mode`, forgetting jobs the queue has pruned
+    def jobs(self, mode):
+        found = []
+        for job_id, record in list(self._records.items()):
+            if record["mode"] != mode:
+                continue
+            job = self.queue.get(job_id)
+            if job is None:
+                del self._records[job_id]
+                continue
+            found.append((job_id, record, job))
+        return found
+
+    # Function to get (job_id, record, job) for the latest job on this upload, or None
+    def find(self, mode, uploaded_file):
+        file_id = upload_id(uploaded_file)
+        for job_id, record, job in reversed(self.jobs(mode)):
+            if record["upload"] == file_id:
+                return job_id, record, job
+        return None
+
+    def cancel(self, job_id):
+        return self.queue.cancel(job_id)
+
+    def forget(self, job_id):
+        self._records.pop(job_id, None)
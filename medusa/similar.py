@@ -0,0 +1,162 @@
+import functools
+import os
+import threading
+
+from PIL import Image as PILImage
+
+HASH_BITS = 64
+# Share of matching hash bits above which an earlier image is a candidate for reuse
+NEAR_DUPLICATE_SIMILARITY = float(os.getenv("MEDUSA_NEAR_DUPLICATE_SIMILARITY", "0.9"))
+# Candidates are only offered once their 1024-bit signature confirms the match at this similarity. Re-encoded and
+# rescaled copies stay within a few percent; documents built on the same template with different text do not.
+SIGNATURE_BITS = 1024
+CONFIRM_SIMILARITY = float(os.getenv("MEDUSA_NEAR_DUPLICATE_CONFIRM", "0.97"))
+# Modes whose analyses may be offered for near-duplicates. Document modes are left out by default: the hashes
+# see layout rather than text, so two patients' forms on the same template look alike.
+NEAR_DUPLICATE_MODES = frozenset(
+    mode.strip() for mode in os.getenv("MEDUSA_NEAR_DUPLICATE_MODES", "imaging").split(",") if mode.strip()
+)
+# At most this many candidates are checked for a stored result, nearest first
+MAX_CANDIDATES = 8
+# Thumbnails with less grayscale spread than this are treated as blank
+MIN_CONTRAST = 2.0
+
+# Function to build the orthonormal DCT-II matrix used by the perceptual hash
+@functools.lru_cache(maxsize=1)
+def _dct_matrix(size):
+    import numpy as np
+
+    k = np.arange(size)[:, None]
+    n = np.arange(size)[None, :]
+    matrix = np.cos(np.pi * (2 * n + 1) * k / (2 * size)) * np.sqrt(2 / size)
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+def _dct_bits(pixels, size, keep):
+    import numpy as np
+
+    matrix = _dct_matrix(size)
+    low = (matrix @ pixels @ matrix.T)[:keep, :keep].flatten()
+    # The DC term only carries overall brightness, so it is left out of the median
+    return low > np.median(low[1:])
+
+def _thumbnail(image, size):
+    import numpy as np
+
+    return np.asarray(image.convert("L").resize((size, size), PILImage.Resampling.LANCZOS), dtype=np.float64)
+
+# Function to compute a 64-bit pHash: the low-frequency DCT coefficients of a 32×32 grayscale thumbnail,
+# compared to their median. Re-compression, rescaling and small crops or exposure changes flip few bits.
+# Returns None for near-uniform images (blank pages), whose hashes would be noise and match each other.
+def perceptual_hash(image):
+    import numpy as np
+
+    pixels = _thumbnail(image, 32)
+    if pixels.std() < MIN_CONTRAST:
+        return None
+    return int.from_bytes(np.packbits(_dct_bits(pixels, 32, 8)).tobytes(), "big")
+
+# Function to compute the 1024-bit signature that confirms a pHash match: the same construction on a 128×128
+# thumbnail, keeping 32×32 coefficients, fine enough to tell lines of text apart. Returns 128 bytes.
+def image_signature(image):
+    import numpy as np
+
+    return np.packbits(_dct_bits(_thumbnail(image, 128), 128, 32)).tobytes()
+
+def _popcount(values):
+    import numpy as np
+
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    return np.unpackbits(values.view(np.uint8)).reshape(-1, HASH_BITS).sum(axis=1)
+
+# Function to count differing bits between each row of `rows` and `key` (uint8 arrays)
+def _bit_distances(rows, key):
+    import numpy as np
+
+    return np.unpackbits(rows ^ key, axis=1).sum(axis=1)
+
+# Perceptual hashes of analyzed images, kept in flat arrays (8-byte hash, 128-byte signature, 32-byte fingerprint
+# and owner per image) so a Hamming-distance search over hundreds of thousands of images is one vectorized pass.
+# Every entry belongs to the session that uploaded the image and is only ever matched for that session. Sessions
+# live in one process, so the index is kept in memory only; it is lost on restart along with the sessions.
+class PerceptualIndex:
+    def __init__(self, max_entries=500000):
+        import numpy as np
+
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._hashes = np.zeros(1024, dtype=np.uint64)
+        self._signatures = np.zeros((1024, SIGNATURE_BITS // 8), dtype=np.uint8)
+        self._fingerprints = np.zeros((1024, 32), dtype=np.uint8)
+        self._owners = np.zeros(1024, dtype=np.int64)
+        self._owner_codes = {}
+        self._count = 0
+
+    def _owner_code(self, owner):
+        return self._owner_codes.setdefault(owner, len(self._owner_codes) + 1)
+
+    def _append(self, owner, fingerprint, phash, signature):
+        import numpy as np
+
+        if self._count == len(self._hashes):
+            self._hashes = np.concatenate([self._hashes, np.zeros_like(self._hashes)])
+            self._signatures = np.concatenate([self._signatures, np.zeros_like(self._signatures)])
+            self._fingerprints = np.concatenate([self._fingerprints, np.zeros_like(self._fingerprints)])
+            self._owners = np.concatenate([self._owners, np.zeros_like(self._owners)])
+        self._hashes[self._count] = phash
+        self._signatures[self._count] = np.frombuffer(signature, dtype=np.uint8)
+        self._fingerprints[self._count] = np.frombuffer(bytes.fromhex(fingerprint), dtype=np.uint8)
+        self._owners[self._count] = self._owner_code(owner)
+        self._count += 1
+
+    # Function to drop the oldest hashes once the index is over its size limit
+    def _trim(self):
+        excess = self._count - self.max_entries
+        if excess <= 0:
+            return
+        for array in (self._hashes, self._signatures, self._fingerprints, self._owners):
+            array[:self._count - excess] = array[excess:self._count]
+        self._count -= excess
+
+    # Function to remember the hash and signature of an image analyzed for `owner`
+    def add(self, owner, fingerprint, phash, signature):
+        import numpy as np
+
+        with self._lock:
+            key = np.frombuffer(bytes.fromhex(fingerprint), dtype=np.uint8)
+            mine = self._owners[:self._count] == self._owner_code(owner)
+            if (self._fingerprints[:self._count][mine] == key).all(axis=1).any():
+                return
+            self._append(owner, fingerprint, phash, signature)
+            self._trim()
+
+    # Function to find images stored for `owner` within `max_distance` differing hash bits whose signatures also
+    # match at `min_confirm`, nearest first; returns (fingerprint, signature similarity) pairs
+    def find(self, owner, phash, signature, max_distance, min_confirm=CONFIRM_SIMILARITY, exclude=None, limit=MAX_CANDIDATES):
+        import numpy as np
+
+        with self._lock:
+            code = self._owner_codes.get(owner)
+            if code is None:
+                return []
+            distances = _popcount(self._hashes[:self._count] ^ np.uint64(phash))
+            candidates = np.flatnonzero((distances <= max_distance) & (self._owners[:self._count] == code))
+            confirm = _bit_distances(self._signatures[candidates], np.frombuffer(signature, dtype=np.uint8))
+            similarity = 1 - confirm / SIGNATURE_BITS
+            keep = similarity >= min_confirm
+            candidates, similarity = candidates[keep], similarity[keep]
+            order = np.argsort(-similarity, kind="stable")[:limit + 1]
+            fingerprints = self._fingerprints[candidates[order]]
+            similarity = similarity[order]
+        found = [(fingerprint.tobytes().hex(), float(value)) for fingerprint, value in zip(fingerprints, similarity)]
+        return [(fingerprint, value) for fingerprint, value in found if fingerprint != exclude][:limit]
+
+    # Function to forget every stored hash
+    def clear(self):
+        with self._lock:
+            self._count = 0
+            self._owner_codes.clear()
+
+    def __len__(self):
+        return self._count
@@ -0,0 +1,55 @@
+import pytest
+
+from medusa.backends import BackendConfigError, BackendError, FakeBackend, create_backend, detect_mode, fake_response
+from medusa.prompts import DEFAULT_PROMPTS, build_combined_prompt, section_start
+
+
+def test_detect_mode():
+    assert detect_mode(" \n".join(DEFAULT_PROMPTS["coding"].split())) == "coding"
+    assert detect_mode("Suggest a diet for this patient") == "treatment"
+    assert detect_mode("What is shown here?") == "imaging"
+
+
+def test_combined_prompts_get_one_section_per_task():
+    text = fake_response(FakeBackend().responses, build_combined_prompt(["coding", "insurance"]))
+    assert text.index(section_start("coding")) < text.index(section_start("insurance"))
+    assert section_start("treatment") not in text
+
+
+def test_stream_yields_the_generated_text():
+    backend = FakeBackend(latency=0, tokens_per_second=0)
+    generation = backend.generate(DEFAULT_PROMPTS["treatment"], None)
+    chunks = list(backend.stream(DEFAULT_PROMPTS["treatment"], None))
+    assert len(chunks) > 1
+    assert "".join(chunks) == generation.text
+    assert generation.input_tokens > 0 and generation.output_tokens > 0
+
+
+def test_failures_are_retryable_and_seeded():
+    def outcomes(seed):
+        backend = FakeBackend(latency=0, tokens_per_second=0, failure_rate=0.5, seed=seed)
+        results = []
+        for _ in range(20):
+            try:
+                backend.generate("Describe", None)
+                results.append(True)
+            except BackendError as e:
+                assert e.retryable
+                results.append(False)
+        return results
+
+    assert outcomes(7) == outcomes(7)
+    assert True in outcomes(7) and False in outcomes(7)
+
+
+def test_create_backend(monkeypatch):
+    monkeypatch.setenv("MEDUSA_FAKE_LATENCY", "0.25")
+    monkeypatch.setenv("MEDUSA_FAKE_FAST_LATENCY", "0.05")
+    assert create_backend("fake").latency == 0.25
+    fast = create_backend("fake", model_name="fast-model")
+    assert (fast.name, fast.latency) == ("fast-model", 0.05)
+    with pytest.raises(BackendConfigError):
+        create_backend("other")
+    monkeypatch.delenv("GOOGLE_API_KEY", raising=False)
+    with pytest.raises(BackendConfigError):
+        create_backend("gemini")
@@ -0,0 +1,95 @@
+import io
+import json
+
+import pytest
+from PIL import Image
+
+from medusa import batch
+from medusa.batch import discover_items, load_completed, run_batch
+
+
+@pytest.fixture(autouse=True)
+def fake_model(monkeypatch):
+    for name, value in {
+        "MEDUSA_BACKEND": "fake", "MEDUSA_FAKE_LATENCY": "0", "MEDUSA_FAKE_TOKENS_PER_SECOND": "0",
+        "MEDUSA_CACHE_PATH": "", "MEDUSA_NEAR_DUPLICATES": "0", "MEDUSA_FAST_MODEL": "", "MEDUSA_RPM": "",
+    }.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.setattr(batch, "_worker_state", None)
+
+
+def _write_image(path, format, colour=(90, 120, 150)):
+    Image.new("RGB", (320, 240), colour).save(path, format)
+
+
+def _read(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_discover_items_from_directory_and_manifest(tmp_path):
+    (tmp_path / "scans" / "ward").mkdir(parents=True)
+    _write_image(tmp_path / "scans" / "ward" / "b.png", "PNG")
+    _write_image(tmp_path / "scans" / "a.jpg", "JPEG")
+    (tmp_path / "scans" / "notes.txt").write_text("not an image")
+    assert [item["id"] for item in discover_items(str(tmp_path / "scans"))] == ["a.jpg", "ward/b.png"]
+
+    manifest = tmp_path / "manifest.jsonl"
+    manifest.write_text('# comment\n{"path": "scans/a.jpg", "id": "first", "prompt": "Describe"}\nscans/ward/b.png\n')
+    items = discover_items(str(manifest))
+    assert [(item["id"], item.get("prompt")) for item in items] == [("first", "Describe"), ("scans/ward/b.png", None)]
+    assert items[0]["path"] == str(tmp_path / "scans" / "a.jpg")
+
+
+def test_same_name_with_different_extensions_gets_separate_reports(tmp_path):
+    source = tmp_path / "scans"
+    source.mkdir()
+    _write_image(source / "scan.jpg", "JPEG")
+    _write_image(source / "scan.png", "PNG", (10, 20, 30))
+    output = tmp_path / "results.jsonl"
+    summary = run_batch(discover_items(str(source)), "imaging", str(output), workers=2, reports_dir=str(tmp_path / "reports"), log=io.StringIO())
+    assert summary == {"skipped": 0, "ok": 2, "error": 0}
+    reports = sorted(record["report"] for record in _read(output))
+    assert reports == [str(tmp_path / "reports" / "scan.jpg.pdf"), str(tmp_path / "reports" / "scan.png.pdf")]
+    assert all(open(report, "rb").read(4) == b"%PDF" for report in reports)
+
+
+def test_rerun_resumes_after_a_crash(tmp_path):
+    source = tmp_path / "scans"
+    source.mkdir()
+    for index in range(3):
+        _write_image(source / f"{index}.png", "PNG", (index * 40, 0, 0))
+    (source / "broken.png").write_bytes(b"not a png")
+    output = tmp_path / "results.jsonl"
+    items = discover_items(str(source))
+    first = run_batch(items, "insurance", str(output), log=io.StringIO())
+    assert first == {"skipped": 0, "ok": 3, "error": 1}
+    assert all(record["risk_percentage"] is not None for record in _read(output) if record["status"] == "ok")
+
+    # A crash mid-write leaves a truncated last line; failed items run again, finished ones do not
+    with open(output, "a") as results:
+        results.write('{"id": "0.png", "sta')
+    assert load_completed(str(output)) == {"0.png", "1.png", "2.png"}
+    second = run_batch(items, "insurance", str(output), log=io.StringIO())
+    assert second == {"skipped": 3, "ok": 0, "error": 1}
+    # The next record starts on a line of its own
+    lines = output.read_text().splitlines()
+    assert lines[-2] == '{"id": "0.png", "sta'
+    assert json.loads(lines[-1])["id"] == "broken.png"
+
+
+def test_rpm_limits_upstream_calls_and_is_split_between_processes(tmp_path, monkeypatch):
+    frames = [Image.new("RGB", (320, 240), (index * 60, 0, 0)) for index in range(3)]
+    frames[0].save(tmp_path / "report.tiff", "TIFF", save_all=True, append_images=frames[1:])
+    output = tmp_path / "results.jsonl"
+    run_batch(discover_items(str(tmp_path)), "transcription", str(output), requests_per_minute=600, log=io.StringIO())
+    assert _read(output)[0]["pages"] == 3
+    gateway = batch._worker_state[1]
+    # Each page went through the gateway's request limit
+    assert gateway.request_bucket.rate == 10
+    assert gateway.stats()["upstream_calls"] == 3
+
+    monkeypatch.setenv("MEDUSA_RPM", "120")
+    monkeypatch.setenv("MEDUSA_TPM", "60000")
+    gateway, _ = batch._get_worker_state((60, 4))
+    assert gateway.request_bucket.rate * 60 == 15
+    assert gateway.token_bucket.rate * 60 == 15000
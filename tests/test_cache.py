@@ -0,0 +1,93 @@
+import time
+
+from PIL import Image
+
+from medusa.cache import DiskTier, MemoryTier, ResultCache, image_fingerprint, make_cache_key
+
+
+def test_cache_key_ignores_whitespace_but_not_model():
+    key = make_cache_key("abc", "Describe  the\nimage", "model-a")
+    assert key == make_cache_key("abc", "Describe the image", "model-a")
+    assert key != make_cache_key("abc", "Describe the image", "model-b")
+
+
+def test_fingerprint_depends_on_pixels_only():
+    image = Image.new("RGB", (8, 8), (10, 20, 30))
+    copy = image.copy()
+    copy.info["comment"] = "metadata"
+    assert image_fingerprint(image) == image_fingerprint(copy)
+    copy.putpixel((0, 0), (11, 20, 30))
+    assert image_fingerprint(image) != image_fingerprint(copy)
+
+
+def test_memory_tier_evicts_least_recently_used():
+    tier = MemoryTier(max_entries=2, ttl=0)
+    tier.put("a", "1")
+    tier.put("b", "2")
+    assert tier.get("a") == "1"
+    tier.put("c", "3")
+    assert tier.get("b") is None
+    assert tier.get("a") == "1"
+    assert len(tier) == 2
+
+
+def test_memory_tier_expires_entries():
+    tier = MemoryTier(ttl=10)
+    tier.put("a", "1", created=time.time() - 11)
+    assert tier.get("a") is None
+    assert len(tier) == 0
+
+
+def test_disk_tier_persists_and_evicts(tmp_path):
+    path = str(tmp_path / "cache" / "results.sqlite3")
+    tier = DiskTier(path, max_entries=2)
+    tier.put("a", "1")
+    tier.put("b", "2")
+    time.sleep(0.01)
+    assert tier.get("a")[0] == "1"
+    tier.put("c", "3")
+    assert len(tier) == 2
+    reopened = DiskTier(path, max_entries=2)
+    assert reopened.get("b") is None
+    assert reopened.get("a")[0] == "1"
+    assert reopened.get("c")[0] == "3"
+
+
+def test_disk_tier_expires_entries(tmp_path):
+    tier = DiskTier(str(tmp_path / "results.sqlite3"), ttl=10)
+    tier.put("a", "1")
+    tier._conn.execute("UPDATE results SET created = created - 11")
+    assert tier.get("a") is None
+    assert len(tier) == 0
+
+
+def test_result_cache_promotes_disk_hits_to_memory(tmp_path):
+    disk = DiskTier(str(tmp_path / "results.sqlite3"))
+    disk.put("key", "analysis")
+    cache = ResultCache(MemoryTier(), disk)
+    assert cache.get("key") == "analysis"
+    assert cache.get("key") == "analysis"
+    assert cache.get("other") is None
+    stats = cache.stats()
+    assert (stats["disk_hits"], stats["memory_hits"], stats["misses"]) == (1, 1, 1)
+    assert stats["hit_rate"] == 2 / 3
+    assert stats["memory_entries"] == 1
+
+
+def test_peek_does_not_count(tmp_path):
+    cache = ResultCache(MemoryTier(), DiskTier(str(tmp_path / "results.sqlite3")))
+    cache.put("key", "analysis")
+    cache.memory.clear()
+    assert cache.peek("key") == "analysis"
+    assert cache.peek("missing") is None
+    stats = cache.stats()
+    assert stats["memory_hits"] + stats["disk_hits"] + stats["misses"] == 0
+    assert stats["stores"] == 1
+
+
+def test_clear_empties_both_tiers(tmp_path):
+    cache = ResultCache(MemoryTier(), DiskTier(str(tmp_path / "results.sqlite3")))
+    cache.put("key", "analysis")
+    cache.clear()
+    assert cache.get("key") is None
+    assert cache.stats()["disk_entries"] == 0
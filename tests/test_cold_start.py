@@ -0,0 +1,42 @@
+import importlib.util
+import json
+import os
+
+import pytest
+
+BENCHMARKS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks")
+
+
+def _load(name):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(BENCHMARKS, f"{name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+cold_start = _load("cold_start")
+
+
+def test_parse_importtime_and_package_totals():
+    stderr = "\n".join([
+        "import time: self [us] | cumulative | imported package",
+        "import time:       100 |        100 |   medusa.metrics",
+        "import time:        50 |        300 | medusa",
+        "import time:        20 |         20 |     dotenv.parser",
+        "import time:        30 |         60 |   dotenv.main",
+        "import time:        40 |        100 | dotenv",
+        "unrelated output",
+    ])
+    rows = cold_start.parse_importtime(stderr)
+    assert rows[0] == ("medusa.metrics", 100, 100, 1)
+    assert rows[2] == ("dotenv.parser", 20, 20, 2)
+    assert cold_start.package_totals(rows) == {"medusa": 300, "dotenv": 100}
+
+
+# Import times depend on the machine, so only the deferred imports are checked here; the benchmark checks the budget
+def test_first_render_loads_no_deferred_module():
+    pytest.importorskip("streamlit")
+    with open(os.path.join(BENCHMARKS, "cold_start_budget.json"), encoding="utf-8") as budget_file:
+        budget = json.load(budget_file)
+    _, loaded = cold_start.measure(budget["deferred_modules"])
+    assert loaded == []
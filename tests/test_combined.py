@@ -0,0 +1,59 @@
+from PIL import Image
+
+from medusa.analysis import analysis_key
+from medusa.backends import Generation
+from medusa.cache import MemoryTier, ResultCache
+from medusa.combined import parse_combined_response, run_combined_analysis
+from medusa.preprocess import preprocess_image
+from medusa.prompts import DEFAULT_PROMPTS, section_end, section_start
+
+TASKS = ["transcription", "coding", "insurance"]
+
+
+def _section(task, body, closed=True):
+    return f"{section_start(task)}\n{body}\n" + (f"{section_end(task)}\n" if closed else "")
+
+
+def test_every_section_is_found():
+    text = "Preamble\n" + "".join(_section(task, f"{task} answer") for task in TASKS)
+    assert parse_combined_response(text, TASKS) == {task: f"{task} answer" for task in TASKS}
+
+
+def test_missing_or_empty_sections_are_none():
+    text = _section("transcription", "Amoxicillin 500 mg") + _section("coding", "  ")
+    assert parse_combined_response(text, TASKS) == {"transcription": "Amoxicillin 500 mg", "coding": None, "insurance": None}
+
+
+def test_unclosed_section_runs_until_the_next_one():
+    text = _section("transcription", "Amoxicillin 500 mg", closed=False) + _section("coding", "J02.9")
+    assert parse_combined_response(text, TASKS)["transcription"] == "Amoxicillin 500 mg"
+
+
+def test_unclosed_last_section_is_not_trusted():
+    text = _section("transcription", "Amoxicillin 500 mg") + _section("insurance", "Risk Percentage: 3", closed=False)
+    assert parse_combined_response(text, TASKS)["insurance"] is None
+
+
+class CombinedBackend:
+    name = "stub"
+
+    def __init__(self):
+        self.prompts = []
+
+    def generate(self, prompt, blob):
+        self.prompts.append(prompt)
+        if section_start("transcription") in prompt:
+            # The combined answer is cut off before the insurance section
+            return Generation(_section("transcription", "Amoxicillin 500 mg") + _section("coding", "J02.9"))
+        return Generation("separate answer")
+
+
+def test_failed_sections_fall_back_and_answers_seed_the_task_cache():
+    backend = CombinedBackend()
+    cache = ResultCache(MemoryTier())
+    image = preprocess_image(Image.new("RGB", (64, 64), (200, 200, 200)), "combined")
+    sections, failed = run_combined_analysis(backend, cache, image, TASKS)
+    assert failed == ["insurance"]
+    assert sections == {"transcription": "Amoxicillin 500 mg", "coding": "J02.9", "insurance": "separate answer"}
+    assert backend.prompts[1:] == [DEFAULT_PROMPTS["insurance"]]
+    assert cache.peek(analysis_key(image.fingerprint, DEFAULT_PROMPTS["coding"], backend.name, "coding")) == "J02.9"
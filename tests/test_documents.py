@@ -0,0 +1,107 @@
+import io
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+from medusa import preprocess
+from medusa.analysis import map_pages, merge_page_analyses, run_analysis
+from medusa.backends import FakeBackend
+from medusa.cache import MemoryTier, ResultCache
+from medusa.documents import Document, prepare_bytes
+from medusa.prompts import DEFAULT_PROMPTS
+
+
+class StubDocument:
+    def __init__(self, page_count):
+        self.page_count = page_count
+        self.rendered = []
+
+    def page(self, index):
+        self.rendered.append(index)
+        return index
+
+
+def test_results_come_back_in_page_order_with_bounded_concurrency():
+    document = StubDocument(12)
+    lock = threading.Lock()
+    running = [0, 0]
+    progress = []
+
+    def analyze(page):
+        with lock:
+            running[0] += 1
+            running[1] = max(running[1], running[0])
+        # Later pages finish first
+        time.sleep(0.002 * (12 - page))
+        with lock:
+            running[0] -= 1
+        return f"page {page}"
+
+    results = map_pages(document, analyze, max_workers=3, on_page=lambda done, total, _: progress.append((done, total)))
+    assert results == [f"page {index}" for index in range(12)]
+    assert running[1] <= 3
+    assert progress == [(done, 12) for done in range(1, 13)]
+
+
+def test_a_failed_page_stops_pages_not_yet_started():
+    document = StubDocument(20)
+
+    def analyze(page):
+        if page == 1:
+            raise ValueError("unreadable page")
+        time.sleep(0.01)
+        return page
+
+    with pytest.raises(ValueError):
+        map_pages(document, analyze, max_workers=2)
+    assert len(document.rendered) < 20
+
+
+def test_merge_page_analyses():
+    assert merge_page_analyses(["only page"]) == "only page"
+    assert merge_page_analyses([None]) == ""
+    assert merge_page_analyses(["first", None, "third"]) == "**Page 1**\n\nfirst\n\n**Page 3**\n\nthird"
+
+
+def _tiff(pages, size=(300, 400)):
+    frames = [Image.new("RGB", size, (255, 255, 255 - 40 * index)) for index in range(pages)]
+    buffer = io.BytesIO()
+    frames[0].save(buffer, "TIFF", save_all=True, append_images=frames[1:])
+    return buffer.getvalue()
+
+
+def test_multi_page_tiff_is_a_document_rendered_per_page():
+    document = prepare_bytes(_tiff(3), "transcription")
+    assert isinstance(document, Document)
+    assert document.page_count == 3
+    pages = map_pages(document, lambda page: page.image.size)
+    assert pages == [(300, 400)] * 3
+    assert document.page(0) is document.page(0)
+    assert not isinstance(prepare_bytes(_tiff(1), "transcription"), Document)
+
+
+def test_multi_page_tiff_upload_is_analyzed_page_by_page_in_imaging():
+    document = prepare_bytes(_tiff(3), "imaging")
+    assert isinstance(document, Document)
+    backend = FakeBackend(latency=0, tokens_per_second=0)
+    cache = ResultCache(MemoryTier())
+    # The default view is the first page; a picked page is prepared and kept on its own
+    assert run_analysis(backend, cache, document, DEFAULT_PROMPTS["imaging"])
+    page = document.prepare(2)
+    assert document.prepare(2) is page
+    assert page.data[:2] == b"\xff\xd8"
+    assert run_analysis(backend, cache, page, DEFAULT_PROMPTS["imaging"])
+    assert backend.calls == 2
+    assert "page 3 shown" in document.describe()
+
+
+def test_tiff_frames_are_decoded_under_the_limit_they_were_opened_with(monkeypatch):
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1000 * 1000)
+    monkeypatch.setattr(preprocess, "_DEFAULT_MAX_PIXELS", 1000 * 1000)
+    data = _tiff(2, size=(1500, 1400))
+    assert prepare_bytes(data, "imaging").prepare(1).original_size == (1500, 1400)
+    assert Image.MAX_IMAGE_PIXELS == 1000 * 1000
+    with pytest.raises(Image.DecompressionBombError):
+        prepare_bytes(data, "transcription")
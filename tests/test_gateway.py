@@ -0,0 +1,156 @@
+import threading
+import time
+import uuid
+
+import pytest
+from PIL import Image
+
+from medusa.analysis import run_analysis
+from medusa.backends import BackendError, Generation
+from medusa.cache import MemoryTier, ResultCache
+from medusa.gateway import ModelGateway, is_retryable
+from medusa.metrics import metrics, set_session
+from medusa.preprocess import preprocess_image
+
+
+class StubBackend:
+    name = "stub"
+
+    def __init__(self, failures=(), release=None):
+        self.failures = list(failures)
+        self.release = release
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate(self, prompt, blob):
+        with self._lock:
+            self.calls += 1
+            failure = self.failures.pop(0) if self.failures else None
+        if self.release is not None:
+            self.release.wait(5)
+        if failure is not None:
+            raise failure
+        return Generation(f"answer to {prompt}", 100, 10)
+
+    def stream(self, prompt, blob):
+        yield self.generate(prompt, blob).text
+        yield " (end)"
+
+
+def test_identical_concurrent_requests_share_one_call():
+    release = threading.Event()
+    backend = StubBackend(release=release)
+    gateway = ModelGateway(backend)
+    blob = {"mime_type": "image/jpeg", "data": b"pixels"}
+    results = []
+
+    def ask(prompt):
+        results.append(gateway.generate(prompt, blob).text)
+
+    # Whitespace-only differences coalesce with the leader
+    threads = [threading.Thread(target=ask, args=("Describe  the image" if i % 2 else "Describe the image",)) for i in range(6)]
+    for thread in threads:
+        thread.start()
+    while gateway.stats()["coalesced"] < 5:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert backend.calls == 1
+    assert len(set(results)) == 1
+    stats = gateway.stats()
+    assert stats["coalesced"] == 5
+    assert stats["upstream_calls"] == 1
+
+
+def test_shared_calls_record_usage_once():
+    release = threading.Event()
+    backend = StubBackend(release=release)
+    gateway = ModelGateway(backend)
+    image = preprocess_image(Image.new("RGB", (64, 64), "white"), "imaging")
+    session = uuid.uuid4().hex
+    results = []
+
+    def analyze():
+        set_session(session)
+        results.append(run_analysis(gateway, ResultCache(MemoryTier()), image, "Describe"))
+
+    threads = [threading.Thread(target=analyze) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    while gateway.stats()["coalesced"] < 1:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert results == ["answer to Describe"] * 2
+    assert backend.calls == 1
+    assert [(row["requests"], row["input_tokens"], row["output_tokens"]) for row in metrics.usage(session=session)] == [(1, 100, 10)]
+
+
+def test_different_images_are_not_coalesced():
+    backend = StubBackend()
+    gateway = ModelGateway(backend)
+    gateway.generate("Describe", {"mime_type": "image/jpeg", "data": b"a"})
+    gateway.generate("Describe", {"mime_type": "image/jpeg", "data": b"b"})
+    assert backend.calls == 2
+
+
+def test_followers_see_the_leaders_error():
+    release = threading.Event()
+    backend = StubBackend(failures=[BackendError("bad request")], release=release)
+    gateway = ModelGateway(backend, max_retries=0)
+    errors = []
+
+    def ask():
+        try:
+            gateway.generate("Describe", None)
+        except BackendError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=ask) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    while gateway.stats()["coalesced"] < 2:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert backend.calls == 1
+    assert len(errors) == 3
+
+
+def test_retryable_errors_are_retried():
+    backend = StubBackend(failures=[BackendError("overloaded", retryable=True)] * 2)
+    gateway = ModelGateway(backend, max_retries=3, base_delay=0, max_delay=0)
+    assert gateway.generate("Describe", None).text == "answer to Describe"
+    stats = gateway.stats()
+    assert (stats["retries"], stats["upstream_calls"], stats["failures"]) == (2, 3, 0)
+
+
+def test_permanent_errors_are_not_retried():
+    backend = StubBackend(failures=[BackendError("invalid argument")])
+    gateway = ModelGateway(backend, max_retries=3, base_delay=0, max_delay=0)
+    with pytest.raises(BackendError):
+        gateway.generate("Describe", None)
+    assert backend.calls == 1
+    assert gateway.stats()["failures"] == 1
+
+
+def test_stream_is_retried_before_its_first_chunk():
+    backend = StubBackend(failures=[BackendError("overloaded", retryable=True)])
+    gateway = ModelGateway(backend, base_delay=0, max_delay=0)
+    assert "".join(gateway.stream("Describe", None)) == "answer to Describe (end)"
+    assert gateway.stats()["retries"] == 1
+
+
+def test_error_classification():
+    class ResourceExhausted(Exception):
+        pass
+
+    class HttpError(Exception):
+        code = 503
+
+    assert is_retryable(ResourceExhausted())
+    assert is_retryable(HttpError())
+    assert not is_retryable(ValueError())
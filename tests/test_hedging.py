@@ -0,0 +1,119 @@
+import threading
+import time
+
+import pytest
+
+from medusa.backends import FakeBackend, Generation, current_model_request, set_model_request
+from medusa.gateway import ModelGateway
+from medusa.hedging import HedgedBackend, ModelDeadlineExceeded
+
+
+class ScriptedBackend:
+    def __init__(self, name, delays):
+        self.name = name
+        self.delays = list(delays)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate(self, prompt, blob):
+        with self._lock:
+            self.calls += 1
+            delay = self.delays.pop(0) if self.delays else 0.0
+        time.sleep(delay)
+        return Generation(f"{self.name}: {prompt}")
+
+
+def test_deadline_is_enforced_per_mode():
+    backend = FakeBackend(latency=0.5, tokens_per_second=0)
+    hedged = HedgedBackend(backend, deadlines={"imaging": 0.05})
+    set_model_request("imaging")
+    with pytest.raises(ModelDeadlineExceeded):
+        hedged.generate("Describe", None)
+    set_model_request("coding")
+    assert hedged.generate("Describe", None).text
+    assert hedged.stats()["deadline_exceeded"] == 1
+
+
+def test_slow_call_is_hedged_through_the_limiter():
+    # Five quick calls establish the latency; the sixth stalls and its hedge answers first
+    backend = ScriptedBackend("full", [0.01] * 5 + [1.0])
+    hedged = HedgedBackend(backend, hedge_budget=1.0, min_samples=5, min_hedge_delay=0.05)
+    gateway = ModelGateway(hedged)
+    set_model_request("imaging")
+    for index in range(6):
+        gateway.generate(f"prompt {index}", None)
+    stats = hedged.stats()
+    assert (stats["hedges"], stats["hedge_wins"]) == (1, 1)
+    assert backend.calls == 7
+    gateway_stats = gateway.stats()
+    assert gateway_stats["extra_calls"] == 1
+    assert gateway_stats["upstream_calls"] == 7
+
+
+def test_hedges_are_denied_without_budget():
+    backend = ScriptedBackend("full", [0.01] * 5 + [0.3])
+    hedged = HedgedBackend(backend, hedge_budget=0.0, min_samples=5, min_hedge_delay=0.05)
+    set_model_request("imaging")
+    for index in range(6):
+        hedged.generate(f"prompt {index}", None)
+    assert hedged.stats()["hedges"] == 0
+    assert backend.calls == 6
+
+
+def test_failed_fast_tier_falls_back_to_full_model():
+    fast = FakeBackend(name="fast", latency=0, tokens_per_second=0, failure_rate=1.0)
+    full = ScriptedBackend("full", [])
+    hedged = HedgedBackend(full, fast_backend=fast)
+    gateway = ModelGateway(hedged, max_retries=0)
+    request = set_model_request("coding")
+    assert gateway.generate("Describe", None).text == "full: Describe"
+    assert request.tier == "full"
+    assert hedged.stats()["fallbacks"] == 1
+    # The fallback is a second upstream call for one admitted request
+    assert gateway.stats()["extra_calls"] == 1
+
+
+def test_upgrades_share_the_hedge_budget():
+    fast = ScriptedBackend("fast", [])
+    full = ScriptedBackend("full", [])
+    hedged = HedgedBackend(full, fast_backend=fast, hedge_budget=0.0, upgrade=True)
+    request = set_model_request("coding")
+    assert hedged.generate("Describe", None).text == "fast: Describe"
+    assert request.upgrade is None
+    assert hedged.stats()["upgrades_skipped"] == 1
+
+    hedged = HedgedBackend(full, fast_backend=fast, hedge_budget=1.0, upgrade=True)
+    request = set_model_request("coding")
+    hedged.generate("Describe", None)
+    assert request.upgrade.result(timeout=5).text == "full: Describe"
+    assert hedged.stats()["upgrades"] == 1
+
+
+def test_upgrades_are_skipped_when_the_rate_limit_is_spent():
+    fast = ScriptedBackend("fast", [])
+    full = ScriptedBackend("full", [])
+    hedged = HedgedBackend(full, fast_backend=fast, hedge_budget=1.0, upgrade=True)
+    # One request of burst: the answer itself takes it, so the upgrade does not fit right now
+    gateway = ModelGateway(hedged, requests_per_minute=6)
+    request = set_model_request("coding")
+    assert gateway.generate("Describe", None).text == "fast: Describe"
+    assert request.upgrade is None
+    assert hedged.stats()["upgrades_skipped"] == 1
+    assert full.calls == 0
+    assert gateway.stats()["extra_denied"] == 1
+
+
+def test_deadline_becomes_the_upstream_timeout():
+    seen = []
+
+    class TimeoutBackend(ScriptedBackend):
+        def generate(self, prompt, blob):
+            seen.append(current_model_request().timeout)
+            return super().generate(prompt, blob)
+
+    hedged = HedgedBackend(TimeoutBackend("full", []), deadlines={"coding": 20})
+    set_model_request("coding")
+    hedged.generate("Describe", None)
+    set_model_request("imaging")
+    hedged.generate("Describe", None)
+    assert seen == [20, 120.0]
@@ -0,0 +1,71 @@
+from medusa.icd10 import BUNDLED_PATH, INVALID, NON_BILLABLE, NOT_INDEXED, VALID, ICD10Index, load_index, read_code_file
+
+ENTRIES = [
+    ("E11", False, "Type 2 diabetes mellitus"),
+    ("E11.9", True, "Type 2 diabetes mellitus without complications"),
+    ("E11.65", True, "Type 2 diabetes mellitus with hyperglycemia"),
+    ("I10", True, "Essential (primary) hypertension"),
+    ("J45", False, "Asthma"),
+    ("J45.909", True, "Unspecified asthma, uncomplicated"),
+    ("O80", True, "Encounter for full-term uncomplicated delivery"),
+]
+
+
+def test_lookup_accepts_any_spelling():
+    index = ICD10Index(ENTRIES)
+    assert len(index) == 7
+    assert index.lookup("e11.9")["code"] == "E11.9"
+    assert index.lookup("E119")["billable"]
+    assert index.lookup("E11.0") is None
+
+
+def test_validate_statuses_and_suggestions():
+    index = ICD10Index(ENTRIES)
+    assert index.validate("I10")["status"] == VALID
+    header = index.validate("E11")
+    assert header["status"] == NON_BILLABLE
+    assert [entry["code"] for entry in header["suggestions"]] == ["E11.65", "E11.9"]
+    missing = index.validate("E11.649")
+    assert missing["status"] == NOT_INDEXED
+    assert [entry["code"] for entry in missing["suggestions"]] == ["E11"]
+
+
+def test_only_a_complete_index_reports_invalid_codes():
+    assert ICD10Index(ENTRIES, complete=True).validate("S72.001A")["status"] == INVALID
+    assert ICD10Index(ENTRIES).validate("S72.001A")["status"] == NOT_INDEXED
+
+
+def test_check_text_finds_codes_in_order_once():
+    index = ICD10Index(ENTRIES)
+    text = "- O80: delivery\nTakes vitamin B12 daily. Codes: e11.9, I10, E11.9\n| Z37 | outcome |"
+    assert [entry["code"] for entry in index.check_text(text)] == ["O80", "E11.9", "I10", "Z37"]
+
+
+def test_search_ranks_billable_codes_first():
+    index = ICD10Index(ENTRIES)
+    # Billable codes first, shorter codes before longer ones
+    assert [entry["code"] for entry in index.search("diab mellitus")] == ["E11.9", "E11.65", "E11"]
+    assert [entry["code"] for entry in index.search("J45")] == ["J45", "J45.909"]
+    assert index.search("fracture") == []
+
+
+def test_read_code_file_formats(tmp_path):
+    order = tmp_path / "order.txt"
+    order.write_text(
+        "00001 E11     0 Type 2 diabetes mellitus                                     Type 2 diabetes mellitus\n"
+        "00002 E119    1 Type 2 diabetes mellitus without complications               Type 2 diabetes mellitus without complications\n"
+    )
+    plain = tmp_path / "plain.txt"
+    plain.write_text("I10 Essential (primary) hypertension\n\n")
+    assert list(read_code_file(str(order))) == [
+        ("E11", False, "Type 2 diabetes mellitus"),
+        ("E119", True, "Type 2 diabetes mellitus without complications"),
+    ]
+    assert list(read_code_file(str(plain))) == [("I10", True, "Essential (primary) hypertension")]
+    assert not load_index(str(plain)).complete
+
+
+def test_bundled_index_is_never_complete():
+    index = load_index(BUNDLED_PATH)
+    assert not index.complete
+    assert index.source == "icd10cm_order.txt"
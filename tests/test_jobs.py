@@ -0,0 +1,118 @@
+import threading
+import time
+
+import pytest
+
+from medusa.jobs import CANCELLED, DONE, FAILED, JobQueue, JobQueueFull
+from medusa.session import SessionJobs
+
+
+class Upload:
+    def __init__(self, name):
+        self.name = name
+        self.file_id = name
+        self.size = 1
+
+
+def _wait(queue, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    job = queue.get(job_id)
+    while not job.done:
+        assert time.monotonic() < deadline, "job did not finish"
+        time.sleep(0.005)
+    return job
+
+
+def _blocking(release):
+    def run(job):
+        job.update(progress=0.5, message="Analyzing...")
+        release.wait(5)
+        job.update(progress=0.9)
+        return "analysis"
+    return run
+
+
+@pytest.fixture
+def queue():
+    queue = JobQueue(max_workers=1, max_pending=3)
+    yield queue
+    queue.shutdown()
+
+
+def test_finished_and_failed_jobs(queue):
+    done = _wait(queue, queue.submit("imaging", "scan.jpg", lambda job, value: value * 2, 21))
+    assert (done.status, done.result, done.progress) == (DONE, 42, 1.0)
+
+    def broken(job):
+        raise ValueError("unreadable image")
+
+    failed = _wait(queue, queue.submit("imaging", "scan.jpg", broken))
+    assert failed.status == FAILED
+    assert isinstance(failed.error, ValueError)
+    stats = queue.stats()
+    assert (stats["completed"], stats["failed"]) == (1, 1)
+
+
+def test_queued_job_is_cancelled_before_it_starts(queue):
+    release = threading.Event()
+    running = queue.submit("imaging", "first.jpg", _blocking(release))
+    started = []
+    queued = queue.submit("imaging", "second.jpg", lambda job: started.append(job))
+    assert queue.cancel(queued)
+    assert queue.get(queued).status == CANCELLED
+    release.set()
+    _wait(queue, running)
+    assert started == []
+    assert not queue.cancel(queued)
+
+
+def test_running_job_stops_at_its_next_update(queue):
+    release = threading.Event()
+    job_id = queue.submit("imaging", "scan.jpg", _blocking(release))
+    while queue.get(job_id).progress < 0.5:
+        time.sleep(0.005)
+    assert queue.cancel(job_id)
+    release.set()
+    job = _wait(queue, job_id)
+    assert job.status == CANCELLED
+    assert job.result is None
+
+
+def test_result_of_a_job_cancelled_during_its_last_call_is_discarded(queue):
+    release = threading.Event()
+
+    def run(job):
+        release.wait(5)
+        return "analysis"
+
+    job_id = queue.submit("imaging", "scan.jpg", run)
+    while queue.get(job_id).started is None:
+        time.sleep(0.005)
+    queue.cancel(job_id)
+    release.set()
+    job = _wait(queue, job_id)
+    assert (job.status, job.result) == (CANCELLED, None)
+
+
+def test_full_queue_rejects_jobs(queue):
+    release = threading.Event()
+    for index in range(3):
+        queue.submit("imaging", f"{index}.jpg", _blocking(release))
+    with pytest.raises(JobQueueFull):
+        queue.submit("imaging", "extra.jpg", _blocking(release))
+    assert queue.stats()["rejected"] == 1
+    release.set()
+
+
+def test_resubmitting_an_upload_cancels_its_earlier_job(queue):
+    release = threading.Event()
+    jobs = SessionJobs({}, queue)
+    upload = Upload("scan.jpg")
+    first = jobs.submit("imaging", upload, "prompt", _blocking(release))
+    second = jobs.submit("imaging", upload, "prompt", _blocking(release))
+    release.set()
+    assert _wait(queue, first).status == CANCELLED
+    assert _wait(queue, second).status == DONE
+    assert [job_id for job_id, _, _ in jobs.jobs("imaging")] == [second]
+    assert jobs.find("imaging", upload)[0] == second
+    assert jobs.jobs("pathology") == []
@@ -0,0 +1,93 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from medusa.documents import prepare_bytes
+from medusa.large_image import TILE_SIZE, LargeImage, region_box
+from medusa.preprocess import PreparedImage, open_image
+
+
+def _gradient(width, height):
+    x = np.linspace(0, 255, width, dtype=np.float32)[None, :]
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    return Image.fromarray(((x + y) / 2).astype(np.uint8)).convert("RGB")
+
+
+def test_region_box():
+    assert region_box((1000, 500), (0.1, 0.2, 0.5, 1.0)) == (100, 100, 500, 500)
+    # A region always keeps at least one pixel
+    assert region_box((1000, 500), (0.5, 0.5, 0.5, 0.5)) == (500, 250, 501, 251)
+
+
+def test_tiles_cover_the_image_and_crops_match_the_original():
+    image = _gradient(2500, 1300)
+    large = LargeImage(image.copy(), "imaging")
+    assert large.size == (2500, 1300)
+    assert len(large.tiles) == 3 * 2
+    assert max(large.overview.size) <= 2048
+    box = (TILE_SIZE - 100, TILE_SIZE - 50, TILE_SIZE + 300, TILE_SIZE + 200)
+    crop = np.asarray(large.crop(box), dtype=np.int16)
+    expected = np.asarray(image.crop(box), dtype=np.int16)
+    assert crop.shape == expected.shape
+    assert np.abs(crop - expected).mean() < 2
+
+
+def test_prepare_caches_the_overview_and_recent_regions(monkeypatch):
+    monkeypatch.setattr("medusa.large_image.PREPARED_CACHE_SIZE", 2)
+    large = LargeImage(_gradient(2500, 1300), "imaging")
+    whole = large.prepare()
+    assert whole.original_size == (2500, 1300)
+    first = large.prepare((0.0, 0.0, 0.5, 0.5))
+    large.prepare((0.5, 0.5, 1.0, 1.0))
+    assert large.prepare((0.0, 0.0, 0.5, 0.5)) is first
+    large.prepare((0.0, 0.5, 0.5, 1.0))
+    assert list(large._prepared) == [(0.0, 0.0, 0.5, 0.5), (0.0, 0.5, 0.5, 1.0)]
+    assert large.prepare() is whole
+    assert first.image.size == (1250, 650)
+
+
+def test_regions_keep_full_resolution_up_to_the_roi_limit(monkeypatch):
+    large = LargeImage(_gradient(3000, 3000), "imaging")
+    assert large.prepare((0.0, 0.0, 1.0, 1.0)).image.size == (3000, 3000)
+    monkeypatch.setattr("medusa.large_image.MAX_ROI_DIMENSION", 1000)
+    assert large.prepare((0.0, 0.0, 0.5, 0.5)).image.size == (1000, 1000)
+
+
+def test_only_images_past_the_threshold_are_tiled(monkeypatch):
+    monkeypatch.setattr("medusa.documents.LARGE_IMAGE_PIXELS", 1000 * 1000)
+    buffer = io.BytesIO()
+    _gradient(1200, 1000).save(buffer, "PNG")
+    assert isinstance(prepare_bytes(buffer.getvalue(), "imaging"), LargeImage)
+    monkeypatch.setattr("medusa.documents.LARGE_IMAGE_PIXELS", 2000 * 2000)
+    assert isinstance(prepare_bytes(buffer.getvalue(), "imaging"), PreparedImage)
+
+
+def test_decompression_bomb_limit_is_only_raised_for_one_open(monkeypatch):
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 1000)
+    buffer = io.BytesIO()
+    Image.new("L", (100, 100)).save(buffer, "PNG")
+    with pytest.raises(Image.DecompressionBombError):
+        open_image(buffer.getvalue())
+    assert open_image(buffer.getvalue(), max_pixels=20000).size == (100, 100)
+    assert Image.MAX_IMAGE_PIXELS == 1000
+
+
+def test_dicom_frames_are_decoded_on_demand():
+    pytest.importorskip("pydicom")
+    from pydicom.data import get_testdata_file
+
+    from medusa.dicom import DicomImage
+
+    with open(get_testdata_file("CT_small.dcm"), "rb") as source:
+        study = prepare_bytes(source.read(), "imaging")
+    assert isinstance(study, DicomImage)
+    assert study._frame is None
+    before = study.memory_bytes
+    bone = study.prepare(window="Bone")
+    assert bone.image.mode == "L"
+    assert study.prepare(window="Bone") is bone
+    assert study.prepare(window="Lung").fingerprint != bone.fingerprint
+    assert study.memory_bytes > before
+    assert study.describe().startswith("DICOM CT")
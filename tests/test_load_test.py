@@ -0,0 +1,23 @@
+import importlib.util
+import os
+
+BENCHMARKS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks")
+spec = importlib.util.spec_from_file_location("load_test", os.path.join(BENCHMARKS, "load_test.py"))
+load_test = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(load_test)
+
+
+def _result(p50=1.0, p99=2.0, rss=300.0, throughput=5.0, failed=0):
+    return {"p50": p50, "p99": p99, "peak_rss_mb": rss, "throughput": throughput, "failed": failed}
+
+
+def test_compare_flags_regressions_beyond_the_tolerance(capsys):
+    baseline = {"scenarios": {"imaging": _result(), "coding": _result()}}
+    results = {
+        "imaging": _result(p50=1.1, p99=2.6, throughput=3.5),
+        "coding": _result(rss=200.0, failed=1),
+        "combined": _result(p50=9.0),
+    }
+    regressions = load_test.compare(results, baseline, tolerance=0.2)
+    assert regressions == ["imaging p99 +30%", "imaging throughput -30%", "coding failed sessions 0 -> 1"]
+    assert "imaging: vs baseline" in capsys.readouterr().out
@@ -0,0 +1,67 @@
+import threading
+import uuid
+
+import pytest
+
+from medusa.metrics import MetricsRegistry, metrics, percentile, set_session, span, with_current_context
+
+
+def test_percentile_interpolates():
+    assert percentile([], 0.5) is None
+    assert percentile([1.0, 2.0, 3.0, 4.0], 0.5) == 2.5
+    assert percentile([1.0, 2.0, 3.0, 4.0], 1.0) == 4.0
+
+
+def test_summary_per_stage_and_mode():
+    registry = MetricsRegistry()
+    for seconds in (0.1, 0.2, 0.3, 0.4, 0.5):
+        registry.observe("model", "imaging", seconds)
+    registry.observe("model", "imaging", 0.6, error=True)
+    registry.observe("decode", None, 0.01)
+    rows = {(row["stage"], row["mode"]): row for row in registry.summary()}
+    assert set(rows) == {("model", "imaging"), ("decode", "none")}
+    model = rows[("model", "imaging")]
+    assert (model["count"], model["errors"]) == (6, 1)
+    assert model["p50"] == pytest.approx(0.35)
+
+
+def test_session_summary_only_counts_that_sessions_spans():
+    registry = MetricsRegistry()
+    registry.observe("model", "coding", 1.0, session="a")
+    registry.observe("model", "coding", 3.0, session="b")
+    assert [row["p50"] for row in registry.summary(session="a")] == [1.0]
+    assert [span["session"] for span in registry.recent_spans(session="b")] == ["b"]
+
+
+def test_prometheus_export():
+    registry = MetricsRegistry()
+    registry.observe("model", "imaging", 0.3)
+    registry.add("payload_bytes", 2048, mode="imaging", kind="sent")
+    registry.register_gauges("jobs", lambda: {"running": 2, "enabled": True})
+    registry.register_gauges("broken", lambda: 1 / 0)
+    text = registry.to_prometheus()
+    assert 'medusa_stage_duration_seconds_bucket{stage="model",mode="imaging",le="0.25"} 0' in text
+    assert 'medusa_stage_duration_seconds_bucket{stage="model",mode="imaging",le="0.5"} 1' in text
+    assert 'medusa_stage_duration_seconds_count{stage="model",mode="imaging"} 1' in text
+    assert 'medusa_payload_bytes_total{kind="sent",mode="imaging"} 2048' in text
+    assert "medusa_jobs_running 2" in text
+    assert "medusa_jobs_enabled" not in text
+
+
+def test_spans_carry_the_session_into_worker_threads():
+    session = uuid.uuid4().hex
+    set_session(session)
+
+    def work():
+        with span("decode", "imaging"):
+            pass
+
+    thread = threading.Thread(target=with_current_context(work))
+    thread.start()
+    thread.join()
+    with pytest.raises(ValueError):
+        with span("model", "imaging"):
+            raise ValueError("upstream failed")
+    spans = metrics.recent_spans(session=session)
+    assert [(span["stage"], span["error"]) for span in spans] == [("decode", False), ("model", True)]
+    set_session(None)
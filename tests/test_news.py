@@ -0,0 +1,68 @@
+import pytest
+
+from medusa import news
+from medusa.news import FeedCache, parse_feed
+
+FEED = b"""<?xml version="1.0"?>
+<rss version="2.0"><channel><title>Medical news</title>
+<item><title>New screening guideline</title><link>https://example.org/1</link><pubDate>Mon, 05 Oct 2026 09:00:00 GMT</pubDate></item>
+<item><title>Trial results</title><link>https://example.org/2</link></item>
+</channel></rss>"""
+
+
+class Response:
+    def __init__(self, status_code, content=b"", headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+
+class Session:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.headers = []
+
+    def get(self, url, headers=None, timeout=None):
+        self.headers.append(headers)
+        return self.responses.pop(0)
+
+
+@pytest.fixture
+def session(monkeypatch):
+    session = Session([])
+    monkeypatch.setattr(news, "get_session", lambda: session)
+    return session
+
+
+def test_parse_feed():
+    articles = parse_feed(FEED)
+    assert [article["title"] for article in articles] == ["New screening guideline", "Trial results"]
+    assert articles[1]["published"] == "No publication date"
+    with pytest.raises(ValueError):
+        parse_feed(b"<html>not a feed")
+
+
+def test_unchanged_feed_is_revalidated_with_a_conditional_get(session):
+    session.responses = [Response(200, FEED, {"ETag": '"v1"', "Last-Modified": "Mon, 05 Oct 2026 09:00:00 GMT"}), Response(304)]
+    feed = FeedCache("https://example.org/rss")
+    feed.refresh()
+    feed.refresh()
+    assert session.headers == [{}, {"If-None-Match": '"v1"', "If-Modified-Since": "Mon, 05 Oct 2026 09:00:00 GMT"}]
+    articles, meta = feed.snapshot()
+    assert len(articles) == 2
+    assert (meta["fetches"], meta["not_modified"], meta["failures"]) == (1, 1, 0)
+
+
+def test_failed_refresh_keeps_the_last_good_copy(session):
+    session.responses = [Response(200, FEED), Response(503)]
+    feed = FeedCache("https://example.org/rss")
+    feed.refresh()
+    feed.refresh()
+    articles, meta = feed.snapshot()
+    assert len(articles) == 2
+    assert meta["failures"] == 1
+    assert "503" in meta["last_error"]
@@ -0,0 +1,54 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from medusa.pathology_report import (
+    PATHOLOGY_DEFAULTS, PATHOLOGY_FONTSIZE, _text_width, extract_info_from_pages, pathology_boxes,
+    render_pathology_report, wrap_text_to_width,
+)
+
+PAGE_ONE = "Patient Name: Jane Doe\nObservation: Nodular lesion\nInferences: Benign adenoma\n"
+PAGE_TWO = "Patient Name: Jane Doe\nObservation: Clear margins\nConclusion: No further treatment\n"
+
+
+def test_pages_are_merged_without_repeating_text():
+    patient_info, observation, inferences, conclusion = extract_info_from_pages([PAGE_ONE, PAGE_TWO])
+    assert patient_info == "Patient Name: Jane Doe"
+    assert observation == "Nodular lesion\n\nClear margins"
+    assert inferences == "Benign adenoma"
+    assert conclusion == "No further treatment"
+
+
+def test_missing_sections_get_placeholders():
+    assert extract_info_from_pages(["Nothing useful"])[0] == PATHOLOGY_DEFAULTS["patient_info"]
+
+
+def test_pathology_boxes_lists_completed_sections_in_report_order():
+    boxes = pathology_boxes({"conclusion": "Benign", "observation": "Lesion"})
+    assert [text for _, text in boxes] == ["Lesion", "Benign"]
+
+
+def test_wrapping_fits_the_width_and_keeps_line_breaks():
+    text = "word " * 60 + "\nSecond paragraph"
+    lines = wrap_text_to_width(text, 200, PATHOLOGY_FONTSIZE)
+    assert lines[-1] == "Second paragraph"
+    assert len(lines) > 2
+    assert all(_text_width(line, PATHOLOGY_FONTSIZE) <= 200 for line in lines)
+
+
+@pytest.mark.parametrize("output_format, magic", [("png", b"\x89PNG"), ("pdf", b"%PDF"), ("svg", b"<?xml")])
+def test_report_formats(output_format, magic):
+    assert render_pathology_report("Jane Doe", "Lesion", "Benign", "None", output_format).startswith(magic)
+
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError):
+        render_pathology_report("Jane Doe", "Lesion", "Benign", "None", "bmp")
+
+
+def test_concurrent_renders_match_a_single_render():
+    texts = extract_info_from_pages([PAGE_ONE, PAGE_TWO])
+    expected = render_pathology_report(*texts)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(lambda _: render_pathology_report(*texts), range(8)))
+    assert all(result == expected for result in results)
@@ -0,0 +1,30 @@
+import re
+
+import pytest
+from PIL import Image
+
+from medusa.pdf_report import REPORT_FORMATS, build_imaging_report, build_study_report
+from medusa.preprocess import preprocess_image
+
+ANALYSIS = "Clear lung fields. No focal consolidation & no effusion <b>seen</b>."
+
+
+def _pages(pdf):
+    return len(re.findall(rb"/Type\s*/Page\b", pdf))
+
+
+@pytest.fixture
+def image():
+    return preprocess_image(Image.new("RGB", (400, 300), (90, 90, 90)), "imaging")
+
+
+@pytest.mark.parametrize("report_format", sorted(REPORT_FORMATS))
+def test_imaging_report_in_every_format(image, report_format):
+    pdf = build_imaging_report(image, ANALYSIS, report_format).getvalue()
+    assert pdf.startswith(b"%PDF")
+    assert _pages(pdf) == 1
+
+
+def test_study_report_has_a_page_per_image(image):
+    pdf = build_study_report([(image, ANALYSIS), (image, "Second view."), (image, "Third view.")], "Format 2").getvalue()
+    assert _pages(pdf) == 3
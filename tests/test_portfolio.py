@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from medusa.portfolio import ScoreWriter, portfolio_summary
+
+
+def _record(index, risk, status="ok"):
+    return {
+        "id": f"applicant-{index}.pdf", "path": f"/scans/applicant-{index}.pdf", "status": status,
+        "risk_percentage": risk, "sections": {"justification": "History of smoking"}, "elapsed": 0.5,
+    }
+
+
+def test_summary_statistics_and_outliers(tmp_path):
+    risks = [20.0] * 10 + [25.0] * 10 + [30.0] * 10 + [95.0, None]
+    with ScoreWriter(str(tmp_path), row_group_rows=4) as writer:
+        for index, risk in enumerate(risks):
+            writer.add(_record(index, risk))
+        writer.add(_record(99, 50.0, status="error"))
+    summary = portfolio_summary(str(tmp_path))
+    assert (summary["applicants"], summary["scored"], summary["unscored"]) == (32, 31, 1)
+    assert summary["min"] == 20.0 and summary["max"] == 95.0
+    assert summary["percentiles"]["p50"] == 25.0
+    assert sum(bucket["count"] for bucket in summary["distribution"]) == 31
+    assert summary["distribution"][9] == {"range": "90-100%", "count": 1}
+    assert summary["outlier_count"] == 1
+    assert summary["outliers"] == [{"id": "applicant-30.pdf", "risk_percentage": 95.0}]
+
+
+def test_outliers_are_limited_to_the_most_extreme(tmp_path):
+    with ScoreWriter(str(tmp_path)) as writer:
+        for index in range(40):
+            writer.add(_record(index, 50.0))
+        for index, risk in enumerate((0.0, 100.0, 99.0, 1.0), start=40):
+            writer.add(_record(index, risk))
+    summary = portfolio_summary(str(tmp_path), outlier_limit=2)
+    assert summary["outlier_count"] == 4
+    assert sorted(outlier["risk_percentage"] for outlier in summary["outliers"]) == [0.0, 100.0]
+
+
+def test_reruns_skip_applicants_already_scored(tmp_path):
+    scores = str(tmp_path / "scores")
+    results = tmp_path / "results.jsonl"
+    results.write_text("".join(json.dumps(_record(index, 10.0 * index)) + "\n" for index in range(5)) + '{"id": "trunc')
+    with ScoreWriter(scores) as writer:
+        writer.add(_record(0, 0.0))
+    with ScoreWriter(scores) as writer:
+        writer.backfill(str(results))
+    assert portfolio_summary(scores)["applicants"] == 5
+
+
+def test_unfinished_part_files_are_dropped(tmp_path):
+    (tmp_path / "part-crashed.parquet").write_bytes(b"PAR1 without a footer")
+    writer = ScoreWriter(str(tmp_path))
+    writer.close()
+    assert not (tmp_path / "part-crashed.parquet").exists()
+    assert portfolio_summary(str(tmp_path)) == {"applicants": 0, "scored": 0, "unscored": 0}
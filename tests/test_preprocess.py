@@ -0,0 +1,55 @@
+import io
+
+from PIL import Image
+
+from medusa.preprocess import format_bytes, preprocess_bytes, preprocess_image
+
+
+def _encoded(image, format, **kwargs):
+    buffer = io.BytesIO()
+    image.save(buffer, format, **kwargs)
+    return buffer.getvalue()
+
+
+def test_imaging_keeps_colour_and_caps_the_size():
+    prepared = preprocess_bytes(_encoded(Image.new("RGB", (5000, 2500), (200, 30, 30)), "PNG"), "imaging")
+    assert prepared.image.mode == "RGB"
+    assert prepared.image.size == (2048, 1024)
+    assert prepared.original_size == (5000, 2500)
+    assert prepared.mime_type == "image/jpeg"
+    assert prepared.blob == {"mime_type": "image/jpeg", "data": prepared.data}
+
+
+def test_document_modes_send_smaller_grayscale_images():
+    prepared = preprocess_bytes(_encoded(Image.new("RGB", (3200, 3200), "white"), "JPEG"), "transcription")
+    assert prepared.image.mode == "L"
+    assert max(prepared.image.size) == 1600
+
+
+def test_exif_orientation_is_applied_and_metadata_dropped():
+    image = Image.new("RGB", (400, 200), "white")
+    exif = image.getexif()
+    exif[0x0112] = 6  # rotated 90° clockwise
+    exif[0x010F] = "Scanner Co"
+    prepared = preprocess_bytes(_encoded(image, "JPEG", exif=exif), "imaging")
+    assert prepared.image.size == (200, 400)
+    assert not Image.open(io.BytesIO(prepared.data)).getexif()
+
+
+def test_transparency_is_flattened_onto_white():
+    prepared = preprocess_image(Image.new("RGBA", (50, 50), (0, 0, 0, 0)), "imaging")
+    assert prepared.image.mode == "RGB"
+    assert prepared.image.getpixel((25, 25)) == (255, 255, 255)
+
+
+def test_fingerprint_is_stable_across_encodings_of_the_same_pixels():
+    image = Image.new("RGB", (300, 300), (10, 120, 200))
+    first = preprocess_bytes(_encoded(image, "PNG"), "imaging")
+    second = preprocess_bytes(_encoded(image, "BMP"), "imaging")
+    assert first.fingerprint == second.fingerprint
+
+
+def test_format_bytes():
+    assert format_bytes(512) == "512 B"
+    assert format_bytes(1536) == "1.5 KB"
+    assert format_bytes(5 * 1024 * 1024) == "5.0 MB"
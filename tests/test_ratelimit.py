@@ -0,0 +1,80 @@
+import threading
+import time
+
+from medusa.ratelimit import RatioBudget, TokenBucket
+
+
+def test_bucket_starts_full_and_reports_wait():
+    bucket = TokenBucket(60, capacity=2)
+    assert bucket.try_acquire() == 0.0
+    assert bucket.try_acquire() == 0.0
+    # One token per second: the third call has to wait about a second
+    assert 0.9 < bucket.try_acquire() <= 1.0
+
+
+def test_bucket_allows_oversized_requests_once_full():
+    bucket = TokenBucket(600, capacity=5)
+    assert bucket.try_acquire(50) == 0.0
+    assert bucket.try_acquire(1) > 0
+
+
+def test_refund_is_capped_at_capacity():
+    bucket = TokenBucket(60, capacity=1)
+    assert bucket.try_acquire() == 0.0
+    bucket.refund()
+    bucket.refund()
+    assert bucket.try_acquire() == 0.0
+    assert bucket.try_acquire() > 0
+
+
+def test_acquire_blocks_until_refilled():
+    bucket = TokenBucket(600, capacity=1)
+    bucket.acquire()
+    started = time.monotonic()
+    waited = bucket.acquire()
+    assert waited > 0
+    assert time.monotonic() - started >= 0.09
+
+
+def test_bucket_is_thread_safe():
+    bucket = TokenBucket(60, capacity=50)
+    granted = []
+
+    def take():
+        for _ in range(20):
+            if bucket.try_acquire() == 0.0:
+                granted.append(1)
+
+    threads = [threading.Thread(target=take) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # 50 tokens up front plus at most a few refilled while the threads ran
+    assert 50 <= len(granted) <= 52
+
+
+def test_ratio_budget_earns_a_share_of_deposits():
+    budget = RatioBudget(0.25, capacity=2)
+    assert budget.try_spend()
+    assert budget.try_spend()
+    assert not budget.try_spend()
+    for _ in range(3):
+        budget.deposit()
+    assert not budget.try_spend()
+    budget.deposit()
+    assert budget.try_spend()
+
+
+def test_ratio_budget_is_capped():
+    budget = RatioBudget(1.0, capacity=3)
+    for _ in range(10):
+        budget.deposit()
+    assert budget.available == 3
+
+
+def test_zero_ratio_budget_never_spends():
+    budget = RatioBudget(0.0)
+    budget.deposit()
+    assert budget.available == 0
+    assert not budget.try_spend()
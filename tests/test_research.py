@@ -0,0 +1,63 @@
+import pytest
+
+from medusa import research
+from medusa.cache import MemoryTier
+
+RESULTS_HTML = """
+<div data-lid="1"><h3 class="gs_rt"><a href="https://example.org/a">Deep learning for <b>chest</b> X-rays</a></h3></div>
+<div data-lid="2"><h3 class="gs_rt">[CITATION] Radiology handbook</h3></div>
+<div data-lid="3"><div class="gs_ri">No title here</div></div>
+"""
+
+
+class Response:
+    def __init__(self, content, status_code=200):
+        self.content = content
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+
+class Session:
+    def __init__(self, response):
+        self.response = response
+        self.requests = []
+
+    def get(self, url, params=None, timeout=None):
+        self.requests.append((url, params, timeout))
+        return self.response
+
+
+@pytest.fixture
+def session(monkeypatch):
+    session = Session(Response(RESULTS_HTML))
+    monkeypatch.setattr(research, "get_session", lambda: session)
+    monkeypatch.setattr(research, "_paper_cache", MemoryTier())
+    return session
+
+
+def test_parse_papers_keeps_results_without_links():
+    assert research.parse_papers(RESULTS_HTML) == [
+        {"title": "Deep learning for chest X-rays", "link": "https://example.org/a"},
+        {"title": "[CITATION] Radiology handbook", "link": None},
+    ]
+
+
+def test_searches_are_cached_by_normalized_query(session):
+    first = research.search_research_papers("Chest  X-ray")
+    assert research.search_research_papers("chest x-ray ") == first
+    assert len(session.requests) == 1
+    url, params, timeout = session.requests[0]
+    assert params == {"q": "Chest  X-ray"}
+    assert timeout == (research.CONNECT_TIMEOUT, research.READ_TIMEOUT)
+
+
+def test_blank_queries_and_failures(session):
+    assert research.search_research_papers("   ") == []
+    session.response = Response(b"", status_code=429)
+    with pytest.raises(RuntimeError):
+        research.search_research_papers("chest x-ray")
+    session.response = Response(RESULTS_HTML)
+    assert len(research.search_research_papers("chest x-ray")) == 2
@@ -0,0 +1,61 @@
+from medusa.sections import SectionParser, parse_sections, risk_percentage, watch_sections
+
+PATHOLOGY_RESPONSE = """Here is the report.
+
+## **Patient Name:** Jane Doe
+Age: 54
+
+**Observation:**
+- Nodular lesion, 2 cm
+
+
+- Clear margins
+
+3. **Inferences:** Consistent with a benign adenoma
+Conclusion: No further treatment required
+"""
+
+
+def test_parse_sections_strips_markdown_and_keeps_field_headings():
+    sections = parse_sections(PATHOLOGY_RESPONSE, "pathology")
+    assert sections == {
+        "patient_info": "Patient Name: Jane Doe\nAge: 54",
+        "observation": "Nodular lesion, 2 cm\n\nClear margins",
+        "inferences": "Consistent with a benign adenoma",
+        "conclusion": "No further treatment required",
+    }
+
+
+def test_sections_close_as_soon_as_the_next_heading_arrives():
+    parser = SectionParser("treatment")
+    assert parser.feed("Treatment Plan:\nRest and flu") == []
+    # Only complete lines are parsed
+    assert parser.current() == ("treatment_plan", "")
+    assert parser.feed("ids\nDiet ") == []
+    assert parser.feed("Plan: Light meals\n") == [("treatment_plan", "Rest and fluids")]
+    assert parser.close() == [("diet_plan", "Light meals")]
+    assert parser.current() is None
+
+
+def test_results_do_not_depend_on_chunk_boundaries():
+    whole = parse_sections(PATHOLOGY_RESPONSE, "pathology")
+    for size in (1, 3, 17):
+        chunks = [PATHOLOGY_RESPONSE[start:start + size] for start in range(0, len(PATHOLOGY_RESPONSE), size)]
+        seen = {}
+        streamed = list(watch_sections(chunks, "pathology", lambda key, text: seen.setdefault(key, text)))
+        assert "".join(streamed) == PATHOLOGY_RESPONSE
+        assert seen == whole
+
+
+def test_repeated_heading_keeps_the_first_section():
+    text = "Risk Percentage: 40%\nJustification: Smoker\nRisk Percentage: 90%\n"
+    sections = parse_sections(text, "insurance")
+    assert sections["risk_percentage"] == "40%"
+    assert sections["justification"] == "Smoker\nRisk Percentage: 90%"
+
+
+def test_risk_percentage():
+    assert risk_percentage("Estimated at 37.5 % given history") == 37.5
+    assert risk_percentage("Around 20 out of 100") == 20.0
+    assert risk_percentage("Unknown") is None
+    assert risk_percentage(None) is None
@@ -0,0 +1,86 @@
+import io
+
+from PIL import Image
+
+from medusa.large_image import LargeImage
+from medusa.session import SessionResults
+
+
+class Upload(io.BytesIO):
+    def __init__(self, name, image, format="JPEG"):
+        buffer = io.BytesIO()
+        image.save(buffer, format)
+        super().__init__(buffer.getvalue())
+        self.name = name
+        self.file_id = name
+        self.size = len(buffer.getvalue())
+
+
+def _upload(name, size=(600, 400)):
+    return Upload(name, Image.new("RGB", size, (120, 80, 40)))
+
+
+def test_uploads_are_decoded_once_per_mode():
+    results = SessionResults({})
+    upload = _upload("scan.jpg")
+    image = results.image(upload, "imaging")
+    assert results.image(upload, "imaging") is image
+    assert results.image(upload, "transcription") is not image
+
+
+def test_results_for_older_prompts_are_replaced():
+    results = SessionResults({})
+    upload = _upload("scan.jpg")
+    results.store_result(upload, "imaging", "Describe", analysis="first", reports={"pdf": b"1"})
+    results.store_result(upload, "imaging", "Describe ", reports={"png": b"2"})
+    entry = results.result(upload, "imaging", "Describe")
+    assert entry["analysis"] == "first"
+    assert set(entry["reports"]) == {"pdf", "png"}
+    results.store_result(upload, "imaging", "Summarize", analysis="second")
+    assert results.result(upload, "imaging", "Describe") is None
+
+
+def test_retain_drops_entries_of_removed_uploads():
+    results = SessionResults({})
+    kept, removed = _upload("kept.jpg"), _upload("removed.jpg")
+    for upload in (kept, removed):
+        results.image(upload, "imaging")
+        results.store_result(upload, "imaging", "Describe", analysis="text")
+    results.image(removed, "coding")
+    results.retain("imaging", [kept])
+    assert results.result(removed, "imaging", "Describe") is None
+    assert results.result(kept, "imaging", "Describe") is not None
+    assert len(results._entries) == 3
+
+
+def test_least_recently_used_entries_are_evicted():
+    # Each 600×400 preview holds about 0.7 MB
+    results = SessionResults({}, max_bytes=2 * 1024 * 1024)
+    uploads = [_upload(f"{index}.jpg") for index in range(3)]
+    first = results.image(uploads[0], "imaging")
+    results.image(uploads[1], "imaging")
+    results.image(uploads[0], "imaging")
+    results.image(uploads[2], "imaging")
+    assert results.image(uploads[0], "imaging") is first
+    assert results.total_bytes() <= results.max_bytes
+    assert len(results._entries) == 2
+
+
+def test_caches_filled_after_storing_are_counted():
+    results = SessionResults({}, max_bytes=1024 ** 3)
+    large = results.image(_upload("large.jpg", (4200, 4200)), "imaging")
+    assert isinstance(large, LargeImage)
+    before = results.total_bytes()
+    large.prepare((0.0, 0.0, 0.5, 0.5))
+    assert results.total_bytes() > before
+
+
+def test_growth_after_storing_triggers_eviction_on_next_access():
+    results = SessionResults({}, max_bytes=1024 ** 3)
+    results.image(_upload("small.jpg"), "imaging")
+    upload = _upload("large.jpg", (4200, 4200))
+    large = results.image(upload, "imaging")
+    results.max_bytes = results.total_bytes() + 1024
+    large.prepare((0.0, 0.0, 0.5, 0.5))
+    assert results.image(upload, "imaging") is large
+    assert len(results._entries) == 1
@@ -0,0 +1,78 @@
+import io
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+from medusa.cache import image_fingerprint
+from medusa.similar import PerceptualIndex, image_signature, perceptual_hash
+
+
+def _scan(seed):
+    pixels = np.random.default_rng(seed).integers(0, 256, (96, 96), dtype=np.uint8)
+    return Image.fromarray(pixels).resize((512, 512), Image.Resampling.BICUBIC).filter(ImageFilter.GaussianBlur(4))
+
+
+def _reencoded(image, size=(400, 400), quality=70):
+    buffer = io.BytesIO()
+    image.resize(size).save(buffer, "JPEG", quality=quality)
+    return Image.open(buffer)
+
+
+def _add(index, owner, image):
+    index.add(owner, image_fingerprint(image), perceptual_hash(image), image_signature(image))
+
+
+def _find(index, owner, image, **kwargs):
+    return index.find(owner, perceptual_hash(image), image_signature(image), max_distance=6, **kwargs)
+
+
+def test_blank_images_have_no_hash():
+    assert perceptual_hash(Image.new("L", (200, 200), 255)) is None
+    assert len(image_signature(_scan(1))) == 128
+
+
+def test_reencoded_copy_matches_only_for_its_owner():
+    index = PerceptualIndex()
+    original = _scan(1)
+    _add(index, "session-a", original)
+    _add(index, "session-a", _scan(2))
+    matches = _find(index, "session-a", _reencoded(original))
+    assert [fingerprint for fingerprint, _ in matches] == [image_fingerprint(original)]
+    assert matches[0][1] >= 0.97
+    assert _find(index, "session-b", _reencoded(original)) == []
+    assert _find(index, "session-a", _scan(3)) == []
+
+
+def test_exclude_skips_the_image_itself():
+    index = PerceptualIndex()
+    original = _scan(1)
+    _add(index, "session-a", original)
+    _add(index, "session-a", original)
+    assert len(index) == 1
+    assert _find(index, "session-a", original, exclude=image_fingerprint(original)) == []
+
+
+def test_signature_must_confirm_the_hash_match():
+    index = PerceptualIndex()
+    original = _scan(1)
+    _add(index, "session-a", original)
+    assert _find(index, "session-a", _reencoded(original), min_confirm=1.01) == []
+
+
+def test_oldest_entries_are_trimmed():
+    index = PerceptualIndex(max_entries=2)
+    scans = [_scan(seed) for seed in range(3)]
+    for scan in scans:
+        _add(index, "session-a", scan)
+    assert len(index) == 2
+    assert _find(index, "session-a", scans[0]) == []
+    assert _find(index, "session-a", scans[2])
+
+
+def test_clear_forgets_every_owner():
+    index = PerceptualIndex()
+    original = _scan(1)
+    _add(index, "session-a", original)
+    index.clear()
+    assert _find(index, "session-a", original) == []
+    assert len(index) == 0
@@ -0,0 +1,47 @@
+import pytest
+from PIL import Image
+
+from medusa.analysis import stream_analysis
+from medusa.backends import BackendError, FakeBackend
+from medusa.cache import MemoryTier, ResultCache
+from medusa.preprocess import preprocess_image
+from medusa.prompts import DEFAULT_PROMPTS
+
+
+class FailingStream(FakeBackend):
+    def stream(self, prompt, blob):
+        yield "Partial answer "
+        raise BackendError("connection reset", retryable=True)
+
+
+@pytest.fixture
+def image():
+    return preprocess_image(Image.new("RGB", (64, 64), "white"), "imaging")
+
+
+def test_completed_stream_is_cached_and_replayed_in_one_chunk(image):
+    backend = FakeBackend(latency=0, tokens_per_second=0)
+    cache = ResultCache(MemoryTier())
+    chunks = list(stream_analysis(backend, cache, image, DEFAULT_PROMPTS["imaging"]))
+    assert len(chunks) > 1
+    assert list(stream_analysis(backend, cache, image, DEFAULT_PROMPTS["imaging"])) == ["".join(chunks)]
+    assert backend.calls == 1
+
+
+def test_bypass_streams_again(image):
+    backend = FakeBackend(latency=0, tokens_per_second=0)
+    cache = ResultCache(MemoryTier())
+    list(stream_analysis(backend, cache, image, DEFAULT_PROMPTS["imaging"]))
+    list(stream_analysis(backend, cache, image, DEFAULT_PROMPTS["imaging"], bypass_cache=True))
+    assert backend.calls == 2
+    assert cache.stats()["bypasses"] == 1
+
+
+def test_failed_stream_is_not_cached(image):
+    cache = ResultCache(MemoryTier())
+    chunks = []
+    with pytest.raises(BackendError):
+        for chunk in stream_analysis(FailingStream(), cache, image, DEFAULT_PROMPTS["imaging"]):
+            chunks.append(chunk)
+    assert chunks == ["Partial answer "]
+    assert cache.stats()["stores"] == 0
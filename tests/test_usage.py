@@ -0,0 +1,105 @@
+import contextvars
+import uuid
+from types import SimpleNamespace
+
+from PIL import Image
+
+from medusa.analysis import run_analysis, stream_analysis
+from medusa.backends import GENERATION_PROFILES, FakeBackend, GeminiBackend, estimate_tokens, set_model_request
+from medusa.cache import MemoryTier, ResultCache
+from medusa.metrics import MetricsRegistry, metrics, set_session
+from medusa.preprocess import preprocess_image
+from medusa.prompts import DEFAULT_PROMPTS
+
+
+def _in_session(fn):
+    session = uuid.uuid4().hex
+
+    def run():
+        set_session(session)
+        return fn()
+
+    contextvars.copy_context().run(run)
+    return metrics.usage(session=session)
+
+
+def _truncated(mode):
+    return sum(value for (name, labels), value in metrics.counters().items() if name == "model_truncated" and dict(labels)["mode"] == mode)
+
+
+def test_streams_record_the_backends_usage_and_truncation(monkeypatch):
+    monkeypatch.setitem(GENERATION_PROFILES, "treatment", {"max_output_tokens": 20})
+    backend = FakeBackend(latency=0, tokens_per_second=0)
+    image = preprocess_image(Image.new("RGB", (64, 64), "white"), "treatment")
+    truncated_before = _truncated("treatment")
+    chunks = []
+    usage = _in_session(lambda: chunks.extend(stream_analysis(backend, ResultCache(MemoryTier()), image, DEFAULT_PROMPTS["treatment"])))
+    assert estimate_tokens("".join(chunks)) == 20
+    assert [(row["mode"], row["requests"], row["output_tokens"]) for row in usage] == [("treatment", 1, 20)]
+    assert _truncated("treatment") == truncated_before + 1
+
+
+def test_cached_answers_are_not_counted():
+    backend = FakeBackend(latency=0, tokens_per_second=0)
+    cache = ResultCache(MemoryTier())
+    image = preprocess_image(Image.new("RGB", (64, 64), "white"), "coding")
+
+    def twice():
+        run_analysis(backend, cache, image, DEFAULT_PROMPTS["coding"])
+        run_analysis(backend, cache, image, DEFAULT_PROMPTS["coding"])
+
+    usage = _in_session(twice)
+    assert [(row["mode"], row["requests"]) for row in usage] == [("coding", 1)]
+    assert backend.calls == 1
+
+
+def test_truncated_answers_are_not_cached(monkeypatch):
+    monkeypatch.setitem(GENERATION_PROFILES, "treatment", {"max_output_tokens": 20})
+    backend = FakeBackend(latency=0, tokens_per_second=0)
+    cache = ResultCache(MemoryTier())
+    image = preprocess_image(Image.new("RGB", (64, 64), "white"), "treatment")
+    run_analysis(backend, cache, image, DEFAULT_PROMPTS["treatment"])
+    list(stream_analysis(backend, cache, image, DEFAULT_PROMPTS["treatment"]))
+    assert backend.calls == 2
+    assert cache.stats()["stores"] == 0
+
+
+def test_changing_a_generation_profile_misses_the_cache(monkeypatch):
+    backend = FakeBackend(latency=0, tokens_per_second=0)
+    cache = ResultCache(MemoryTier())
+    image = preprocess_image(Image.new("RGB", (64, 64), "white"), "coding")
+    run_analysis(backend, cache, image, DEFAULT_PROMPTS["coding"])
+    monkeypatch.setitem(GENERATION_PROFILES, "coding", {"max_output_tokens": 256, "temperature": 0.0})
+    run_analysis(backend, cache, image, DEFAULT_PROMPTS["coding"])
+    assert backend.calls == 2
+
+
+def test_usage_keeps_only_the_most_recent_sessions():
+    registry = MetricsRegistry(usage_sessions=2)
+    for session in ("a", "b", "a", "c"):
+        registry.record_usage("imaging", 100, 10, session=session)
+    assert registry.usage(session="b") == []
+    assert registry.usage(session="a")[0]["requests"] == 2
+    assert registry.usage() == [{"mode": "imaging", "requests": 4, "input_tokens": 400, "output_tokens": 40}]
+
+
+def _chunk(text, usage=None, finish_reason="STOP"):
+    candidate = SimpleNamespace(finish_reason=SimpleNamespace(name=finish_reason))
+    return SimpleNamespace(text=text, parts=[text] if text else [], usage_metadata=usage, candidates=[candidate])
+
+
+def test_gemini_streams_read_usage_from_the_last_chunk():
+    chunks = [
+        _chunk("Continue metformin "),
+        _chunk("and walk daily", SimpleNamespace(prompt_token_count=900, candidates_token_count=64), "MAX_TOKENS"),
+    ]
+    backend = object.__new__(GeminiBackend)
+    backend._model = SimpleNamespace(generate_content=lambda *args, **kwargs: iter(chunks))
+
+    def stream():
+        request = set_model_request("treatment")
+        assert "".join(backend.stream("Plan", None)) == "Continue metformin and walk daily"
+        return request.usage
+
+    usage = contextvars.copy_context().run(stream)
+    assert (usage.input_tokens, usage.output_tokens, usage.truncated) == (900, 64, True)